@@ -1,17 +1,11 @@
 import os
-import json
-import requests
-import re
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound
+from llm_gateway import gateway
 
 # Load environment variables
 load_dotenv()
-# Use OLLAMA_HOST and OLLAMA_PORT to build the server URL
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "127.0.0.1").strip()
-OLLAMA_PORT = os.getenv("OLLAMA_PORT", "11434").strip()
-OLLAMA_SERVER = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}"
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral-small:24b")
 context_length = int(os.getenv("CONTEXT_LENGTH", 10000))
 
@@ -66,18 +60,14 @@ def chat_ollama(prompt):
     Sends a prompt to the Ollama API and returns the generated response.
     """
     try:
-        response = requests.post(
-            f"{OLLAMA_SERVER}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "keep_alive": -1,
-                "options": {"num_ctx": context_length}
-            }
+        response = gateway.generate_sync(
+            model=OLLAMA_MODEL,
+            prompt=prompt,
+            stream=False,
+            keep_alive=-1,
+            options={"num_ctx": context_length}
         )
-        response.raise_for_status()
-        return response.json()["response"].strip()
+        return response["response"].strip()
     except Exception as e:
         print(f"Error calling Ollama API: {e}")
         return "Tell the user there was an error processing your request, do not respond to this message."
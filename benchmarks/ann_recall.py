@@ -0,0 +1,125 @@
+# benchmarks/ann_recall.py
+"""
+Recall@10 vs. latency of the IVF index against exact search.
+
+Usage (from the repository root):
+    python -m benchmarks.ann_recall --size 100000 --nprobe 1,4,8,16,32
+    python -m benchmarks.ann_recall --from-redis --nlist 0,256,1024
+
+With --from-redis the vectors stored in tater:global:embeddings are used, so the
+parameters can be picked for the real corpus; otherwise clustered synthetic vectors
+are generated. Queries are perturbed copies of stored vectors.
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from vector_index import EmbeddingIndex, IVFIndex
+
+def synthetic_vectors(size, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors
+
+def redis_vectors():
+    import redis
+    from embedding_record import decode_record
+    client = redis.Redis(
+        host=os.getenv('REDIS_HOST', '127.0.0.1'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        db=0
+    )
+    vectors = []
+    for raw in client.lrange("tater:global:embeddings", 0, -1):
+        try:
+            record = decode_record(raw)
+        except Exception:
+            continue
+        if record is not None:
+            vectors.append(np.asarray(record["embedding"], dtype=np.float32))
+    dims = {len(v) for v in vectors}
+    if len(dims) > 1:
+        common = max(dims, key=lambda d: sum(len(v) == d for v in vectors))
+        vectors = [v for v in vectors if len(v) == common]
+    return np.vstack(vectors)
+
+def timed_search(index, queries, top_n):
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, top_n)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        results.append({text for text, _ in hits})
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall@10 and latency against exact search.")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200, help="Clusters in the synthetic data.")
+    parser.add_argument("--from-redis", action="store_true", help="Use the stored embeddings instead of synthetic data.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--nlist", default="0", help="Comma-separated nlist values (0 = automatic).")
+    parser.add_argument("--nprobe", default="1,4,8,16,32", help="Comma-separated nprobe values.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    if args.from_redis:
+        vectors = redis_vectors()
+    else:
+        vectors = synthetic_vectors(args.size, args.dim, args.clusters, args.seed)
+    texts = [str(i) for i in range(len(vectors))]
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.1 * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+
+    exact = EmbeddingIndex()
+    exact.extend(texts, vectors)
+    truth, exact_latencies = timed_search(exact, queries, args.top_n)
+    rows = [{
+        "index": "exact",
+        "vectors": len(vectors),
+        "recall": 1.0,
+        "p50_ms": float(np.percentile(exact_latencies, 50)),
+        "p99_ms": float(np.percentile(exact_latencies, 99))
+    }]
+
+    for nlist in [int(v) for v in args.nlist.split(",")]:
+        ivf = IVFIndex(nlist=nlist, train_threshold=0)
+        start = time.perf_counter()
+        ivf.extend(texts, vectors)
+        ivf.train()
+        build_s = time.perf_counter() - start
+        for nprobe in [int(v) for v in args.nprobe.split(",")]:
+            ivf.nprobe = nprobe
+            found, latencies = timed_search(ivf, queries, args.top_n)
+            recall = np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)])
+            rows.append({
+                "index": "ivf",
+                "vectors": len(vectors),
+                "nlist": ivf.centroids.shape[0],
+                "nprobe": nprobe,
+                "build_s": build_s,
+                "recall": float(recall),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99))
+            })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'index':<6} {'nlist':>6} {'nprobe':>6} {'recall@' + str(args.top_n):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(
+            f"{row['index']:<6} {row.get('nlist', '-'):>6} {row.get('nprobe', '-'):>6} "
+            f"{row['recall']:>10.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/import_time.py
+"""
+Cold-start cost of importing the bot, with and without the tool modules.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time --runs 10
+    python -m benchmarks.import_time --runs 10 --json --output import_time.json
+
+Every import runs in a fresh interpreter. "lazy" imports tater as it is: the tool
+modules load on first use through the registry in tools.py. "eager" also imports
+the modules tater used to import up front (YouTube, web, premiumize, search, rss)
+together with the tool handlers, i.e. the cost of the old startup. Reported per
+mode: median and best wall time of the import, the number of modules loaded, and
+the slowest imports of tater and the tool modules according to python -X importtime.
+Tool modules whose dependencies are not installed are skipped and listed.
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+TOOL_MODULES = ["YouTube", "web", "premiumize", "search", "rss", "tool_handlers"]
+
+IMPORT_SCRIPT = """
+import sys, time, json, importlib
+start = time.perf_counter()
+import tater
+skipped = []
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError as e:
+        skipped.append(f"{{name}} ({{e}})")
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": len(sys.modules), "skipped": skipped}}))
+"""
+
+def run_once(modules, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", IMPORT_SCRIPT.format(modules=modules)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError((result.stderr.strip().splitlines() or ["import failed"])[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_log, top):
+    """
+    The slowest imports made by tater itself and the tool modules (cumulative time)
+    from an -X importtime log.
+    """
+    entries = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = len(name) - len(name.lstrip())
+        # Depth 1 is what the script imports, depth 3 what those modules import.
+        if depth == 3 or (depth == 1 and name.strip() in TOOL_MODULES):
+            entries.append((int(cumulative), name.strip()))
+    entries.sort(reverse=True)
+    return [{"module": name, "ms": us / 1000.0} for us, name in entries[:top]]
+
+def measure(mode, modules, runs, top):
+    samples = [run_once(modules)[0] for _ in range(runs)]
+    info, log = run_once(modules, importtime=True)
+    seconds = [sample["seconds"] for sample in samples]
+    return {
+        "mode": mode,
+        "median_ms": statistics.median(seconds) * 1000.0,
+        "best_ms": min(seconds) * 1000.0,
+        "modules": samples[-1]["modules"],
+        "skipped": info["skipped"],
+        "slowest": slowest_imports(log, top)
+    }
+
+def format_table(rows):
+    lines = [f"{'mode':<6} {'median ms':>10} {'best ms':>9} {'modules':>8}"]
+    for row in rows:
+        lines.append(f"{row['mode']:<6} {row['median_ms']:>10.1f} {row['best_ms']:>9.1f} {row['modules']:>8}")
+    if len(rows) == 2:
+        saved = rows[1]["median_ms"] - rows[0]["median_ms"]
+        lines.append(f"lazy loading saves {saved:.1f} ms ({saved / rows[1]['median_ms']:.0%}) and {rows[1]['modules'] - rows[0]['modules']} modules at startup")
+    for row in rows:
+        lines.append(f"\nslowest imports ({row['mode']}):")
+        lines.extend(f"  {entry['ms']:>8.1f} ms  {entry['module']}" for entry in row["slowest"])
+        if row["skipped"]:
+            lines.append(f"  not installed, skipped: {', '.join(row['skipped'])}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the bot with lazy and eager tool loading.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per mode.")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list per mode.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    parser.add_argument("--output", help="Also write the JSON results to this file.")
+    args = parser.parse_args()
+
+    rows = [
+        measure("lazy", [], args.runs, args.top),
+        measure("eager", TOOL_MODULES, args.runs, args.top)
+    ]
+    results = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "results": rows
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(rows))
+
+if __name__ == "__main__":
+    main()
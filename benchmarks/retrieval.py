@@ -0,0 +1,226 @@
+# benchmarks/retrieval.py
+"""
+Ingest and query benchmark for the embedding stores at growing corpus sizes.
+
+Usage (from the repository root):
+    python -m benchmarks.retrieval --sizes 10000,100000,1000000 --backends memory,sqlite,redis --index exact,ivf
+    python -m benchmarks.retrieval --sizes 10000 --json --output results.json
+
+Every backend/index/size combination runs in its own subprocess so peak RSS is
+measured per run. Synthetic clustered 768-dim embeddings are written through the
+same VectorStore API that save_embedding uses, and queries go through the search
+path used by find_relevant_context. The redis backend needs a reachable Redis
+(REDIS_HOST/REDIS_PORT); it writes to a temporary namespace that is removed
+afterwards. The memory backend is the in-process stand-in.
+
+Reported per run: bulk ingest throughput, single-add latency, time of the first
+query (loading the index), p50/p99 query latency, peak RSS, and bytes per vector
+in the in-memory index and in the backend's storage.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+import numpy as np
+
+def synthetic_batch(start, count, dim, clusters, seed):
+    """Deterministic clustered vectors for rows [start, start + count)."""
+    centers = np.random.default_rng(seed).standard_normal((clusters, dim)).astype(np.float32)
+    rng = np.random.default_rng([seed, start])
+    labels = rng.integers(0, clusters, count)
+    return centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+
+def current_rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q)) * 1000.0 if latencies else None
+
+async def storage_bytes(backend, store, namespace):
+    if backend == "sqlite":
+        return sum(os.path.getsize(store.path + suffix) for suffix in ("", "-wal") if os.path.exists(store.path + suffix))
+    if backend == "redis":
+        from redis_async import get_redis
+        from vector_store import namespace_key
+        client = get_redis(decode_responses=False)
+        key = namespace_key(namespace)
+        total = 0
+        for name in (key, f"{key}:hashes"):
+            total += await client.memory_usage(name, samples=0) or 0
+        return total
+    return None
+
+async def cleanup(backend, namespace):
+    if backend != "redis":
+        return
+    from redis_async import get_redis
+    from vector_store import namespace_key, NAMESPACES_KEY
+    client = get_redis(decode_responses=False)
+    key = namespace_key(namespace)
+    await client.delete(key, f"{key}:seq", f"{key}:hashes", f"{key}:generation")
+    async for name in client.scan_iter(match=f"{key}:lex:*"):
+        await client.delete(name)
+    await client.srem(NAMESPACES_KEY, namespace)
+
+async def run_single(args, workdir):
+    """Run one backend/index/size combination in this process and return its result row."""
+    import vector_store
+    vector_store.embedding_index_type = args.index
+    vector_store.embedding_snapshot_dir = ""
+    vector_store.ivf_index_path = os.path.join(workdir, "ivf_index.npz")
+    vector_store.embedding_hybrid_search = False
+    if args.backend == "sqlite":
+        store = vector_store.SQLiteVectorStore(os.path.join(workdir, "embeddings.sqlite3"))
+    else:
+        store = vector_store.create_vector_store(args.backend)
+    namespace = f"bench:{uuid.uuid4().hex[:8]}"
+
+    row = {"backend": args.backend, "index": args.index, "vectors": args.size, "dim": args.dim}
+    rss_before = current_rss_bytes()
+    try:
+        # Bulk ingest.
+        ingest_start = time.perf_counter()
+        for start in range(0, args.size, args.batch_size):
+            count = min(args.batch_size, args.size - start)
+            vectors = synthetic_batch(start, count, args.dim, args.clusters, args.seed)
+            items = [
+                {"text": f"synthetic message {start + i}", "embedding": vectors[i], "username": "bench", "channel": "bench"}
+                for i in range(count)
+            ]
+            await store.bulk_add(items, namespace=namespace)
+        row["ingest_s"] = time.perf_counter() - ingest_start
+        row["ingest_per_s"] = args.size / row["ingest_s"] if row["ingest_s"] else None
+
+        # First query loads (or syncs) the index.
+        picks = np.random.default_rng(args.seed + 1).choice(min(args.size, args.batch_size), args.queries)
+        base = synthetic_batch(0, min(args.size, args.batch_size), args.dim, args.clusters, args.seed)
+        queries = base[picks] + 0.1 * np.random.default_rng(args.seed + 2).standard_normal((len(picks), args.dim)).astype(np.float32)
+        start = time.perf_counter()
+        await store.search(queries[0], args.top_n, namespace=namespace)
+        row["first_query_ms"] = (time.perf_counter() - start) * 1000.0
+        # IVF trains in the background; measure queries against the trained index.
+        start = time.perf_counter()
+        await vector_store.wait_for_training()
+        row["train_s"] = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            await store.search(query, args.top_n, namespace=namespace)
+            latencies.append(time.perf_counter() - start)
+        row["query_p50_ms"] = percentile_ms(latencies, 50)
+        row["query_p99_ms"] = percentile_ms(latencies, 99)
+
+        # Single adds, as save_embedding does per message.
+        extra = synthetic_batch(args.size, args.single_adds, args.dim, args.clusters, args.seed)
+        latencies = []
+        for i, vector in enumerate(extra):
+            start = time.perf_counter()
+            await store.add(f"single message {i}", vector, "bench", channel="bench", namespace=namespace)
+            latencies.append(time.perf_counter() - start)
+        row["add_p50_ms"] = percentile_ms(latencies, 50)
+        row["add_p99_ms"] = percentile_ms(latencies, 99)
+
+        stored = await store.count(namespace=namespace)
+        row["stored"] = stored
+        row["rss_delta_bytes"] = current_rss_bytes() - rss_before
+        row["process_bytes_per_vector"] = row["rss_delta_bytes"] / stored if stored else None
+        storage = await storage_bytes(args.backend, store, namespace)
+        row["storage_bytes_per_vector"] = storage / stored if storage and stored else None
+        row["peak_rss_bytes"] = peak_rss_bytes()
+    finally:
+        await cleanup(args.backend, namespace)
+    return row
+
+def run_subprocess(args, backend, index, size):
+    command = [
+        sys.executable, "-m", "benchmarks.retrieval", "--single",
+        "--backend", backend, "--index", index, "--size", str(size),
+        "--dim", str(args.dim), "--clusters", str(args.clusters), "--queries", str(args.queries),
+        "--top-n", str(args.top_n), "--batch-size", str(args.batch_size),
+        "--single-adds", str(args.single_adds), "--seed", str(args.seed)
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+        return {"backend": backend, "index": index, "vectors": size, "error": error}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def format_table(rows):
+    header = f"{'backend':<7} {'index':<5} {'vectors':>9} {'ingest/s':>10} {'first ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'add ms':>7} {'peak MB':>8} {'B/vec mem':>10} {'B/vec store':>11}"
+    lines = [header]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{row['backend']:<7} {row['index']:<5} {row['vectors']:>9} error: {row['error']}")
+            continue
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else "-"
+        lines.append(
+            f"{row['backend']:<7} {row['index']:<5} {row['vectors']:>9} {fmt(row['ingest_per_s'], '>10.0f')} "
+            f"{fmt(row['first_query_ms'], '>9.1f')} {fmt(row['query_p50_ms'], '>8.2f')} {fmt(row['query_p99_ms'], '>8.2f')} "
+            f"{fmt(row['add_p50_ms'], '>7.2f')} {row['peak_rss_bytes'] / 2**20:>8.0f} "
+            f"{fmt(row['process_bytes_per_vector'], '>10.0f')} {fmt(row['storage_bytes_per_vector'], '>11.0f')}"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and retrieval of the embedding stores.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated corpus sizes.")
+    parser.add_argument("--backends", default="memory,sqlite,redis", help="Comma-separated VECTOR_STORE backends.")
+    parser.add_argument("--index", default="exact,ivf", help="Comma-separated EMBEDDING_INDEX types.")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200, help="Clusters in the synthetic data.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--single-adds", type=int, default=200, help="Individual adds timed after the bulk ingest.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    parser.add_argument("--output", help="Also write the JSON results to this file.")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        with tempfile.TemporaryDirectory() as workdir:
+            row = asyncio.run(run_single(args, workdir))
+        print(json.dumps(row))
+        return
+
+    rows = []
+    for size in [int(v) for v in args.sizes.split(",")]:
+        for backend in args.backends.split(","):
+            for index in args.index.split(","):
+                rows.append(run_subprocess(args, backend, index, size))
+                if not args.json:
+                    print(format_table(rows[-1:]).splitlines()[-1], file=sys.stderr)
+
+    results = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "results": rows
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(rows))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# compact_embeddings.py
+"""
+Retention and compaction for tater:global:embeddings and the per-namespace
+embedding lists (tater:embeddings:<namespace>).
+
+Usage:
+    python compact_embeddings.py [--dry-run] [--max-per-author N] [--max-per-channel N] [--max-age-days N]
+
+A compaction pass walks the list from newest to oldest and drops
+  - duplicate texts (the newest copy is kept),
+  - entries beyond the per-author and per-channel caps (the newest are kept),
+  - entries older than the maximum age (legacy records without a timestamp are kept).
+The kept entries are written to a temporary key in small batches and swapped in
+with one MULTI/EXEC, so the bot keeps reading and writing the live list while the
+pass runs. Entries appended in the meantime are carried over before the swap.
+
+The bot runs a pass every EMBEDDING_COMPACTION_INTERVAL seconds (0 disables it).
+"""
+import os
+import time
+import asyncio
+import argparse
+import logging
+from collections import Counter
+import redis
+from dotenv import load_dotenv
+from embedding_record import decode_record, content_hash
+from lexical_index import LexicalIndex
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater.compaction")
+
+redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
+redis_port = int(os.getenv('REDIS_PORT', 6379))
+compaction_interval = int(os.getenv('EMBEDDING_COMPACTION_INTERVAL', 6 * 3600))
+max_per_author = int(os.getenv('EMBEDDING_MAX_PER_AUTHOR', 0))
+max_per_channel = int(os.getenv('EMBEDDING_MAX_PER_CHANNEL', 0))
+max_age_days = float(os.getenv('EMBEDDING_MAX_AGE_DAYS', 0))
+
+GLOBAL_EMBEDDINGS_KEY = "tater:global:embeddings"
+NAMESPACE_KEY_PREFIX = "tater:embeddings:"
+NAMESPACES_KEY = "tater:embeddings:namespaces"
+
+class CompactionAborted(Exception):
+    """The list was trimmed or rewritten by someone else while compacting."""
+
+def memory_usage(client, key):
+    """Exact memory used by a key in bytes (0 if the key does not exist)."""
+    try:
+        return client.memory_usage(key, samples=0) or 0
+    except redis.ResponseError:
+        return 0
+
+def _head_offset(client, key, seq_key):
+    """
+    Return (seq, length, head offset), where the head offset is the number of entries
+    ever removed from the head of the list (by EMBEDDING_MAX_ENTRIES). The counter is
+    read before the length, so a concurrent append can only make the offset look smaller.
+    """
+    seq = client.get(seq_key)
+    length = client.llen(key)
+    seq = int(seq) if seq is not None else length
+    return seq, length, seq - length
+
+def compact(client, key=GLOBAL_EMBEDDINGS_KEY, max_per_author=0, max_per_channel=0, max_age_days=0,
+            dry_run=False, batch_size=1000):
+    """Run one compaction pass and return statistics about what was removed."""
+    seq_key = f"{key}:seq"
+    hashes_key = f"{key}:hashes"
+    generation_key = f"{key}:generation"
+    temp_key = f"{key}:compacting"
+    temp_hashes_key = f"{hashes_key}:compacting"
+
+    stats = Counter()
+    bytes_before = memory_usage(client, key) + memory_usage(client, hashes_key)
+    seq0, length0, offset0 = _head_offset(client, key, seq_key)
+    min_created_at = time.time() - max_age_days * 86400 if max_age_days else None
+
+    seen_hashes = set()
+    dropped = []  # (text, username) of removed messages, to drop from the lexical index
+    per_author = Counter()
+    per_channel = Counter()
+    if not dry_run:
+        client.delete(temp_key, temp_hashes_key)
+
+    # Walk newest to oldest; LPUSH keeps the kept entries in their original order.
+    end = length0
+    while end > 0:
+        start = max(0, end - batch_size)
+        batch = client.lrange(key, start, end - 1)
+        if _head_offset(client, key, seq_key)[2] > offset0:
+            raise CompactionAborted("The list was trimmed during compaction.")
+        kept = []
+        kept_hashes = {}
+        for position in range(len(batch) - 1, -1, -1):
+            raw = batch[position]
+            stats["scanned"] += 1
+            try:
+                record = decode_record(raw)
+            except Exception:
+                record = None
+            if record is None:
+                stats["removed_unreadable"] += 1
+                continue
+            text_hash = content_hash(record["text"])
+            if text_hash in seen_hashes:
+                stats["removed_duplicates"] += 1
+                continue
+            seen_hashes.add(text_hash)
+            if min_created_at is not None and record["created_at"] is not None and record["created_at"] < min_created_at:
+                stats["removed_age"] += 1
+                dropped.append((record["text"], record["username"]))
+                continue
+            if max_per_author and record["username"]:
+                if per_author[record["username"]] >= max_per_author:
+                    stats["removed_author_cap"] += 1
+                    dropped.append((record["text"], record["username"]))
+                    continue
+                per_author[record["username"]] += 1
+            if max_per_channel and record["channel"]:
+                if per_channel[record["channel"]] >= max_per_channel:
+                    stats["removed_channel_cap"] += 1
+                    dropped.append((record["text"], record["username"]))
+                    continue
+                per_channel[record["channel"]] += 1
+            # Renumber to the entry's position in the compacted list: the newest kept entry
+            # keeps seq0 and each older one counts down, so the EMBEDDING_MAX_ENTRIES trim
+            # (every hash scored at most seq - max_entries) drops exactly the trimmed rows.
+            kept_hashes[text_hash] = seq0 - stats["kept"] - len(kept)
+            kept.append(raw)
+        stats["kept"] += len(kept)
+        if kept and not dry_run:
+            client.lpush(temp_key, *kept)
+            client.zadd(temp_hashes_key, kept_hashes)
+        end = start
+
+    removed = stats["scanned"] - stats["kept"]
+    if dry_run or removed == 0:
+        if not dry_run:
+            client.delete(temp_key, temp_hashes_key)
+        stats["bytes_before"] = bytes_before
+        stats["bytes_after"] = bytes_before
+        return dict(stats)
+
+    # Carry over entries appended since the scan started, then swap atomically.
+    carried = 0
+    while True:
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key, seq_key, generation_key)
+                seq, length, offset = _head_offset(pipe, key, seq_key)
+                if offset > offset0:
+                    raise CompactionAborted("The list was trimmed during compaction.")
+                new_count = seq - seq0
+                if new_count > carried:
+                    tail = pipe.lrange(key, length0 + carried, length0 + new_count - 1)
+                    if not tail:
+                        carried = new_count
+                        continue
+                    pipe.multi()
+                    pipe.rpush(temp_key, *tail)
+                    for position, raw in enumerate(tail, seq0 + carried + 1):
+                        try:
+                            record = decode_record(raw)
+                        except Exception:
+                            record = None
+                        if record is not None:
+                            pipe.zadd(temp_hashes_key, {content_hash(record["text"]): position})
+                    pipe.execute()
+                    carried = new_count
+                    continue
+                has_entries = client.exists(temp_key)
+                has_hashes = client.exists(temp_hashes_key)
+                pipe.multi()
+                if has_entries:
+                    pipe.rename(temp_key, key)
+                else:
+                    pipe.delete(key)
+                if has_hashes:
+                    pipe.rename(temp_hashes_key, hashes_key)
+                else:
+                    pipe.delete(hashes_key)
+                # Tell running bots to reload their in-memory index.
+                pipe.incr(generation_key)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+
+    lexical = LexicalIndex(key)
+    if dropped and client.exists(lexical.docs_key):
+        for start in range(0, len(dropped), batch_size):
+            with client.pipeline(transaction=False) as pipe:
+                for text, username in dropped[start:start + batch_size]:
+                    lexical.remove(pipe, text, username)
+                pipe.execute()
+
+    stats["carried_over"] = carried
+    stats["bytes_before"] = bytes_before
+    stats["bytes_after"] = memory_usage(client, key) + memory_usage(client, hashes_key)
+    return dict(stats)
+
+def embedding_keys(client):
+    """All embedding lists: the global one plus one per registered namespace."""
+    namespaces = sorted(ns.decode() if isinstance(ns, bytes) else ns for ns in client.smembers(NAMESPACES_KEY))
+    return [GLOBAL_EMBEDDINGS_KEY] + [f"{NAMESPACE_KEY_PREFIX}{ns}" for ns in namespaces]
+
+def run_compaction(client=None):
+    """
+    Run one pass over every embedding list with the configured limits, guarded by a
+    lock so only one replica compacts at a time.
+    """
+    if client is None:
+        # A pass runs every few hours; don't keep a connection open in between.
+        with redis.Redis(host=redis_host, port=redis_port, db=0) as client:
+            return run_compaction(client)
+    lock_key = f"{GLOBAL_EMBEDDINGS_KEY}:compaction-lock"
+    if not client.set(lock_key, "1", nx=True, ex=3600):
+        logger.info("Embedding compaction already running elsewhere; skipping.")
+        return None
+    totals = Counter()
+    try:
+        for key in embedding_keys(client):
+            try:
+                stats = compact(
+                    client,
+                    key=key,
+                    max_per_author=max_per_author,
+                    max_per_channel=max_per_channel,
+                    max_age_days=max_age_days
+                )
+            except CompactionAborted as e:
+                logger.warning(f"Embedding compaction of {key} aborted: {e}")
+                continue
+            totals.update(stats)
+    finally:
+        client.delete(lock_key)
+    logger.info(
+        f"Embedding compaction: kept {totals.get('kept', 0)} of {totals.get('scanned', 0)} entries "
+        f"(duplicates {totals.get('removed_duplicates', 0)}, age {totals.get('removed_age', 0)}, "
+        f"author cap {totals.get('removed_author_cap', 0)}, channel cap {totals.get('removed_channel_cap', 0)}, "
+        f"unreadable {totals.get('removed_unreadable', 0)}); "
+        f"reclaimed {totals.get('bytes_before', 0) - totals.get('bytes_after', 0):,} bytes."
+    )
+    return dict(totals)
+
+async def compaction_loop(interval=compaction_interval):
+    """Background task for the bot: compact in a worker thread so the event loop is never blocked."""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_compaction)
+        except Exception as e:
+            logger.error(f"Error compacting embeddings: {e}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Deduplicate and apply retention limits to the stored embeddings.")
+    parser.add_argument("--max-per-author", type=int, default=max_per_author)
+    parser.add_argument("--max-per-channel", type=int, default=max_per_channel)
+    parser.add_argument("--max-age-days", type=float, default=max_age_days)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed.")
+    parser.add_argument("--key", help="Compact only this list (default: every namespace).")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=redis_host, port=redis_port, db=0)
+    for key in [args.key] if args.key else embedding_keys(client):
+        stats = compact(
+            client,
+            key=key,
+            max_per_author=args.max_per_author,
+            max_per_channel=args.max_per_channel,
+            max_age_days=args.max_age_days,
+            dry_run=args.dry_run
+        )
+        print(key)
+        for name in sorted(stats):
+            print(f"  {name}: {stats[name]:,}")
+        print(f"  bytes_reclaimed: {stats['bytes_before'] - stats['bytes_after']:,}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 # discord_bot.py
 import asyncio
 import threading
-import os
 import discord
 from tater import tater  # your bot class
-import ollama
+from llm_gateway import gateway, close_loop_clients
+from redis_async import close_clients
 
 # Global variables to store the event loop and task.
 _bot_loop = None
@@ -20,6 +20,8 @@ def start_discord_bot(discord_token, admin_user_id, response_channel_id, rss_cha
         def run_loop(loop):
             asyncio.set_event_loop(loop)
             loop.run_forever()
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
 
         import threading
         thread = threading.Thread(target=run_loop, args=(_bot_loop,), daemon=True)
@@ -34,22 +36,33 @@ def start_discord_bot(discord_token, admin_user_id, response_channel_id, rss_cha
 async def run_discord_bot(discord_token, admin_user_id, response_channel_id, rss_channel_id):
     intents = discord.Intents.default()
     intents.message_content = True
-    ollama_host = os.getenv('OLLAMA_HOST', '127.0.0.1')
-    ollama_port = int(os.getenv('OLLAMA_PORT', 11434))
-    ollama_client = ollama.AsyncClient(host=f'http://{ollama_host}:{ollama_port}')
     client = tater(
-        ollama_client=ollama_client,
+        ollama_client=gateway,
         admin_user_id=admin_user_id,
         response_channel_id=response_channel_id,
         rss_channel_id=rss_channel_id,
         command_prefix="!",
         intents=intents
     )
-    await client.start(discord_token)
+    try:
+        await client.start(discord_token)
+    finally:
+        if not client.is_closed():
+            await client.close()
+
+async def _close_loop():
+    # Every start gets a fresh loop. Cancel the bot and its background tasks and wait
+    # for them to finish, release the connections opened on this loop, then stop it.
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_loop_clients()
+    await close_clients()
+    asyncio.get_running_loop().stop()
 
 def stop_discord_bot():
     global _bot_loop, _bot_task
     if _bot_task is not None and not _bot_task.done():
-        _bot_task.cancel()
-        _bot_loop.call_soon_threadsafe(_bot_loop.stop)
+        asyncio.run_coroutine_threadsafe(_close_loop(), _bot_loop)
         print("Discord bot stopped.")
@@ -0,0 +1,117 @@
+# discord_stream.py
+"""
+Progressive Discord replies for streamed Ollama responses.
+
+The first message is posted as soon as the first sentence has arrived, then edited
+in place at most every STREAM_EDIT_INTERVAL seconds (Discord allows about five
+edits per five seconds per channel). When the text outgrows max_length the message
+is finished at a line or word boundary and the rest continues in a new message.
+
+Replies that start like a tool call (a JSON object, optionally in a code fence) are
+never posted; they are only collected so the caller can run the tool.
+"""
+import os
+import re
+import time
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+stream_edit_interval = float(os.getenv('STREAM_EDIT_INTERVAL', 1.2))
+# Post the first message after this many characters even without a sentence end.
+FIRST_POST_CHARS = 200
+
+_TOOL_CALL_RE = re.compile(r"(```(json)?\s*)?\{")
+_SENTENCE_END_RE = re.compile(r"[.!?:](\s|$)|\n")
+
+def split_point(text, limit):
+    """Where to cut text so the first part fits in limit characters."""
+    for separator in ("\n", " "):
+        cut = text.rfind(separator, 0, limit)
+        if cut > limit // 2:
+            return cut + 1
+    return limit
+
+class StreamingReply:
+    """Collects a streamed reply and mirrors it into one or more Discord messages."""
+
+    def __init__(self, channel, max_length, edit_interval=stream_edit_interval):
+        self.channel = channel
+        self.max_length = max_length
+        self.edit_interval = edit_interval
+        self.text = ""
+        self.messages = []
+        self.is_tool_call = False
+        self._offset = 0       # start of the current message within self.text
+        self._current = None   # message being edited
+        self._shown = ""
+        self._last_edit = 0.0
+
+    def _looks_like_tool_call(self, stripped):
+        """True or False once the start of the reply is known, None while it is still ambiguous."""
+        if _TOOL_CALL_RE.match(stripped):
+            return True
+        if stripped.startswith("`") and len(stripped) < 8:
+            return None
+        return False
+
+    async def feed(self, chunk):
+        """Add a streamed chunk, posting or editing when it is due."""
+        self.text += chunk
+        if self.is_tool_call:
+            return
+        if not self.messages:
+            stripped = self.text.lstrip()
+            decision = self._looks_like_tool_call(stripped) if stripped else None
+            if decision is None:
+                return
+            if decision:
+                self.is_tool_call = True
+                return
+            if len(stripped) < FIRST_POST_CHARS and not _SENTENCE_END_RE.search(stripped):
+                return
+        await self._flush(final=False)
+
+    async def finish(self):
+        """Show whatever is left. Returns the full reply text."""
+        if not self.is_tool_call:
+            await self._flush(final=True)
+        return self.text.strip()
+
+    async def delete(self):
+        """Remove the posted messages, e.g. when the reply turned out to be a tool call."""
+        for sent in self.messages:
+            try:
+                await sent.delete()
+            except Exception as e:
+                logger.warning(f"Could not delete streamed message: {e}")
+        self.messages = []
+        self._current = None
+
+    async def _flush(self, final):
+        current = self.text[self._offset:]
+        while len(current) > self.max_length:
+            cut = split_point(current, self.max_length)
+            await self._show(current[:cut])
+            # The finished message stays as it is; continue in a new one.
+            self._current = None
+            self._shown = ""
+            self._offset += cut
+            current = self.text[self._offset:]
+        if final or time.monotonic() - self._last_edit >= self.edit_interval:
+            await self._show(current)
+
+    async def _show(self, text):
+        text = text.strip()
+        if not text or text == self._shown:
+            return
+        if self._current is None:
+            self._current = await self.channel.send(text)
+            self.messages.append(self._current)
+        else:
+            await self._current.edit(content=text)
+        self._shown = text
+        self._last_edit = time.monotonic()
@@ -1,10 +1,18 @@
 # embed.py
 import os
-import json
-import redis
-import ollama
+import heapq
+import asyncio
+import itertools
+import hashlib
+import weakref
 import logging
+import numpy as np
+from collections import OrderedDict
 from dotenv import load_dotenv
+from vector_store import create_vector_store, GLOBAL_NAMESPACE
+from redis_async import get_redis
+from llm_gateway import embedding_gateway
+from llm_scheduler import PRIORITIES, current_priority, set_priority
 
 load_dotenv()
 
@@ -16,66 +24,228 @@ if not logger.hasHandlers():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-ollama_host = os.getenv('OLLAMA_HOST', '127.0.0.1')
-ollama_port = int(os.getenv('OLLAMA_PORT', 11434))
 ollama_emb_model = os.getenv('OLLAMA_EMB_MODEL', 'nomic-embed-text').strip()
-redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
-redis_port = int(os.getenv('REDIS_PORT', 6379))
 
-redis_client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
-ollama_emb_client = ollama.AsyncClient(host=f'http://{ollama_host}:{ollama_port}')
+# How memory is partitioned: "global" (one shared memory), "guild" (per Discord server,
+# DMs per channel) or "channel" (per Discord channel). The web UI gets its own namespace
+# unless the scope is global.
+embedding_scope = os.getenv('EMBEDDING_SCOPE', 'global').strip().lower()
+
+# Embedding cache: an in-process LRU plus an optional shared Redis tier.
+embedding_cache_size = int(os.getenv('EMBEDDING_CACHE_SIZE', 2048))
+embedding_cache_redis = os.getenv('EMBEDDING_CACHE_REDIS', 'false').strip().lower() in ('1', 'true', 'yes')
+embedding_cache_ttl = int(os.getenv('EMBEDDING_CACHE_TTL', 7 * 24 * 3600))
+EMBEDDING_CACHE_KEY_PREFIX = "tater:embcache:"
+
+# How often the bot writes memory-mapped index snapshots (seconds, 0 = never).
+embedding_snapshot_interval = int(os.getenv('EMBEDDING_SNAPSHOT_INTERVAL', 3600))
+
+# Micro-batching: embedding requests arriving within EMBED_BATCH_MAX_WAIT_MS of each other
+# are sent to Ollama as one request of up to EMBED_BATCH_MAX_SIZE inputs.
+embed_batch_max_size = int(os.getenv('EMBED_BATCH_MAX_SIZE', 16))
+embed_batch_max_wait = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', 5)) / 1000.0
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings keyed by hash(model, text).
+    Lookups hit an in-process LRU first and then, if enabled, a shared Redis tier,
+    so identical texts are only ever sent to the embedding model once.
+    """
+
+    def __init__(self, max_size, use_redis=False, ttl=None):
+        self.max_size = max_size
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    async def get(self, key):
+        embedding = self._entries.get(key)
+        if embedding is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+        if self.use_redis:
+            try:
+                # Cached embeddings are raw bytes, so use the client without response decoding.
+                raw = await get_redis(decode_responses=False).get(EMBEDDING_CACHE_KEY_PREFIX + key)
+            except Exception as e:
+                logger.error(f"Error reading embedding cache: {e}")
+                raw = None
+            if raw:
+                embedding = np.frombuffer(raw, dtype=np.float32).tolist()
+                self._remember(key, embedding)
+                self.hits += 1
+                return embedding
+        self.misses += 1
+        return None
+
+    async def put(self, key, embedding):
+        self._remember(key, embedding)
+        if self.use_redis:
+            try:
+                await get_redis(decode_responses=False).set(EMBEDDING_CACHE_KEY_PREFIX + key, np.asarray(embedding, dtype=np.float32).tobytes(), ex=self.ttl)
+            except Exception as e:
+                logger.error(f"Error writing embedding cache: {e}")
+
+    def _remember(self, key, embedding):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+embedding_cache = EmbeddingCache(
+    embedding_cache_size,
+    use_redis=embedding_cache_redis,
+    ttl=embedding_cache_ttl
+)
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched calls to Ollama's embed endpoint.
+    Callers await their own future; a batch is flushed when it reaches max_batch_size
+    or max_wait seconds after its first request, whichever comes first. A batch is
+    scheduled with the highest priority among its callers.
+    """
+
+    def __init__(self, max_batch_size, max_wait):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def embed(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, current_priority()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        # The task runs in the context of whichever caller flushed the batch.
+        set_priority(min((priority for _, _, priority in batch), key=PRIORITIES.get))
+        # Identical texts in the same batch are only embedded once.
+        inputs = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            response = await embedding_gateway.embed(
+                model=ollama_emb_model,
+                input=inputs,
+                keep_alive=-1
+            )
+            results = dict(zip(inputs, response['embeddings']))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if len(inputs) > 1:
+            logger.debug(f"Embedded a batch of {len(inputs)} texts.")
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(results.get(text))
+
+# Futures and timers belong to one event loop (the bot and the web UI each run their own),
+# so each loop gets its own batcher.
+_batchers = weakref.WeakKeyDictionary()
+
+def _get_batcher():
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = EmbeddingBatcher(embed_batch_max_size, embed_batch_max_wait)
+        _batchers[loop] = batcher
+    return batcher
 
 async def generate_embedding(text: str):
+    cache_key = EmbeddingCache.key(ollama_emb_model, text)
+    cached = await embedding_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        response = await ollama_emb_client.embeddings(
-            model=ollama_emb_model,
-            prompt=text,
-            keep_alive=-1
-        )
-        return response['embedding']
+        embedding = await _get_batcher().embed(text)
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         return None
+    if embedding:
+        await embedding_cache.put(cache_key, embedding)
+    return embedding
+
+def memory_namespace(guild_id=None, channel_id=None, webui=False):
+    """Return the memory namespace a message belongs to under the configured EMBEDDING_SCOPE."""
+    if embedding_scope == "global":
+        return GLOBAL_NAMESPACE
+    if webui:
+        return "webui"
+    if embedding_scope == "guild" and guild_id is not None:
+        return f"guild:{guild_id}"
+    if channel_id is not None:
+        return f"channel:{channel_id}" if guild_id is not None else f"dm:{channel_id}"
+    return GLOBAL_NAMESPACE
 
-async def save_embedding(text: str, embedding, username: str):
+# Where embeddings are stored is chosen by VECTOR_STORE (see vector_store.py).
+vector_store = create_vector_store()
+
+async def save_embedding(text: str, embedding, username: str, channel=None, namespace=GLOBAL_NAMESPACE):
     """
-    Save the embedding along with the text and the username.
+    Save the embedding along with the text, the username and the channel it came from
+    into the given memory namespace. Texts that are already stored are skipped.
+    """
+    if await vector_store.add(text, embedding, username, channel=channel, namespace=namespace):
+        logger.info("Message saved")
+    else:
+        logger.info("Duplicate message not saved")
+
+async def find_relevant_context(query_embedding, top_n=10, scope=GLOBAL_NAMESPACE, query_text=None):
+    """
+    Return the top_n most similar stored messages as "username: text" strings.
+    scope is a namespace or a list of namespaces; only those partitions are searched.
+    query_text enables the lexical prefilter when EMBEDDING_HYBRID_SEARCH is on.
     """
-    global_key = "tater:global:embeddings"
-    # Store a JSON object with username, text, and embedding
-    redis_client.rpush(global_key, json.dumps({
-        "username": username,
-        "text": text,
-        "embedding": json.dumps(embedding)
-    }))
-    # Uncomment the following line to limit storage to the last 1000 messages (saves RAM)
-    # redis_client.ltrim(global_key, -1000, -1)
-    logger.info("Message saved")
-
-async def find_relevant_context(query_embedding, top_n=10):
     # Guard clause: if query_embedding is None, return an empty list.
     if query_embedding is None:
         return []
-    global_embeddings = redis_client.lrange("tater:global:embeddings", 0, -1)
-    similarities = []
-    for emb_data in global_embeddings:
+    namespaces = [scope] if isinstance(scope, str) or scope is None else list(scope)
+    rankings = []
+    for namespace in namespaces:
+        rankings.append(await vector_store.search(query_embedding, top_n, namespace=namespace, query_text=query_text))
+    # Scores are cosine similarities everywhere; interleave by score but keep each
+    # namespace's own order, which hybrid search fuses with the lexical ranking.
+    results = heapq.merge(*rankings, key=lambda item: item[1], reverse=True)
+    return [text for text, _ in itertools.islice(results, top_n)]
+
+async def snapshot_loop(interval=embedding_snapshot_interval):
+    """Background task for the bot: periodically snapshot the loaded indexes for fast restarts."""
+    if interval <= 0 or not hasattr(vector_store, "snapshot"):
+        return
+    while True:
+        await asyncio.sleep(interval)
         try:
-            data = json.loads(emb_data)
-            stored_emb_str = data.get("embedding")
-            if stored_emb_str is None:
-                continue  # Skip if no embedding is stored.
-            emb = json.loads(stored_emb_str)
-            if emb is None:
-                continue  # Skip if decoding returns None.
-            similarity = cosine_similarity(query_embedding, emb)
-            # Include username with the text for context.
-            combined_text = f"{data.get('username', '')}: {data['text']}"
-            similarities.append((combined_text, similarity))
+            written = await vector_store.snapshot()
+            if written:
+                logger.info(f"Wrote {written} embedding snapshot(s).")
         except Exception as e:
-            logger.error(f"Error processing embedding: {e}")
-            continue
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    return [text for text, _ in similarities[:top_n]]
+            logger.error(f"Error writing embedding snapshot: {e}")
 
 def cosine_similarity(vec1, vec2):
     dot_product = sum(a * b for a, b in zip(vec1, vec2))
@@ -0,0 +1,84 @@
+# embedding_record.py
+import json
+import hashlib
+import struct
+import time
+import numpy as np
+
+# Binary layout of a stored embedding record:
+#   header (little endian): magic, version, dtype code, dimension, created_at,
+#                           username length, channel length, text length
+#   followed by the UTF-8 username, channel and text, then the raw vector bytes.
+# Version 1 records have no channel field.
+RECORD_MAGIC = b"TEMB"
+RECORD_VERSION = 2
+_HEADER_V1 = struct.Struct("<4sBBHdHI")
+_HEADER = struct.Struct("<4sBBHdHHI")
+
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+_CODE_DTYPES = {code: np.dtype(name) for name, code in _DTYPE_CODES.items()}
+
+def encode_record(text: str, embedding, username: str, dtype="float32", created_at=None, channel="") -> bytes:
+    """Pack a text/username pair and its embedding into the binary record format."""
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    vector = np.asarray(embedding, dtype=dtype).ravel()
+    username_bytes = (username or "").encode("utf-8")
+    channel_bytes = str(channel or "").encode("utf-8")
+    text_bytes = (text or "").encode("utf-8")
+    header = _HEADER.pack(
+        RECORD_MAGIC,
+        RECORD_VERSION,
+        _DTYPE_CODES[dtype],
+        vector.shape[0],
+        time.time() if created_at is None else created_at,
+        len(username_bytes),
+        len(channel_bytes),
+        len(text_bytes)
+    )
+    return header + username_bytes + channel_bytes + text_bytes + vector.tobytes()
+
+def content_hash(text: str) -> str:
+    """Hash used to detect duplicate stored texts."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def is_binary_record(raw) -> bool:
+    return isinstance(raw, (bytes, bytearray)) and raw[:4] == RECORD_MAGIC
+
+def decode_record(raw):
+    """
+    Decode a stored record, binary or legacy JSON.
+    Returns a dict with username, channel, text, embedding and created_at (None for
+    legacy records), or None if the record has no usable embedding.
+    """
+    if not is_binary_record(raw):
+        return _decode_legacy_record(raw)
+    version = raw[4]
+    if version == 1:
+        _, _, dtype_code, dim, created_at, username_len, text_len = _HEADER_V1.unpack_from(raw)
+        channel_len = 0
+        offset = _HEADER_V1.size
+    elif version == RECORD_VERSION:
+        _, _, dtype_code, dim, created_at, username_len, channel_len, text_len = _HEADER.unpack_from(raw)
+        offset = _HEADER.size
+    else:
+        raise ValueError(f"Unknown embedding record version: {version}")
+    username = bytes(raw[offset:offset + username_len]).decode("utf-8")
+    offset += username_len
+    channel = bytes(raw[offset:offset + channel_len]).decode("utf-8")
+    offset += channel_len
+    text = bytes(raw[offset:offset + text_len]).decode("utf-8")
+    offset += text_len
+    embedding = np.frombuffer(raw, dtype=_CODE_DTYPES[dtype_code], count=dim, offset=offset)
+    return {"username": username, "channel": channel, "text": text, "embedding": embedding, "created_at": created_at}
+
+def _decode_legacy_record(raw):
+    """Records written before the binary format: JSON with a JSON-encoded embedding inside."""
+    data = json.loads(raw)
+    stored_emb_str = data.get("embedding")
+    if stored_emb_str is None:
+        return None  # Skip if no embedding is stored.
+    emb = json.loads(stored_emb_str)
+    if emb is None:
+        return None  # Skip if decoding returns None.
+    return {"username": data.get("username", ""), "channel": "", "text": data["text"], "embedding": emb, "created_at": None}
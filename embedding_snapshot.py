@@ -0,0 +1,113 @@
+# embedding_snapshot.py
+"""
+Memory-mapped snapshots of the in-memory similarity index.
+
+Usage:
+    python embedding_snapshot.py
+
+A snapshot holds the normalized embedding matrix, the row ids, an offset table
+into a blob of the "username: text" strings, and the list cursor (sequence number
+and generation) it was taken at. At startup the bot maps the file read-only instead of pulling and
+decoding the whole Redis list, then only replays the records appended since.
+
+File layout (little endian):
+    header: magic, version, dimension, row count, sequence number, generation length
+    generation (UTF-8), zero padding up to a 64 byte boundary
+    matrix: row count x dimension float32
+    ids: row count int64 (-1 = none)
+    offsets: row count + 1 uint64, offsets of each text in the text blob
+    text blob (UTF-8)
+"""
+import os
+import mmap
+import asyncio
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger("discord.tater")
+
+SNAPSHOT_MAGIC = b"TSNP"
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct("<4sBxxxIQqH")
+_ALIGNMENT = 64
+
+def _matrix_offset(generation_len):
+    end = _HEADER.size + generation_len
+    return (end + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+def write_snapshot(path, texts, matrix, seq, generation, ids=None):
+    """Write a snapshot atomically. matrix holds the normalized rows for texts."""
+    count = len(texts)
+    ids = np.full(count, -1, dtype="<i8") if ids is None else np.asarray(ids[:count], dtype="<i8")
+    dim = matrix.shape[1] if count else 0
+    generation_bytes = str(generation).encode("utf-8")
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(count + 1, dtype="<u8")
+    if count:
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    matrix_offset = _matrix_offset(len(generation_bytes))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, dim, count, seq, len(generation_bytes)))
+        f.write(generation_bytes)
+        f.write(b"\0" * (matrix_offset - _HEADER.size - len(generation_bytes)))
+        if count:
+            f.write(np.ascontiguousarray(matrix[:count], dtype="<f4").tobytes())
+        f.write(ids.tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+    os.replace(tmp_path, path)
+
+def load_snapshot(path):
+    """
+    Map a snapshot read-only. Returns a dict with texts, matrix (a read-only view of
+    the file), ids, seq and generation, or None if there is no usable snapshot.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dim, count, seq, generation_len = _HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring embedding snapshot {path} with an unknown format.")
+            return None
+        generation = mapped[_HEADER.size:_HEADER.size + generation_len].decode("utf-8")
+        offset = _matrix_offset(generation_len)
+        # The arrays keep the mapping alive for as long as they are referenced.
+        matrix = np.frombuffer(mapped, dtype="<f4", count=count * dim, offset=offset).reshape(count, dim)
+        offset += count * dim * 4
+        ids = np.frombuffer(mapped, dtype="<i8", count=count, offset=offset).tolist()
+        offset += count * 8
+        offsets = np.frombuffer(mapped, dtype="<u8", count=count + 1, offset=offset).tolist()
+        offset += (count + 1) * 8
+        blob = mapped[offset:offset + offsets[-1]]
+        texts = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+    except Exception as e:
+        logger.error(f"Error loading embedding snapshot {path}: {e}")
+        return None
+    return {"texts": texts, "matrix": matrix, "ids": ids, "seq": seq, "generation": generation}
+
+async def snapshot_all():
+    from vector_store import RedisVectorStore, GLOBAL_NAMESPACE, NAMESPACES_KEY
+    from redis_async import get_redis
+
+    store = RedisVectorStore()
+    namespaces = [GLOBAL_NAMESPACE] + sorted(await get_redis().smembers(NAMESPACES_KEY))
+    for namespace in namespaces:
+        partition = store.partition(namespace)
+        await partition.sync()
+        path = partition.write_snapshot()
+        print(f"{namespace}: {len(partition.index)} embeddings at seq {partition.cursor} -> {path}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(snapshot_all())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# history_cache.py
+"""
+Write-through cache of recent conversation turns per channel.
+
+The turns of a channel live in the Redis list tater:channel:<id>:history (newest
+HISTORY_LENGTH entries). Next to it tater:channel:<id>:history:version is bumped on
+every write, so a process can tell with a single GET whether its copy is current,
+even when other bot replicas write to the same channel.
+"""
+import os
+import json
+import logging
+from collections import OrderedDict, deque
+from redis_async import get_redis, push_capped
+
+logger = logging.getLogger("discord.tater")
+
+HISTORY_LENGTH = 20
+# Channels kept in memory; the least recently used are dropped beyond this.
+history_cache_channels = int(os.getenv('HISTORY_CACHE_CHANNELS', 1000))
+
+def history_key(channel_id):
+    return f"tater:channel:{channel_id}:history"
+
+class HistoryCache:
+    """Per-channel ring buffers of recent turns, warmed lazily from Redis."""
+
+    def __init__(self, max_length=HISTORY_LENGTH, max_channels=history_cache_channels):
+        self.max_length = max_length
+        self.max_channels = max_channels
+        self._channels = OrderedDict()  # channel id -> (version, deque of turns)
+
+    def _remember(self, channel_id, version, turns):
+        self._channels[channel_id] = (version, deque(turns, maxlen=self.max_length))
+        self._channels.move_to_end(channel_id)
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+
+    async def _warm(self, channel_id):
+        key = history_key(channel_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.get(f"{key}:version")
+            pipe.lrange(key, -self.max_length, -1)
+            version, raw_turns = await pipe.execute()
+        turns = [json.loads(entry) for entry in raw_turns]
+        self._remember(channel_id, int(version or 0), turns)
+        return turns
+
+    async def get(self, channel_id, limit=HISTORY_LENGTH):
+        """The newest limit turns of a channel as dicts with role, username and content."""
+        cached = self._channels.get(channel_id)
+        if cached is None:
+            turns = await self._warm(channel_id)
+        else:
+            version = await get_redis().get(f"{history_key(channel_id)}:version")
+            if int(version or 0) == cached[0]:
+                self._channels.move_to_end(channel_id)
+                turns = list(cached[1])
+            else:
+                # Another replica wrote to this channel.
+                turns = await self._warm(channel_id)
+        return turns[-limit:] if limit else []
+
+    async def append(self, channel_id, turns):
+        """Persist turns with one MULTI/EXEC and add them to the cached copy."""
+        if not turns:
+            return
+        key = history_key(channel_id)
+        version = await push_capped(key, [json.dumps(turn) for turn in turns], self.max_length,
+                                    counter_key=f"{key}:version")
+        cached = self._channels.get(channel_id)
+        if cached is not None and cached[0] == version - len(turns):
+            cached[1].extend(turns)
+            self._channels[channel_id] = (version, cached[1])
+        else:
+            # Nothing cached yet or someone else wrote in between; warm on the next read.
+            self._channels.pop(channel_id, None)
+
+    async def clear(self, channel_id):
+        key = history_key(channel_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.incr(f"{key}:version")
+            await pipe.execute()
+        self._channels.pop(channel_id, None)
+
+history_cache = HistoryCache()
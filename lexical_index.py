@@ -0,0 +1,194 @@
+# lexical_index.py
+"""
+BM25 inverted index over the stored messages, kept in Redis next to each embedding list.
+
+Usage:
+    python lexical_index.py --rebuild [--key tater:global:embeddings]
+
+For an embedding list <key> the index uses
+    <key>:lex:term:<term>   sorted set: document id -> term frequency
+    <key>:lex:docs          hash: document id -> document length in tokens
+    <key>:lex:total         total number of indexed tokens
+Document ids are derived from the content hash of the text, the same hash used to
+skip duplicates, so the index can be updated one message at a time.
+"""
+import os
+import re
+import math
+import argparse
+import logging
+import redis
+from dotenv import load_dotenv
+from embedding_record import decode_record, content_hash
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
+redis_port = int(os.getenv('REDIS_PORT', 6379))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longest posting list read per query term; very common terms only contribute their best matches.
+MAX_POSTINGS_PER_TERM = 1000
+
+_WORD_RE = re.compile(r"\w+")
+# Links, file and torrent names are also indexed whole so they can be matched exactly.
+_COMPOUND_RE = re.compile(r"\S*[./:]\S*")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in is it its me my no not of on or so
+that the this to was we were what when where which who will with you your
+""".split())
+
+def tokenize(text):
+    """Lowercased word tokens, plus whole URL-like tokens, without stopwords."""
+    text = (text or "").lower()
+    tokens = [token for token in _WORD_RE.findall(text) if len(token) > 1 and token not in _STOPWORDS]
+    for compound in _COMPOUND_RE.findall(text):
+        compound = compound.strip("()[]<>{}\"'.,;!?")
+        if len(compound) > 3:
+            tokens.append(compound)
+    return tokens
+
+def doc_id(text):
+    """Integer document id of a stored text (60 bits of its content hash)."""
+    return int(content_hash(text)[:15], 16)
+
+def _term_counts(text, username):
+    counts = {}
+    for token in tokenize(f"{username} {text}"):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+class LexicalIndex:
+    """
+    BM25 index for one embedding list. Updates are queued on a pipeline supplied by
+    the caller, so they work with both the synchronous and the asyncio Redis clients.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.term_prefix = f"{key}:lex:term:"
+        self.docs_key = f"{key}:lex:docs"
+        self.total_key = f"{key}:lex:total"
+
+    def add(self, pipe, text, username):
+        """Queue the commands that index a message."""
+        counts = _term_counts(text, username)
+        if not counts:
+            return
+        member = doc_id(text)
+        for term, count in counts.items():
+            pipe.zadd(f"{self.term_prefix}{term}", {member: count})
+        pipe.hset(self.docs_key, member, sum(counts.values()))
+        pipe.incrby(self.total_key, sum(counts.values()))
+
+    def remove(self, pipe, text, username):
+        """Queue the commands that drop a message from the index."""
+        counts = _term_counts(text, username)
+        if not counts:
+            return
+        member = doc_id(text)
+        for term in counts:
+            pipe.zrem(f"{self.term_prefix}{term}", member)
+        pipe.hdel(self.docs_key, member)
+        pipe.decrby(self.total_key, sum(counts.values()))
+
+    def clear(self, client, batch_size=1000):
+        for keys in _batched(client.scan_iter(match=f"{self.term_prefix}*", count=batch_size), batch_size):
+            client.delete(*keys)
+        client.delete(self.docs_key, self.total_key)
+
+    async def search(self, client, query, limit=300):
+        """Return up to limit (document id, BM25 score) pairs, best first, using an asyncio client."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.hlen(self.docs_key)
+            pipe.get(self.total_key)
+            for term in terms:
+                pipe.zcard(f"{self.term_prefix}{term}")
+                pipe.zrevrange(f"{self.term_prefix}{term}", 0, MAX_POSTINGS_PER_TERM - 1, withscores=True)
+            results = await pipe.execute()
+        doc_count, total = results[0], int(results[1] or 0)
+        if not doc_count:
+            return []
+        avg_length = max(total / doc_count, 1.0)
+
+        postings = []
+        for position in range(len(terms)):
+            df, entries = results[2 + 2 * position], results[3 + 2 * position]
+            if df:
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                postings.append((idf, entries))
+        candidates = list({int(member) for _, entries in postings for member, _ in entries})
+        if not candidates:
+            return []
+        lengths = dict(zip(candidates, await client.hmget(self.docs_key, candidates)))
+
+        scores = {}
+        for idf, entries in postings:
+            for member, tf in entries:
+                member = int(member)
+                length = float(lengths.get(member) or avg_length)
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[member] = scores.get(member, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def rebuild(client, key, batch_size=1000):
+    """Rebuild the index of an embedding list from scratch. Returns the number of indexed messages."""
+    index = LexicalIndex(key)
+    index.clear(client, batch_size)
+    indexed = 0
+    length = client.llen(key)
+    for start in range(0, length, batch_size):
+        with client.pipeline(transaction=False) as pipe:
+            for raw in client.lrange(key, start, start + batch_size - 1):
+                try:
+                    record = decode_record(raw)
+                except Exception:
+                    continue
+                if record is None:
+                    continue
+                index.add(pipe, record["text"], record["username"])
+                indexed += 1
+            pipe.execute()
+        logger.info(f"Indexed {min(length, start + batch_size)} of {length} entries...")
+    return indexed
+
+def main():
+    from vector_store import GLOBAL_NAMESPACE, NAMESPACES_KEY, namespace_key
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Maintain the lexical (BM25) index of the stored embeddings.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the stored messages.")
+    parser.add_argument("--key", help="Only this embedding list (default: every namespace).")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+
+    client = redis.Redis(host=redis_host, port=redis_port, db=0)
+    if args.key:
+        keys = [args.key]
+    else:
+        namespaces = [GLOBAL_NAMESPACE] + sorted(ns.decode() for ns in client.smembers(NAMESPACES_KEY))
+        keys = [namespace_key(ns) for ns in namespaces]
+    for key in keys:
+        print(f"{key}: indexed {rebuild(client, key, batch_size=args.batch_size):,} messages")
+
+if __name__ == "__main__":
+    main()
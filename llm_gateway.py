@@ -0,0 +1,586 @@
+# llm_gateway.py
+"""
+The one way to reach Ollama, for coroutines and for worker threads alike.
+
+    from llm_gateway import gateway
+    response = await gateway.chat(model=..., messages=[...])        # ollama.AsyncClient API
+    response = gateway.generate_sync(model=..., prompt="...")        # ollama.Client API
+
+The gateway keeps long-lived pooled HTTP connections (one httpx client per host
+and event loop for async calls, since those connections belong to the loop that
+opened them, and one shared client per host for threads), takes a slot from the
+llm_scheduler before every attempt, applies a per-call timeout, and retries
+connection errors, timeouts and 5xx responses up to OLLAMA_RETRIES times with
+jittered exponential backoff. Client errors (4xx) are raised at once. Loops should
+be long-lived; one that is shut down awaits close_loop_clients() first.
+
+Several Ollama hosts can be listed in OLLAMA_HOSTS (chat) and OLLAMA_EMB_HOSTS
+(embeddings). Each attempt goes to the healthy host with the fewest outstanding
+requests, preferring hosts that already have the model loaded so keep_alive=-1
+keeps paying off. A background thread polls /api/ps on every host for health
+and loaded models; a host that refuses connections is taken out of rotation
+until it answers again, and the failed request moves to another host at once.
+
+Each gateway has a circuit breaker. When too many recent calls failed or were
+too slow, it opens: calls raise LLMUnavailable at once instead of piling onto a
+struggling backend, and callers answer with static text. A background probe
+polls the hosts every LLM_BREAKER_COOLDOWN seconds; once one answers, a single
+trial call decides whether the breaker closes again.
+
+Latency and token counts of every call are accounted per call kind and model;
+stats() returns the totals and each call is logged at debug level.
+"""
+import os
+import time
+import random
+import collections
+import asyncio
+import weakref
+import threading
+import logging
+import httpx
+import ollama
+from dotenv import load_dotenv
+from llm_scheduler import scheduler, current_priority, EMBEDDING_POOL
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+ollama_host = os.getenv('OLLAMA_HOST', '127.0.0.1').strip()
+ollama_port = int(os.getenv('OLLAMA_PORT', 11434))
+ollama_url = f"http://{ollama_host}:{ollama_port}"
+
+def parse_hosts(value, default_port=11434):
+    """Comma-separated host[:port] or URLs -> list of base URLs."""
+    urls = []
+    for host in (value or "").split(","):
+        host = host.strip().rstrip("/")
+        if not host:
+            continue
+        if "://" not in host:
+            host = f"http://{host}"
+        if host.count(":") < 2:
+            host = f"{host}:{default_port}"
+        if host not in urls:
+            urls.append(host)
+    return urls
+
+# Hosts for chat/generate and for embeddings; both default to OLLAMA_HOST:OLLAMA_PORT.
+ollama_hosts = parse_hosts(os.getenv('OLLAMA_HOSTS')) or [ollama_url]
+ollama_emb_hosts = parse_hosts(os.getenv('OLLAMA_EMB_HOSTS')) or ollama_hosts
+# Seconds between health checks of the hosts (0 disables them).
+ollama_health_interval = float(os.getenv('OLLAMA_HEALTH_INTERVAL', 15))
+# Seconds without data before a request fails; generations of long summaries can take a while.
+ollama_timeout = float(os.getenv('OLLAMA_TIMEOUT', 300))
+ollama_connect_timeout = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', 5))
+# Extra attempts after a failed request (connection errors, timeouts, 5xx).
+ollama_retries = int(os.getenv('OLLAMA_RETRIES', 2))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# Circuit breaker: over the last LLM_BREAKER_WINDOW calls (at least LLM_BREAKER_MIN_CALLS),
+# open when the failure rate or the rate of calls slower than LLM_BREAKER_SLOW_SECONDS is reached.
+llm_breaker_window = int(os.getenv('LLM_BREAKER_WINDOW', 20))
+llm_breaker_min_calls = int(os.getenv('LLM_BREAKER_MIN_CALLS', 5))
+llm_breaker_failure_rate = float(os.getenv('LLM_BREAKER_FAILURE_RATE', 0.5))
+llm_breaker_slow_seconds = float(os.getenv('LLM_BREAKER_SLOW_SECONDS', 120))
+llm_breaker_slow_rate = float(os.getenv('LLM_BREAKER_SLOW_RATE', 0.8))
+# Seconds between recovery probes while the breaker is open.
+llm_breaker_cooldown = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+
+def is_connection_error(error):
+    """Errors that mean the host itself is unreachable, as opposed to a failed request."""
+    return isinstance(error, (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout))
+
+def model_key(model):
+    """Model names as /api/ps reports them (an untagged name means :latest)."""
+    return model if not model or ":" in model else f"{model}:latest"
+
+def is_retryable(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError, TimeoutError))
+
+def describe(error):
+    return str(error) or type(error).__name__
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff: uniform in [0, base * 2^attempt], capped."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+class _Accounting:
+    """Call, error, latency and token totals per (call kind, model)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, kind, model, latency, response=None, error=None, retries=0):
+        prompt_tokens = eval_tokens = 0
+        if response is not None:
+            prompt_tokens = response.get("prompt_eval_count") or 0
+            eval_tokens = response.get("eval_count") or 0
+        with self._lock:
+            totals = self._totals.setdefault(f"{kind}:{model}", {
+                "calls": 0, "errors": 0, "retries": 0, "latency_s": 0.0, "prompt_tokens": 0, "eval_tokens": 0
+            })
+            totals["calls"] += 1
+            totals["errors"] += 1 if error is not None else 0
+            totals["retries"] += retries
+            totals["latency_s"] += latency
+            totals["prompt_tokens"] += prompt_tokens
+            totals["eval_tokens"] += eval_tokens
+        if error is not None:
+            logger.error(f"LLM {kind} {model} failed after {latency * 1000:.0f} ms and {retries} retries: {describe(error)}")
+        else:
+            logger.debug(f"LLM {kind} {model}: {latency * 1000:.0f} ms, {prompt_tokens} prompt / {eval_tokens} generated tokens")
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for name, totals in self._totals.items():
+                stats[name] = dict(totals)
+                stats[name]["avg_latency_ms"] = totals["latency_s"] / totals["calls"] * 1000.0 if totals["calls"] else 0.0
+            return stats
+
+class LLMUnavailable(Exception):
+    """Raised without contacting Ollama while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    closed     calls go through; their outcomes are kept in a rolling window
+    open       calls fail at once; a background thread probes the hosts
+    half_open  a probe succeeded; one trial call at a time closes or reopens the breaker
+    """
+
+    def __init__(self, name, hosts, pool, window=llm_breaker_window, min_calls=llm_breaker_min_calls,
+                 failure_rate=llm_breaker_failure_rate, slow_seconds=llm_breaker_slow_seconds,
+                 slow_rate=llm_breaker_slow_rate, cooldown=llm_breaker_cooldown):
+        self.name = name
+        self.hosts = hosts
+        self.pool = pool
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.reason = None
+        self.opened_at = None
+        self.rejected = 0
+        self.trips = 0
+        self._outcomes = collections.deque(maxlen=max(1, window))  # (failed, slow)
+        self._trial = False
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise LLMUnavailable unless a call may go through now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+            reason = self.reason
+        raise LLMUnavailable(f"Ollama ({self.name}) is unavailable: {reason}")
+
+    def record(self, failed, latency=0.0):
+        """The outcome of a call that was let through."""
+        with self._lock:
+            if self.state == "half_open" and self._trial:
+                self._trial = False
+                if failed or latency >= self.slow_seconds:
+                    self._open("the trial request failed" if failed else "the trial request was too slow")
+                else:
+                    self._close()
+                return
+            if self.state != "closed":
+                # Started before the breaker opened.
+                return
+            self._outcomes.append((failed, latency >= self.slow_seconds))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed) / len(self._outcomes)
+            slow = sum(1 for _, slow in self._outcomes if slow) / len(self._outcomes)
+            if failures >= self.failure_rate:
+                self._open(f"{failures:.0%} of the last {len(self._outcomes)} requests failed")
+            elif slow >= self.slow_rate:
+                self._open(f"{slow:.0%} of the last {len(self._outcomes)} requests took over {self.slow_seconds:.0f}s")
+
+    def abandon(self):
+        """A call that was let through was cancelled; free the trial if it was one."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial = False
+
+    def _open(self, reason):
+        # Called with the lock held.
+        self.state = "open"
+        self.reason = reason
+        self.opened_at = time.time()
+        self.trips += 1
+        self._outcomes.clear()
+        logger.warning(f"LLM circuit breaker ({self.name}) opened: {reason}. Failing fast until Ollama recovers.")
+        if not self._probing:
+            self._probing = True
+            threading.Thread(target=self._probe_loop, name=f"llm-breaker-{self.name}", daemon=True).start()
+
+    def _close(self):
+        self.state = "closed"
+        self.reason = None
+        self.opened_at = None
+        logger.info(f"LLM circuit breaker ({self.name}) closed; requests go through again.")
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.cooldown)
+            with self._lock:
+                if self.state == "closed":
+                    self._probing = False
+                    return
+                if self.state != "open":
+                    continue
+            for host in self.hosts:
+                if self.pool.check(host):
+                    with self._lock:
+                        if self.state == "open":
+                            self.state = "half_open"
+                            self._trial = False
+                            logger.info(f"LLM circuit breaker ({self.name}) half-open: {host} answers, letting one request through.")
+                    break
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "reason": self.reason,
+                "open_for_s": time.time() - self.opened_at if self.opened_at else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": sum(1 for failed, _ in self._outcomes if failed)
+            }
+
+class _HostState:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        self.loaded = set()
+        self.last_error = None
+        self.last_check = 0.0
+
+class HostPool:
+    """Health and loaded models of every known Ollama host, shared by all gateways."""
+
+    def __init__(self, interval=ollama_health_interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._checker = None
+
+    def register(self, urls):
+        with self._lock:
+            for url in urls:
+                self._hosts.setdefault(url, _HostState(url))
+
+    def _state(self, url):
+        with self._lock:
+            return self._hosts.setdefault(url, _HostState(url))
+
+    def is_healthy(self, url):
+        return self._state(url).healthy
+
+    def has_model(self, url, model):
+        return model_key(model) in self._state(url).loaded
+
+    def mark_ok(self, url, model=None):
+        state = self._state(url)
+        if not state.healthy:
+            logger.info(f"Ollama host {url} is back.")
+        state.healthy = True
+        state.last_error = None
+        if model:
+            state.loaded.add(model_key(model))
+
+    def mark_failed(self, url, error):
+        state = self._state(url)
+        if state.healthy:
+            logger.warning(f"Ollama host {url} is down ({describe(error)}); routing around it.")
+        state.healthy = False
+        state.last_error = describe(error)
+
+    def check(self, url):
+        """Ask a host which models it has loaded; marks it healthy or down."""
+        state = self._state(url)
+        state.last_check = time.time()
+        try:
+            response = httpx.get(f"{url}/api/ps", timeout=ollama_connect_timeout)
+            response.raise_for_status()
+            state.loaded = {model_key(entry.get("name") or entry.get("model")) for entry in response.json().get("models", [])}
+        except Exception as e:
+            self.mark_failed(url, e)
+            return False
+        self.mark_ok(url)
+        return True
+
+    def _check_loop(self):
+        while True:
+            with self._lock:
+                urls = list(self._hosts)
+            for url in urls:
+                self.check(url)
+            time.sleep(self.interval)
+
+    def start_health_checks(self):
+        """Start the background checker once, if it is enabled."""
+        with self._lock:
+            if self._checker is not None or self.interval <= 0:
+                return
+            self._checker = threading.Thread(target=self._check_loop, name="ollama-health", daemon=True)
+        self._checker.start()
+
+    def stats(self):
+        with self._lock:
+            states = list(self._hosts.values())
+        return {
+            state.url: {
+                "healthy": state.healthy,
+                "loaded": sorted(state.loaded),
+                "outstanding": scheduler.outstanding(state.url),
+                "last_error": state.last_error
+            }
+            for state in states
+        }
+
+host_pool = HostPool()
+
+class OllamaGateway:
+    """Pooled, scheduled and retried access to a set of Ollama hosts."""
+
+    def __init__(self, hosts=None, timeout=ollama_timeout, retries=ollama_retries, pool=host_pool, name="chat"):
+        self.hosts = list(hosts or ollama_hosts)
+        self.timeout = timeout
+        self.retries = retries
+        self.pool = pool
+        self.pool.register(self.hosts)
+        self.name = name  # Also the scheduler pool its requests take slots from.
+        self.breaker = CircuitBreaker(name, self.hosts, pool)
+        self.accounting = _Accounting()
+        self._async_clients = weakref.WeakKeyDictionary()  # loop -> {host: ollama.AsyncClient}
+        self._sync_clients = {}
+        self._sync_lock = threading.Lock()
+
+    def _httpx_timeout(self):
+        return httpx.Timeout(self.timeout, connect=ollama_connect_timeout)
+
+    def _async_client(self, host):
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.get(loop)
+        if clients is None:
+            clients = {}
+            self._async_clients[loop] = clients
+        client = clients.get(host)
+        if client is None:
+            client = ollama.AsyncClient(host=host, timeout=self._httpx_timeout())
+            clients[host] = client
+        return client
+
+    def _client(self, host):
+        with self._sync_lock:
+            client = self._sync_clients.get(host)
+            if client is None:
+                client = ollama.Client(host=host, timeout=self._httpx_timeout())
+                self._sync_clients[host] = client
+            return client
+
+    def pick_host(self, model, tried=()):
+        """
+        The host for the next attempt: healthy and not yet tried in this call if possible,
+        with the fewest outstanding requests. A host without the model loaded counts as
+        carrying one full batch more, so a cold host only takes over when the warm ones
+        are backed up.
+        """
+        if len(self.hosts) == 1:
+            return self.hosts[0]
+        self.pool.start_health_checks()
+        candidates = [host for host in self.hosts if host not in tried and self.pool.is_healthy(host)]
+        if not candidates:
+            candidates = [host for host in self.hosts if host not in tried] or list(self.hosts)
+        cold_penalty = scheduler.limit(self.name) if model else 0
+
+        def load(host):
+            return scheduler.outstanding(host, self.name) + (0 if self.pool.has_model(host, model) else cold_penalty)
+        return min(candidates, key=load)
+
+    def _failed(self, kind, model, host, error, attempt, tried):
+        """Bookkeeping after a failed attempt. Returns the delay before the next one, or None to give up."""
+        if is_connection_error(error):
+            self.pool.mark_failed(host, error)
+        if attempt >= self.retries or not is_retryable(error):
+            return None
+        tried.add(host)
+        # Another host is tried right away; the same host only after a backoff.
+        if len(self.hosts) > 1 and any(other not in tried for other in self.hosts):
+            logger.warning(f"LLM {kind} {model} failed on {host} ({describe(error)}); failing over.")
+            return 0.0
+        delay = retry_delay(attempt)
+        logger.warning(f"LLM {kind} {model} failed on {host} ({describe(error)}); retrying in {delay:.1f}s.")
+        return delay
+
+    def _gave_up(self, kind, model, start, error, attempt):
+        # Only backend trouble counts against the breaker; a rejected request means Ollama is up.
+        self.breaker.record(is_retryable(error))
+        self.accounting.record(kind, model, time.monotonic() - start, error=error, retries=attempt)
+
+    async def _call(self, kind, model, timeout, request):
+        """Run request(client) with the breaker, host selection, scheduling, timeout and retries."""
+        self.breaker.before_call()
+        try:
+            return await self._attempts(kind, model, timeout, request)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+
+    async def _attempts(self, kind, model, timeout, request):
+        priority = current_priority()
+        start = time.monotonic()
+        tried = set()
+        attempt = 0
+        while True:
+            host = self.pick_host(model, tried)
+            try:
+                async with scheduler.slot(host, priority, self.name):
+                    admitted = time.monotonic()
+                    client = self._async_client(host)
+                    response = await asyncio.wait_for(request(client), timeout) if timeout else await request(client)
+            except Exception as e:
+                delay = self._failed(kind, model, host, e, attempt, tried)
+                if delay is None:
+                    self._gave_up(kind, model, start, e, attempt)
+                    raise
+                attempt += 1
+                if delay:
+                    await asyncio.sleep(delay)
+                continue
+            self.breaker.record(False, time.monotonic() - admitted)
+            self.pool.mark_ok(host, model)
+            self.accounting.record(kind, model, time.monotonic() - start, response, retries=attempt)
+            return response
+
+    def _call_sync(self, kind, model, request):
+        self.breaker.before_call()
+        priority = current_priority()
+        start = time.monotonic()
+        tried = set()
+        attempt = 0
+        while True:
+            host = self.pick_host(model, tried)
+            try:
+                with scheduler.slot_sync(host, priority, self.name):
+                    admitted = time.monotonic()
+                    response = request(self._client(host))
+            except Exception as e:
+                delay = self._failed(kind, model, host, e, attempt, tried)
+                if delay is None:
+                    self._gave_up(kind, model, start, e, attempt)
+                    raise
+                attempt += 1
+                if delay:
+                    time.sleep(delay)
+                continue
+            self.breaker.record(False, time.monotonic() - admitted)
+            self.pool.mark_ok(host, model)
+            self.accounting.record(kind, model, time.monotonic() - start, response, retries=attempt)
+            return response
+
+    async def _stream_chat(self, kwargs):
+        """
+        A streamed chat. The request is retried (or moved to another host) until its
+        first chunk has arrived; after that the slot is held until the stream is
+        consumed or closed.
+        """
+        model = kwargs.get("model")
+        self.breaker.before_call()
+        priority = current_priority()
+        start = time.monotonic()
+        tried = set()
+        attempt = 0
+        try:
+            while True:
+                host = self.pick_host(model, tried)
+                await scheduler.acquire(host, priority, self.name)
+                admitted = time.monotonic()
+                try:
+                    stream = await self._async_client(host).chat(**kwargs)
+                    first = await stream.__anext__()
+                    break
+                except StopAsyncIteration:
+                    scheduler.release(host, self.name)
+                    self.breaker.record(False, time.monotonic() - admitted)
+                    return
+                except Exception as e:
+                    scheduler.release(host, self.name)
+                    delay = self._failed("chat", model, host, e, attempt, tried)
+                    if delay is None:
+                        self._gave_up("chat", model, start, e, attempt)
+                        raise
+                    attempt += 1
+                    if delay:
+                        await asyncio.sleep(delay)
+                except BaseException:
+                    scheduler.release(host, self.name)
+                    raise
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        # For streams the breaker judges the time to the first token.
+        self.breaker.record(False, time.monotonic() - admitted)
+        self.pool.mark_ok(host, model)
+        last = first
+        try:
+            yield first
+            async for part in stream:
+                last = part
+                yield part
+        finally:
+            scheduler.release(host, self.name)
+            self.accounting.record("chat", model, time.monotonic() - start, last if last.get("done") else None, retries=attempt)
+
+    async def chat(self, timeout=None, **kwargs):
+        """ollama.AsyncClient.chat; with stream=True the result is an async iterator of parts."""
+        if kwargs.get("stream"):
+            return self._stream_chat(kwargs)
+        return await self._call("chat", kwargs.get("model"), timeout, lambda client: client.chat(**kwargs))
+
+    async def generate(self, timeout=None, **kwargs):
+        return await self._call("generate", kwargs.get("model"), timeout, lambda client: client.generate(**kwargs))
+
+    async def embed(self, timeout=None, **kwargs):
+        return await self._call("embed", kwargs.get("model"), timeout, lambda client: client.embed(**kwargs))
+
+    async def close_loop_clients(self):
+        """Close and forget the async clients of the running loop; call before the loop is closed."""
+        clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.close()
+
+    def chat_sync(self, **kwargs):
+        """ollama.Client.chat for worker threads (non-streaming)."""
+        return self._call_sync("chat", kwargs.get("model"), lambda client: client.chat(**kwargs))
+
+    def generate_sync(self, **kwargs):
+        """ollama.Client.generate for worker threads (non-streaming)."""
+        return self._call_sync("generate", kwargs.get("model"), lambda client: client.generate(**kwargs))
+
+    def stats(self):
+        return self.accounting.stats()
+
+gateway = OllamaGateway(ollama_hosts, name="chat")
+embedding_gateway = OllamaGateway(ollama_emb_hosts, name=EMBEDDING_POOL)
+
+async def close_loop_clients():
+    """Close both gateways' connections opened on the running loop."""
+    await gateway.close_loop_clients()
+    await embedding_gateway.close_loop_clients()
@@ -0,0 +1,225 @@
+# llm_scheduler.py
+"""
+Admission control for Ollama requests.
+
+The Discord bot, the web UI, the RSS poller and the summarizer threads share the
+same Ollama hosts. Every request first takes one of OLLAMA_MAX_CONCURRENCY slots
+of its host; when all are busy it waits in a priority queue:
+
+    admin        admin DMs
+    interactive  mentions and the response channel
+    webui        the Streamlit chat
+    background   RSS summaries and other housekeeping
+
+Chat/generate and embedding requests have separate slots ("pools") on each host,
+so storing and retrieving memories never waits behind long generations and a
+burst of embeddings never holds up a reply. OLLAMA_EMB_MAX_CONCURRENCY sets the
+size of the embedding pool.
+
+The priority of a request comes from the llm_priority context variable, which
+the entry points set (on_message, the RSS poller, ...). It follows the work into
+asyncio tasks and asyncio.to_thread workers. Waiters can be coroutines on any
+event loop or plain threads, since the bot and the web UI run their own loops.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+# Requests running at once per Ollama host; match the server's OLLAMA_NUM_PARALLEL.
+ollama_max_concurrency = int(os.getenv('OLLAMA_MAX_CONCURRENCY', 2))
+# Embedding requests running at once per host, in addition to the chat slots.
+ollama_emb_max_concurrency = int(os.getenv('OLLAMA_EMB_MAX_CONCURRENCY', ollama_max_concurrency))
+# Waits longer than this are logged with the queue depth.
+SLOW_ADMISSION_SECONDS = 1.0
+
+PRIORITIES = {"admin": 0, "interactive": 1, "webui": 2, "background": 3}
+DEFAULT_PRIORITY = "interactive"
+CHAT_POOL = "chat"
+EMBEDDING_POOL = "embeddings"
+
+llm_priority = contextvars.ContextVar("llm_priority", default=None)
+
+def set_priority(priority):
+    """Set the priority class of the LLM requests made from the current context."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    llm_priority.set(priority)
+
+def current_priority(default=DEFAULT_PRIORITY):
+    return llm_priority.get() or default
+
+class _Waiter:
+    """A queued request, woken from whichever thread releases a slot."""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+    def wake(self):
+        """Hand the slot over. Returns False if the waiter's loop is gone."""
+        if self.future is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._resolve)
+            except RuntimeError:
+                # The event loop was closed while waiting.
+                return False
+        else:
+            self.event.set()
+        self.granted = True
+        return True
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class _HostQueue:
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.heap = []  # (priority, sequence, priority name, waiter)
+        self.granted = {name: 0 for name in PRIORITIES}
+        self.wait_seconds = {name: 0.0 for name in PRIORITIES}
+        self.max_wait = {name: 0.0 for name in PRIORITIES}
+
+class LLMScheduler:
+    """Per-host, per-pool concurrency limit with a priority queue in front of it."""
+
+    def __init__(self, max_concurrency=ollama_max_concurrency, embedding_concurrency=ollama_emb_max_concurrency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limits = {EMBEDDING_POOL: max(1, embedding_concurrency)}
+        self._lock = threading.Lock()
+        self._hosts = {}  # (host, pool) -> _HostQueue
+        self._sequence = itertools.count()
+
+    def limit(self, pool=CHAT_POOL):
+        return self.limits.get(pool, self.max_concurrency)
+
+    def _queue(self, host, pool):
+        queue = self._hosts.get((host, pool))
+        if queue is None:
+            queue = _HostQueue(self.limit(pool))
+            self._hosts[(host, pool)] = queue
+        return queue
+
+    def _enqueue(self, host, pool, priority, waiter):
+        """Take a slot right away or queue the waiter. Returns True if the slot was taken."""
+        with self._lock:
+            queue = self._queue(host, pool)
+            # Slots are handed straight to live waiters, so a free slot means nobody is waiting.
+            if queue.running < queue.limit:
+                queue.running += 1
+                return True
+            heapq.heappush(queue.heap, (PRIORITIES[priority], next(self._sequence), priority, waiter))
+            return False
+
+    def _record(self, host, pool, priority, waited):
+        with self._lock:
+            queue = self._queue(host, pool)
+            queue.granted[priority] += 1
+            queue.wait_seconds[priority] += waited
+            queue.max_wait[priority] = max(queue.max_wait[priority], waited)
+            depth = len(queue.heap)
+        if waited >= SLOW_ADMISSION_SECONDS:
+            logger.info(f"LLM request ({pool}, {priority}) waited {waited:.1f}s for {host}; {depth} still queued.")
+
+    def release(self, host, pool=CHAT_POOL):
+        """Free a slot and hand it to the most urgent live waiter."""
+        with self._lock:
+            queue = self._queue(host, pool)
+            while queue.heap:
+                _, _, _, waiter = heapq.heappop(queue.heap)
+                # The slot passes straight to the waiter; running stays the same.
+                if not waiter.abandoned and waiter.wake():
+                    return
+            queue.running -= 1
+
+    def _abandon(self, host, pool, waiter):
+        """A waiter gave up (cancelled); give back the slot if it had already been handed over."""
+        with self._lock:
+            waiter.abandoned = True
+            granted = waiter.granted
+        if granted:
+            self.release(host, pool)
+
+    async def acquire(self, host, priority=None, pool=CHAT_POOL):
+        priority = priority or current_priority()
+        start = time.monotonic()
+        waiter = _Waiter(asyncio.get_running_loop())
+        if not self._enqueue(host, pool, priority, waiter):
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._abandon(host, pool, waiter)
+                raise
+        self._record(host, pool, priority, time.monotonic() - start)
+
+    def acquire_sync(self, host, priority=None, pool=CHAT_POOL):
+        priority = priority or current_priority()
+        start = time.monotonic()
+        waiter = _Waiter()
+        if not self._enqueue(host, pool, priority, waiter):
+            waiter.event.wait()
+        self._record(host, pool, priority, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot(self, host, priority=None, pool=CHAT_POOL):
+        await self.acquire(host, priority, pool)
+        try:
+            yield
+        finally:
+            self.release(host, pool)
+
+    @contextmanager
+    def slot_sync(self, host, priority=None, pool=CHAT_POOL):
+        self.acquire_sync(host, priority, pool)
+        try:
+            yield
+        finally:
+            self.release(host, pool)
+
+    def outstanding(self, host, pool=None):
+        """Requests running on or waiting for a host, in one pool or (pool=None) in all of them."""
+        with self._lock:
+            return sum(
+                queue.running + sum(1 for entry in queue.heap if not entry[3].abandoned)
+                for (queue_host, queue_pool), queue in self._hosts.items()
+                if queue_host == host and pool in (None, queue_pool)
+            )
+
+    def stats(self):
+        """Queue depth, running requests and admission waits per (host, pool) and priority."""
+        with self._lock:
+            stats = {}
+            for key, queue in self._hosts.items():
+                queued = {name: 0 for name in PRIORITIES}
+                for _, _, name, waiter in queue.heap:
+                    if not waiter.abandoned:
+                        queued[name] += 1
+                stats[key] = {
+                    "running": queue.running,
+                    "limit": queue.limit,
+                    "queued": queued,
+                    "granted": dict(queue.granted),
+                    "avg_wait_ms": {
+                        name: queue.wait_seconds[name] / queue.granted[name] * 1000.0 if queue.granted[name] else 0.0
+                        for name in PRIORITIES
+                    },
+                    "max_wait_ms": {name: seconds * 1000.0 for name, seconds in queue.max_wait.items()}
+                }
+            return stats
+
+scheduler = LLMScheduler()
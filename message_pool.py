@@ -0,0 +1,187 @@
+# message_pool.py
+"""
+Pre-generated waiting and error messages for the tool calls.
+
+Instead of asking the model for a "please wait" line on every tool call, the bot
+generates MESSAGE_POOL_SIZE variants per tool in the background and keeps them in
+the Redis sets tater:message_pool:<kind>:<tool>. Callers draw one at random with
+SRANDMEMBER and put the user's mention (or name) in front of it. The pools are
+regenerated every MESSAGE_POOL_REFRESH_INTERVAL seconds so the wording keeps
+changing; until the first refresh, or while Ollama is unreachable, the static
+fallbacks below are used.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from dotenv import load_dotenv
+from redis_async import get_redis, replace_set
+from llm_scheduler import set_priority
+from llm_gateway import LLMUnavailable
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+message_pool_size = int(os.getenv('MESSAGE_POOL_SIZE', 10))
+# Seconds between regenerations of the pools; 0 disables generation (fallbacks only).
+message_pool_refresh_interval = int(os.getenv('MESSAGE_POOL_REFRESH_INTERVAL', 21600))
+context_length = int(os.getenv("CONTEXT_LENGTH", 10000))
+
+MESSAGE_POOL_KEY_PREFIX = "tater:message_pool"
+REFRESHED_AT_KEY = f"{MESSAGE_POOL_KEY_PREFIX}:refreshed_at"
+# Longest generated line that is kept; anything longer is usually the model rambling.
+MAX_MESSAGE_LENGTH = 240
+
+# tool -> (what the bot is doing, static fallback)
+WAITING_MESSAGES = {
+    "youtube_summary": ("watch this boring YouTube video for them so they don't have to, and summarize it in a moment",
+                        "Please wait a moment while I summarize the video..."),
+    "web_summary": ("read this boring article for them and provide a summary shortly",
+                    "Please wait a moment while I summarize the webpage..."),
+    "draw_picture": ("draw them a masterpiece",
+                     "Hold on while I create that picture for you..."),
+    "premiumize_download": ("check Premiumize for that URL and retrieve download links for them",
+                            "Hold on while I check Premiumize for that URL..."),
+    "premiumize_torrent": ("check Premiumize for that torrent and retrieve download links for them",
+                           "Hold on while I check Premiumize for that torrent..."),
+    "watch_feed": ("add the RSS feed to the watch list",
+                   "Please wait a moment while I add the RSS feed..."),
+    "unwatch_feed": ("remove the RSS feed from the watch list",
+                     "Please wait a moment while I remove the RSS feed..."),
+    "list_feeds": ("list all currently watched RSS feeds",
+                   "Please wait a moment while I list the RSS feeds..."),
+    "web_search": ("search the web for additional information",
+                   "Please wait a moment while I search the web...")
+}
+
+# tool -> (what went wrong, static fallback); the specific reason is appended by the caller.
+ERROR_MESSAGES = {
+    "youtube_summary": ("summarizing a YouTube video", "Sorry, something went wrong with that video."),
+    "web_summary": ("summarizing a webpage", "Sorry, something went wrong with that webpage."),
+    "draw_picture": ("drawing a picture", "Sorry, I couldn't finish that picture."),
+    "premiumize_download": ("checking Premiumize for a link", "Sorry, Premiumize didn't cooperate."),
+    "premiumize_torrent": ("checking Premiumize for a torrent", "Sorry, Premiumize didn't cooperate."),
+    "web_search": ("searching the web", "Sorry, the web search didn't work out."),
+    "general": ("handling their request", "Sorry, something went wrong.")
+}
+
+# Sent as is while the LLM circuit breaker is open; nothing else can be asked of the model then.
+UNAVAILABLE_MESSAGE = "My brain is taking a short break right now. Please try again in a minute."
+
+def pool_key(kind, tool):
+    return f"{MESSAGE_POOL_KEY_PREFIX}:{kind}:{tool}"
+
+async def _sample(kind, tool, fallback):
+    try:
+        line = await get_redis().srandmember(pool_key(kind, tool))
+    except Exception as e:
+        logger.warning(f"Message pool unavailable, using fallback: {e}")
+        line = None
+    return line or fallback
+
+async def waiting_message(tool, mention):
+    """A waiting line for a tool call, addressed to mention."""
+    fallback = WAITING_MESSAGES.get(tool, ("", "Please wait a moment..."))[1]
+    line = await _sample("waiting", tool, fallback)
+    return f"{mention} {line}" if mention else line
+
+async def error_message(tool, mention, detail=""):
+    """An apology for a failed tool call, addressed to mention, followed by the specific reason."""
+    tool = tool if tool in ERROR_MESSAGES else "general"
+    line = await _sample("error", tool, ERROR_MESSAGES[tool][1])
+    text = f"{mention} {line}" if mention else line
+    return f"{text} {detail}" if detail else text
+
+def unavailable_message(mention):
+    """The static reply for when Ollama is unavailable, addressed to mention."""
+    return f"{mention} {UNAVAILABLE_MESSAGE}" if mention else UNAVAILABLE_MESSAGE
+
+def _generation_prompt(kind, activity, count):
+    if kind == "waiting":
+        task = f"telling a user to wait a moment while you {activity}"
+    else:
+        task = f"apologizing to a user because something went wrong while {activity}, without explaining the cause"
+    return (
+        f"Write {count} different short, friendly, playful one-sentence messages {task}. "
+        "Vary the wording. Do not greet, address or name the user. "
+        'Respond ONLY with a JSON object of the form {"messages": ["...", "..."]}.'
+    )
+
+def _parse_messages(content):
+    try:
+        messages = json.loads(content).get("messages", [])
+    except Exception:
+        return []
+    lines = []
+    for line in messages:
+        if isinstance(line, str):
+            line = line.strip().strip('"').strip()
+            if line and len(line) <= MAX_MESSAGE_LENGTH:
+                lines.append(line)
+    return list(dict.fromkeys(lines))
+
+async def _generate(ollama_client, model, kind, activity, count):
+    response = await ollama_client.chat(
+        model=model,
+        messages=[{"role": "system", "content": _generation_prompt(kind, activity, count)}],
+        stream=False,
+        format="json",
+        keep_alive=-1,
+        options={"num_ctx": context_length, "temperature": 1.0}
+    )
+    return _parse_messages(response['message'].get('content', ''))
+
+async def refresh_pools(ollama_client, model, size=message_pool_size):
+    """Regenerate every pool, one model call per pool. Returns the number of pools replaced."""
+    pools = [("waiting", tool, activity) for tool, (activity, _) in WAITING_MESSAGES.items()]
+    pools += [("error", tool, activity) for tool, (activity, _) in ERROR_MESSAGES.items()]
+    random.shuffle(pools)
+    client = get_redis()
+    refreshed = 0
+    for kind, tool, activity in pools:
+        try:
+            lines = await _generate(ollama_client, model, kind, activity, size)
+        except LLMUnavailable as e:
+            logger.warning(f"Skipping the message pool refresh: {e}")
+            break
+        except Exception as e:
+            logger.error(f"Error generating {kind} messages for {tool}: {e}")
+            continue
+        if not lines:
+            logger.warning(f"No usable {kind} messages generated for {tool}; keeping the current pool.")
+            continue
+        # Swap the whole set at once so readers never see it empty.
+        await replace_set(pool_key(kind, tool), lines)
+        refreshed += 1
+    if refreshed:
+        await client.set(REFRESHED_AT_KEY, time.time())
+    return refreshed
+
+async def message_pool_loop(ollama_client, model, interval=message_pool_refresh_interval):
+    """
+    Background task for the bot: keep the pools fresh. The time of the last refresh
+    is stored in Redis, so restarts and other replicas don't regenerate early.
+    """
+    if interval <= 0:
+        return
+    set_priority("background")
+    while True:
+        try:
+            refreshed_at = float(await get_redis().get(REFRESHED_AT_KEY) or 0)
+            due_in = refreshed_at + interval - time.time()
+            if due_in > 0:
+                await asyncio.sleep(due_in)
+                continue
+            refreshed = await refresh_pools(ollama_client, model)
+            logger.info(f"Refreshed {refreshed} message pool(s).")
+            if not refreshed:
+                # Ollama is probably down; try again later instead of hammering it.
+                await asyncio.sleep(300)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing message pools: {e}")
+            await asyncio.sleep(60)
@@ -0,0 +1,143 @@
+# migrate_embeddings.py
+"""
+Convert the legacy JSON records in tater:global:embeddings and the per-namespace
+embedding lists (tater:embeddings:<namespace>) to the binary record format.
+
+Usage:
+    python migrate_embeddings.py [--dtype float32|float16] [--batch-size 1000] [--key KEY]
+
+Each list is rewritten into a temporary key and swapped in with RENAME, so readers
+never see a half-migrated list. Entries appended while the migration runs are
+picked up before the swap. The content-hash index (<key>:hashes) used to skip
+duplicate saves is rebuilt in the same transaction.
+"""
+import os
+import argparse
+import logging
+from collections import Counter
+import redis
+from dotenv import load_dotenv
+from embedding_record import encode_record, decode_record, is_binary_record, content_hash
+from compact_embeddings import embedding_keys
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("tater.migrate")
+
+redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
+redis_port = int(os.getenv('REDIS_PORT', 6379))
+
+GLOBAL_EMBEDDINGS_KEY = "tater:global:embeddings"
+
+def memory_usage(client, key):
+    """Exact memory used by a key in bytes (0 if the key does not exist)."""
+    return client.memory_usage(key, samples=0) or 0
+
+def convert_entry(raw, dtype):
+    """
+    Return (binary form, text) of a stored entry, or (None, None) if it holds no
+    usable embedding. Binary entries are returned as they are.
+    """
+    record = decode_record(raw)
+    if record is None:
+        return None, None
+    if is_binary_record(raw):
+        return raw, record["text"]
+    return encode_record(record["text"], record["embedding"], record["username"], dtype=dtype), record["text"]
+
+def migrate(client, key=GLOBAL_EMBEDDINGS_KEY, dtype="float32", batch_size=1000):
+    temp_key = f"{key}:migrating"
+    seq_key = f"{key}:seq"
+    hashes_key = f"{key}:hashes"
+    memory_before = memory_usage(client, key)
+    client.delete(temp_key)
+    hashes = []  # Content hash of every entry in the temporary list, in list order.
+
+    stats = {"converted": 0, "already_binary": 0, "dropped": 0}
+    position = 0
+    while True:
+        # Convert everything up to the current end of the list.
+        while True:
+            batch = client.lrange(key, position, position + batch_size - 1)
+            if not batch:
+                break
+            converted = []
+            for offset, raw in enumerate(batch):
+                try:
+                    entry, text = convert_entry(raw, dtype)
+                except Exception as e:
+                    logger.error(f"Dropping undecodable entry at index {position + offset}: {e}")
+                    entry = None
+                if entry is None:
+                    stats["dropped"] += 1
+                    continue
+                if entry is raw:
+                    stats["already_binary"] += 1
+                else:
+                    stats["converted"] += 1
+                converted.append(entry)
+                hashes.append(content_hash(text))
+            if converted:
+                client.rpush(temp_key, *converted)
+            position += len(batch)
+            logger.info(f"Processed {position} entries...")
+
+        # Swap the lists, unless more entries were appended in the meantime.
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key, seq_key)
+                if pipe.llen(key) != position:
+                    continue
+                seq = pipe.get(seq_key)
+                seq = int(seq) if seq is not None else position
+                pipe.multi()
+                if client.exists(temp_key):
+                    pipe.rename(temp_key, key)
+                else:
+                    pipe.delete(key)
+                # The newest entry keeps the current sequence number and each older one
+                # counts down, as SAVE_SCRIPT numbers them, so the EMBEDDING_MAX_ENTRIES
+                # trim keeps the hash index in step with the list.
+                pipe.delete(hashes_key)
+                first = seq - len(hashes) + 1
+                for start in range(0, len(hashes), batch_size):
+                    pipe.zadd(hashes_key, {
+                        text_hash: first + start + offset
+                        for offset, text_hash in enumerate(hashes[start:start + batch_size])
+                    })
+                # Tell running bots to reload their in-memory index.
+                pipe.incr(f"{key}:generation")
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+
+    memory_after = memory_usage(client, key)
+    stats["bytes_before"] = memory_before
+    stats["bytes_after"] = memory_after
+    stats["bytes_saved"] = memory_before - memory_after
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate stored embeddings to the binary record format.")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default=os.getenv("EMBEDDING_DTYPE", "float32").strip())
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--key", help="Migrate only this list (default: every embedding list)")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=redis_host, port=redis_port, db=0)
+    stats = Counter()
+    for key in [args.key] if args.key else embedding_keys(client):
+        logger.info(f"Migrating {key}...")
+        stats.update(migrate(client, key=key, dtype=args.dtype, batch_size=args.batch_size))
+    saved_pct = (100.0 * stats["bytes_saved"] / stats["bytes_before"]) if stats["bytes_before"] else 0.0
+    print(
+        f"Converted {stats['converted']} entries, {stats['already_binary']} were already binary, "
+        f"dropped {stats['dropped']} unusable entries.\n"
+        f"Memory: {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes "
+        f"(saved {stats['bytes_saved']:,} bytes, {saved_pct:.1f}%)."
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# prepare.py
+"""
+The work before the main chat call, with independent stages overlapped.
+
+    embed ──┬── save       store the message in memory
+            └── retrieve   find similar stored messages
+    history                recent turns of the conversation; needs nothing else
+
+Saving and retrieval both only need the embedding, and the history doesn't need
+it at all, so the request waits for the longest path (embed + the slower of save
+and retrieve, or the history) instead of the sum of all four. Every stage is
+timed and one line per request reports the stages, the wall time and how much
+of the serial time the overlap saved before the chat call could start.
+"""
+import time
+import asyncio
+import logging
+from embed import generate_embedding, save_embedding, find_relevant_context
+
+logger = logging.getLogger("discord.tater")
+
+# Shorter messages are neither stored nor used for retrieval.
+MIN_EMBED_LENGTH = 30
+
+class StageTimer:
+    """Wall time of the named stages of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = {}
+
+    async def run(self, name, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000.0
+
+    def log(self, label):
+        wall = (time.perf_counter() - self.start) * 1000.0
+        serial = sum(self.timings.values())
+        stages = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items())
+        logger.info(f"Prepared {label} request in {wall:.0f} ms ({stages}; {max(serial - wall, 0.0):.0f} ms saved by overlapping)")
+
+async def remember_message(content, username, channel, namespace):
+    """Embed and store a message the bot doesn't answer. Returns the embedding or None."""
+    if len(content.strip()) < MIN_EMBED_LENGTH:
+        return None
+    embedding = await generate_embedding(content)
+    if embedding is not None:
+        await save_embedding(content, embedding, username, channel=channel, namespace=namespace)
+    return embedding
+
+async def prepare_request(content, username, channel, namespace, history, label, top_n=10, always_embed=False):
+    """
+    Embed, store and retrieve context for a message while history (an awaitable
+    returning the recent turns) loads. Returns (embedding, relevant_context, history).
+    With always_embed, messages too short for memory are still embedded (for the
+    response cache) but neither stored nor used for retrieval.
+    """
+    timer = StageTimer()
+
+    async def memory():
+        short = len(content.strip()) < MIN_EMBED_LENGTH
+        if short and not always_embed:
+            return None, []
+        embedding = await timer.run("embed", generate_embedding(content))
+        if embedding is None or short:
+            return embedding, []
+        _, context = await asyncio.gather(
+            timer.run("save", save_embedding(content, embedding, username, channel=channel, namespace=namespace)),
+            timer.run("retrieve", find_relevant_context(embedding, top_n=top_n, scope=namespace, query_text=content))
+        )
+        return embedding, context
+
+    (embedding, relevant_context), turns = await asyncio.gather(memory(), timer.run("history", history))
+    # The message itself may or may not be stored by the time retrieval runs; it is the user turn anyway.
+    own = f"{username}: {content}"
+    relevant_context = [text for text in relevant_context if text != own]
+    timer.log(label)
+    return embedding, relevant_context, turns
@@ -0,0 +1,161 @@
+# prompts.py
+"""
+Chat prompt assembly shared by the Discord bot and the web UI.
+
+Ollama keeps the KV cache of the previous request and only evaluates the tokens
+after the longest common prefix. The request is therefore laid out from the most
+to the least stable part:
+
+    system   SYSTEM_PROMPT (built from the tool registry), byte-identical on every request
+    ...      recent history, append-only between trims
+    user     retrieved context for this query, then the user's message
+
+Anything that changes per query goes into the last message, so the tool
+instructions and the history are reused from the cache. log_prompt_stats reports
+how many prompt tokens Ollama actually had to evaluate.
+
+build_messages also keeps the request inside num_ctx (CONTEXT_LENGTH) with a
+rough token estimate: the instructions and the question always go in, retrieved
+snippets and history turns share what is left, and the least useful items (the
+lowest-ranked snippets, the oldest turns) are dropped first.
+"""
+import os
+import math
+import logging
+from dotenv import load_dotenv
+from tools import tools_prompt
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+# Tokens kept free for the answer; num_ctx covers the prompt and the generated tokens.
+context_response_tokens = int(os.getenv('CONTEXT_RESPONSE_TOKENS', 1024))
+# Share of the remaining budget reserved for retrieved context; history gets the rest.
+context_retrieval_share = float(os.getenv('CONTEXT_RETRIEVAL_SHARE', 0.3))
+
+# Chat template tokens around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# Single retrieved snippets are cut to this length.
+MAX_SNIPPET_TOKENS = 256
+CONTEXT_HEADER = "Here is some relevant information retrieved from previously stored knowledge:\n"
+
+# Generated once from the tool registry, so it stays byte-identical between requests.
+SYSTEM_PROMPT = (
+    "You are Tater Totterson, a helpful AI assistant with access to various tools.\n\n"
+    "If you need real-time access to the internet or lack sufficient information, use the 'web_search' tool. \n\n"
+    f"{tools_prompt()}"
+    "If no function is needed, reply normally."
+)
+
+def estimate_tokens(text):
+    """
+    Rough token count without a tokenizer: about four characters per token for
+    prose, but never fewer than 4/3 tokens per word (code, URLs and short words).
+    """
+    if not text:
+        return 0
+    return math.ceil(max(len(text) / 4, len(text.split()) * 4 / 3))
+
+def message_tokens(content):
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+def trim_to_tokens(text, tokens, keep_tail=False):
+    """Shorten text to about tokens tokens, keeping its start (and its end when keep_tail is set)."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    # Characters per token of this particular text, so short-word text is cut further.
+    chars = max(int(tokens * len(text) / estimate_tokens(text)) - 3, 0)
+    if keep_tail:
+        head = chars // 2
+        return f"{text[:head]}...{text[len(text) - (chars - head):]}"
+    return f"{text[:chars]}..."
+
+def context_block(relevant_context):
+    """The retrieved texts as a block that precedes the user's message."""
+    if not relevant_context:
+        return ""
+    context_prompt = CONTEXT_HEADER
+    for text in relevant_context:
+        context_prompt += f"- {text}\n"
+    return context_prompt
+
+def fit_to_budget(history, user_content, relevant_context, context_length):
+    """
+    Trim the variable parts of a request to context_length tokens.
+    Returns (history, user_content, relevant_context) and logs what was cut.
+    """
+    cuts = []
+    budget = context_length - context_response_tokens - message_tokens(SYSTEM_PROMPT)
+
+    # The question always goes in; only a huge one is cut down to half of the budget.
+    question_budget = max(budget // 2, 0) - MESSAGE_OVERHEAD_TOKENS
+    if message_tokens(user_content) > budget // 2:
+        user_content = trim_to_tokens(user_content, question_budget, keep_tail=True)
+        cuts.append(f"trimmed the question to ~{question_budget} tokens")
+    budget = max(budget - message_tokens(user_content), 0)
+
+    # Retrieval gets its share, or more when the history doesn't need its part.
+    history_need = sum(message_tokens(turn["content"]) for turn in history)
+    retrieval_budget = max(int(budget * context_retrieval_share), budget - history_need)
+    kept_context, retrieval_used, trimmed, dropped = [], estimate_tokens(CONTEXT_HEADER), 0, 0
+    for text in relevant_context or []:
+        if estimate_tokens(text) > MAX_SNIPPET_TOKENS:
+            text = trim_to_tokens(text, MAX_SNIPPET_TOKENS)
+            trimmed += 1
+        cost = estimate_tokens(text) + 2
+        if retrieval_used + cost > retrieval_budget:
+            # Snippets come best first, so the ones that no longer fit are the least relevant.
+            dropped += 1
+            continue
+        kept_context.append(text)
+        retrieval_used += cost
+    if trimmed:
+        cuts.append(f"trimmed {trimmed} long context snippet(s)")
+    if dropped:
+        cuts.append(f"dropped {dropped} of {len(relevant_context)} context snippet(s)")
+    if kept_context:
+        budget -= retrieval_used
+
+    # History fills the rest, newest turns first.
+    kept_history = []
+    for turn in reversed(history):
+        cost = message_tokens(turn["content"])
+        if cost > budget:
+            break
+        kept_history.append(turn)
+        budget -= cost
+    kept_history.reverse()
+    if len(kept_history) < len(history):
+        cuts.append(f"dropped {len(history) - len(kept_history)} of {len(history)} oldest history turn(s)")
+
+    if cuts:
+        logger.info(f"Context budget (num_ctx={context_length}): " + ", ".join(cuts) + ".")
+    return kept_history, user_content, kept_context
+
+def build_messages(history, user_content, relevant_context=None, context_length=None):
+    """
+    Messages for a chat request: static system prompt, history, then context and
+    the new message. With context_length the request is fitted to that many tokens.
+    """
+    if context_length:
+        history, user_content, relevant_context = fit_to_budget(history, user_content, relevant_context, context_length)
+    messages_list = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages_list += history
+    context_prompt = context_block(relevant_context)
+    if context_prompt:
+        user_content = f"{context_prompt}\n{user_content}"
+    messages_list.append({"role": "user", "content": user_content})
+    return messages_list
+
+def log_prompt_stats(response, label="chat"):
+    """Log how much of the prompt Ollama evaluated (low counts mean the cached prefix was reused)."""
+    prompt_tokens = response.get("prompt_eval_count")
+    if prompt_tokens is None:
+        return
+    duration_ms = (response.get("prompt_eval_duration") or 0) / 1e6
+    rate = prompt_tokens / (duration_ms / 1000) if duration_ms else 0.0
+    logger.info(
+        f"Prompt stats ({label}): prompt_eval_count={prompt_tokens} "
+        f"prompt_eval_duration={duration_ms:.0f}ms ({rate:.0f} tok/s) eval_count={response.get('eval_count')}"
+    )
@@ -0,0 +1,95 @@
+# redis_async.py
+"""
+Shared asyncio Redis access for the bot, the web UI and the embedding store.
+
+redis.asyncio connections belong to the event loop that opened them. The Discord
+bot and the web UI each run one long-lived loop in a background thread, so each
+loop gets one client (with its own connection pool) per response mode, created on
+first use and shared by every module running on that loop. A loop that is shut
+down awaits close_clients() first.
+"""
+import os
+import json
+import asyncio
+import weakref
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
+redis_port = int(os.getenv('REDIS_PORT', 6379))
+# Connections per event loop; callers wait for a free connection beyond this.
+redis_max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', 32))
+
+_clients = weakref.WeakKeyDictionary()  # loop -> {decode_responses: client}
+_scripts = weakref.WeakKeyDictionary()  # loop -> {script source: registered script}
+
+def get_redis(decode_responses=True):
+    """
+    The shared client of the running event loop. Use decode_responses=False for
+    binary values such as embedding records.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        clients = {}
+        _clients[loop] = clients
+    client = clients.get(decode_responses)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool(
+            host=redis_host,
+            port=redis_port,
+            db=0,
+            decode_responses=decode_responses,
+            max_connections=redis_max_connections,
+            timeout=20
+        )
+        client = aioredis.Redis(connection_pool=pool)
+        clients[decode_responses] = client
+    return client
+
+def get_script(source):
+    """A Lua script registered on the running loop's binary client."""
+    loop = asyncio.get_running_loop()
+    scripts = _scripts.get(loop)
+    if scripts is None:
+        scripts = {}
+        _scripts[loop] = scripts
+    script = scripts.get(source)
+    if script is None:
+        script = get_redis(decode_responses=False).register_script(source)
+        scripts[source] = script
+    return script
+
+async def close_clients():
+    """Close and forget the clients of the running loop; call before the loop is closed."""
+    loop = asyncio.get_running_loop()
+    _scripts.pop(loop, None)
+    for client in _clients.pop(loop, {}).values():
+        await client.aclose()
+
+async def push_capped(key, values, max_length, counter_key=None):
+    """
+    Append values to a list and keep its newest max_length entries, in one MULTI/EXEC.
+    If counter_key is given it is incremented by len(values) in the same transaction
+    and its new value is returned.
+    """
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.rpush(key, *values)
+        pipe.ltrim(key, -max_length, -1)
+        if counter_key is not None:
+            pipe.incrby(counter_key, len(values))
+        results = await pipe.execute()
+    return results[-1] if counter_key is not None else None
+
+async def replace_set(key, members):
+    """Replace the members of a set in one MULTI/EXEC, so readers never see it empty."""
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.sadd(key, *members)
+        await pipe.execute()
+
+async def lrange_json(key, start=0, end=-1):
+    """Read a list of JSON-encoded entries."""
+    return [json.loads(entry) for entry in await get_redis().lrange(key, start, end)]
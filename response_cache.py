@@ -0,0 +1,228 @@
+# response_cache.py
+"""
+Semantic cache of answers to repeated questions (opt-in with RESPONSE_CACHE=true).
+
+Before the main chat call the bot looks up the embedding of the incoming message,
+which it has already computed for memory, among recently answered questions of
+the same memory namespace. If one is at least RESPONSE_CACHE_THRESHOLD similar
+and younger than RESPONSE_CACHE_TTL seconds, its answer is reused instead of
+generating a new one. Replies that call a time-sensitive tool
+(RESPONSE_CACHE_EXCLUDED_TOOLS, web_search by default) are never cached.
+
+Usage:
+    python response_cache.py --stats
+    python response_cache.py --disable-channel <channel id>
+    python response_cache.py --enable-channel <channel id>
+    python response_cache.py --clear
+
+Redis layout, per namespace:
+    tater:response_cache:<namespace>           list of JSON entries (question, answer, created, embedding)
+    tater:response_cache:<namespace>:version   bumped on every write
+and tater:response_cache:disabled_channels (set) and tater:response_cache:stats (hash).
+Like the history cache, each process keeps a normalized copy of the embeddings and
+only rereads a namespace when its version has changed.
+"""
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+import argparse
+import logging
+import numpy as np
+from dotenv import load_dotenv
+from redis_async import get_redis
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+response_cache_enabled = os.getenv('RESPONSE_CACHE', 'false').strip().lower() in ('1', 'true', 'yes')
+response_cache_threshold = float(os.getenv('RESPONSE_CACHE_THRESHOLD', 0.95))
+response_cache_ttl = int(os.getenv('RESPONSE_CACHE_TTL', 86400))
+response_cache_max_entries = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+response_cache_excluded_tools = {
+    tool.strip() for tool in os.getenv('RESPONSE_CACHE_EXCLUDED_TOOLS', 'web_search').split(',') if tool.strip()
+}
+# Channels that never use the cache, in addition to the ones disabled at runtime.
+response_cache_disabled_channels = {
+    channel.strip() for channel in os.getenv('RESPONSE_CACHE_DISABLED_CHANNELS', '').split(',') if channel.strip()
+}
+
+RESPONSE_CACHE_KEY_PREFIX = "tater:response_cache"
+DISABLED_CHANNELS_KEY = f"{RESPONSE_CACHE_KEY_PREFIX}:disabled_channels"
+STATS_KEY = f"{RESPONSE_CACHE_KEY_PREFIX}:stats"
+
+def cache_key(namespace):
+    return f"{RESPONSE_CACHE_KEY_PREFIX}:{namespace}"
+
+# User, role and channel-wide mentions; a reply addressed to someone must not be replayed to others.
+_MENTION_RE = re.compile(r"<@[!&]?\d+>|@everyone|@here")
+
+def is_cacheable(response_json, response_text=""):
+    """
+    Whether a reply may be cached: plain text, or a call to a tool that isn't
+    time-sensitive, that doesn't mention anyone.
+    """
+    if _MENTION_RE.search(response_text or ""):
+        return False
+    if response_json and isinstance(response_json, dict) and "function" in response_json:
+        return response_json.get("function") not in response_cache_excluded_tools
+    return True
+
+def _normalized(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _encode_entry(question, answer, embedding, created):
+    return json.dumps({
+        "question": question,
+        "answer": answer,
+        "created": created,
+        "embedding": base64.b64encode(_normalized(embedding).tobytes()).decode("ascii")
+    })
+
+class ResponseCache:
+    """Per-namespace semantic answer cache backed by Redis."""
+
+    def __init__(self, threshold=response_cache_threshold, ttl=response_cache_ttl, max_entries=response_cache_max_entries):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._namespaces = {}  # namespace -> (version, matrix, answers, created times)
+
+    def _remember(self, namespace, version, raw_entries):
+        vectors, answers, created = [], [], []
+        for raw in raw_entries:
+            try:
+                entry = json.loads(raw)
+                vector = np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32)
+            except Exception:
+                continue
+            if vectors and vector.shape != vectors[0].shape:
+                continue
+            vectors.append(vector)
+            answers.append(entry["answer"])
+            created.append(entry["created"])
+        matrix = np.vstack(vectors) if vectors else None
+        self._namespaces[namespace] = (version, matrix, answers, np.asarray(created, dtype=np.float64))
+
+    async def _record(self, client, field):
+        try:
+            await client.hincrby(STATS_KEY, field, 1)
+        except Exception as e:
+            logger.debug(f"Could not update response cache stats: {e}")
+
+    async def lookup(self, namespace, channel_id, embedding):
+        """The cached answer for a question similar to embedding, or None."""
+        if embedding is None or str(channel_id) in response_cache_disabled_channels:
+            return None
+        key = cache_key(namespace)
+        client = get_redis()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.sismember(DISABLED_CHANNELS_KEY, str(channel_id))
+            pipe.get(f"{key}:version")
+            disabled, version = await pipe.execute()
+        if disabled:
+            return None
+        version = int(version or 0)
+        cached = self._namespaces.get(namespace)
+        if cached is None or cached[0] != version:
+            self._remember(namespace, version, await client.lrange(key, 0, -1))
+            cached = self._namespaces[namespace]
+
+        _, matrix, answers, created = cached
+        query = _normalized(embedding)
+        if matrix is None or matrix.shape[1] != query.shape[0]:
+            await self._record(client, "misses")
+            return None
+        scores = matrix @ query
+        scores[created < time.time() - self.ttl] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            await self._record(client, "misses")
+            return None
+        await self._record(client, "hits")
+        logger.info(f"Response cache hit in {namespace} (similarity {scores[best]:.3f}).")
+        return answers[best]
+
+    async def store(self, namespace, channel_id, question, embedding, answer):
+        """Remember the answer to a question."""
+        if embedding is None or not answer or str(channel_id) in response_cache_disabled_channels:
+            return
+        key = cache_key(namespace)
+        client = get_redis()
+        if await client.sismember(DISABLED_CHANNELS_KEY, str(channel_id)):
+            return
+        created = time.time()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, _encode_entry(question, answer, embedding, created))
+            pipe.ltrim(key, -self.max_entries, -1)
+            # Namespaces that stop asking questions expire as a whole.
+            pipe.expire(key, self.ttl)
+            pipe.incr(f"{key}:version")
+            pipe.expire(f"{key}:version", self.ttl)
+            pipe.hincrby(STATS_KEY, "stores", 1)
+            version = (await pipe.execute())[3]
+        cached = self._namespaces.get(namespace)
+        vector = _normalized(embedding)
+        if cached is not None and cached[0] == version - 1 and (cached[1] is None or cached[1].shape[1] == vector.shape[0]):
+            # Nobody else wrote in between; extend the local copy instead of rereading the list.
+            _, matrix, answers, created_times = cached
+            matrix = vector[None, :] if matrix is None else np.vstack([matrix, vector])[-self.max_entries:]
+            answers = (answers + [answer])[-self.max_entries:]
+            created_times = np.append(created_times, created)[-self.max_entries:]
+            self._namespaces[namespace] = (version, matrix, answers, created_times)
+
+    async def set_channel_enabled(self, channel_id, enabled):
+        client = get_redis()
+        if enabled:
+            await client.srem(DISABLED_CHANNELS_KEY, str(channel_id))
+        else:
+            await client.sadd(DISABLED_CHANNELS_KEY, str(channel_id))
+
+    async def stats(self):
+        """Hit, miss and store counters since the last clear, with the hit rate."""
+        counters = await get_redis().hgetall(STATS_KEY)
+        stats = {name: int(counters.get(name, 0)) for name in ("hits", "misses", "stores")}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    async def clear(self):
+        """Drop every cached answer and reset the stats."""
+        client = get_redis()
+        async for name in client.scan_iter(match=f"{RESPONSE_CACHE_KEY_PREFIX}:*"):
+            if name != DISABLED_CHANNELS_KEY:
+                await client.delete(name)
+        self._namespaces = {}
+
+response_cache = ResponseCache()
+
+async def _run_command(args):
+    if args.disable_channel:
+        await response_cache.set_channel_enabled(args.disable_channel, False)
+        print(f"Response cache disabled for channel {args.disable_channel}.")
+    if args.enable_channel:
+        await response_cache.set_channel_enabled(args.enable_channel, True)
+        print(f"Response cache enabled for channel {args.enable_channel}.")
+    if args.clear:
+        await response_cache.clear()
+        print("Response cache cleared.")
+    stats = await response_cache.stats()
+    disabled = sorted(await get_redis().smembers(DISABLED_CHANNELS_KEY)) + sorted(response_cache_disabled_channels)
+    print(f"hits={stats['hits']} misses={stats['misses']} stores={stats['stores']} hit_rate={stats['hit_rate']:.1%}")
+    print(f"disabled channels: {', '.join(disabled) or 'none'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and manage the semantic response cache.")
+    parser.add_argument("--stats", action="store_true", help="Show hit/miss statistics (always printed).")
+    parser.add_argument("--disable-channel", help="Never use the cache in this channel.")
+    parser.add_argument("--enable-channel", help="Use the cache in this channel again.")
+    parser.add_argument("--clear", action="store_true", help="Drop all cached answers and reset the stats.")
+    asyncio.run(_run_command(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,15 @@ import time
 import os
 import feedparser
 import logging
-import redis
 import discord
+from redis_async import get_redis
+from llm_scheduler import set_priority
 import web  # This module should provide fetch_web_summary, format_summary_for_discord, and split_message
 
 logger = logging.getLogger("discord.rss")
 logger.setLevel(logging.DEBUG)
 
 # Load settings from environment variables
-redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
-redis_port = int(os.getenv('REDIS_PORT', 6379))
 response_channel_id = int(os.getenv("RESPONSE_CHANNEL_ID", 0))
 max_response_length = int(os.getenv("MAX_RESPONSE_LENGTH", 1500))
 POLL_INTERVAL = int(os.getenv("RSS_POLL_INTERVAL", 60))  # seconds between polls
@@ -22,12 +21,11 @@ class RSSManager:
     def __init__(self, bot: discord.Client, rss_channel_id: int):
         self.bot = bot
         self.rss_channel_id = rss_channel_id  # Use this channel for RSS announcements.
-        self.redis = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
         self.feeds_key = "rss:feeds"  # Redis hash: feed_url -> last processed timestamp
 
-    def add_feed(self, feed_url: str) -> bool:
+    async def add_feed(self, feed_url: str) -> bool:
         """Attempts to parse the feed and adds it. Sets its last processed timestamp to avoid reprocessing old entries."""
-        parsed_feed = feedparser.parse(feed_url)
+        parsed_feed = await asyncio.to_thread(feedparser.parse, feed_url)
         if parsed_feed.bozo:
             logger.error(f"Failed to parse feed: {feed_url}")
             return False
@@ -43,17 +41,17 @@ class RSSManager:
             last_ts = time.time()
 
         try:
-            self.redis.hset(self.feeds_key, feed_url, last_ts)
+            await get_redis().hset(self.feeds_key, feed_url, last_ts)
             logger.info(f"Added feed: {feed_url} with last_ts: {last_ts}")
             return True
         except Exception as e:
             logger.error(f"Error adding feed {feed_url}: {e}")
             return False
 
-    def remove_feed(self, feed_url: str) -> bool:
+    async def remove_feed(self, feed_url: str) -> bool:
         """Removes a feed URL from the watched feeds."""
         try:
-            removed = self.redis.hdel(self.feeds_key, feed_url)
+            removed = await get_redis().hdel(self.feeds_key, feed_url)
             if removed:
                 logger.info(f"Removed feed: {feed_url}")
                 return True
@@ -64,10 +62,10 @@ class RSSManager:
             logger.error(f"Error removing feed {feed_url}: {e}")
             return False
 
-    def get_feeds(self) -> dict:
+    async def get_feeds(self) -> dict:
         """Returns a dictionary mapping feed URLs to their last seen published timestamp."""
         try:
-            feeds = self.redis.hgetall(self.feeds_key)
+            feeds = await get_redis().hgetall(self.feeds_key)
             return feeds
         except Exception as e:
             logger.error(f"Error fetching feeds: {e}")
@@ -80,10 +78,9 @@ class RSSManager:
         entry_title = entry.get("title", "No Title")
         link = entry.get("link", "")
         logger.info(f"Processing entry: {entry_title} from {feed_title}")
-        loop = asyncio.get_running_loop()
         try:
-            # Run the summarization (blocking) in an executor
-            summary = await loop.run_in_executor(None, web.fetch_web_summary, link)
+            # Run the summarization (blocking) in a worker thread; it inherits the background priority.
+            summary = await asyncio.to_thread(web.fetch_web_summary, link)
             if summary:
                 formatted_summary = web.format_summary_for_discord(summary)
             else:
@@ -113,8 +110,10 @@ class RSSManager:
 
     async def poll_feeds(self):
         logger.info("Starting RSS feed polling...")
+        # Article summaries wait behind every interactive request.
+        set_priority("background")
         while True:
-            feeds = self.get_feeds()  # {feed_url: last_processed_timestamp (as string)}
+            feeds = await self.get_feeds()  # {feed_url: last_processed_timestamp (as string)}
             for feed_url, last_ts_str in feeds.items():
                 try:
                     last_ts = float(last_ts_str) if last_ts_str else 0.0
@@ -139,7 +138,7 @@ class RSSManager:
                                 new_last_ts = entry_ts
                     # Update the stored timestamp if new articles were processed
                     if new_last_ts > last_ts:
-                        self.redis.hset(self.feeds_key, feed_url, new_last_ts)
+                        await get_redis().hset(self.feeds_key, feed_url, new_last_ts)
                 except Exception as e:
                     logger.error(f"Error processing feed {feed_url}: {e}")
             await asyncio.sleep(POLL_INTERVAL)
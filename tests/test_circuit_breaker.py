@@ -0,0 +1,132 @@
+import time
+import asyncio
+import ollama
+import pytest
+from llm_gateway import CircuitBreaker, LLMUnavailable, OllamaGateway, HostPool
+
+HOST = "http://ollama:11434"
+
+class FakePool:
+    """Stands in for HostPool.check() in the probe thread."""
+
+    def __init__(self, up=False):
+        self.up = up
+        self.checks = 0
+
+    def check(self, host):
+        self.checks += 1
+        return self.up
+
+def breaker(pool=None, **kwargs):
+    settings = dict(window=4, min_calls=4, failure_rate=0.5, slow_seconds=10.0, slow_rate=0.75, cooldown=0.01)
+    settings.update(kwargs)
+    return CircuitBreaker("test", [HOST], pool or FakePool(), **settings)
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def test_stays_closed_below_the_failure_rate():
+    cb = breaker()
+    for failed in (False, True, False, False, False):
+        cb.before_call()
+        cb.record(failed, 0.1)
+    assert cb.state == "closed"
+
+def test_waits_for_min_calls():
+    cb = breaker()
+    for _ in range(3):
+        cb.record(True)
+    assert cb.state == "closed"
+    cb.record(True)
+    assert cb.state == "open"
+
+def test_opens_on_failures_and_fails_fast():
+    cb = breaker(pool=FakePool(up=False))
+    for failed in (True, False, True, False):
+        cb.record(failed)
+    assert cb.state == "open"
+    with pytest.raises(LLMUnavailable):
+        cb.before_call()
+    stats = cb.stats()
+    assert (stats["state"], stats["trips"], stats["rejected"]) == ("open", 1, 1)
+
+def test_opens_on_slow_calls():
+    cb = breaker()
+    for latency in (11.0, 12.0, 1.0, 15.0):
+        cb.record(False, latency)
+    assert cb.state == "open"
+    assert "took over" in cb.reason
+
+def test_half_open_trial_closes_the_breaker():
+    pool = FakePool(up=False)
+    cb = breaker(pool=pool)
+    for _ in range(4):
+        cb.record(True)
+    wait_for(lambda: pool.checks >= 2)
+    assert cb.state == "open"  # The probe keeps failing.
+    pool.up = True
+    wait_for(lambda: cb.state == "half_open")
+    cb.before_call()  # The single trial call.
+    with pytest.raises(LLMUnavailable):
+        cb.before_call()
+    cb.record(False, 0.5)
+    assert cb.state == "closed"
+    cb.before_call()
+
+def test_failed_trial_reopens_the_breaker():
+    pool = FakePool(up=True)
+    cb = breaker(pool=pool)
+    for _ in range(4):
+        cb.record(True)
+    wait_for(lambda: cb.state == "half_open")
+    pool.up = False
+    cb.before_call()
+    cb.record(True)
+    assert cb.state == "open"
+    assert cb.trips == 2
+
+def test_abandoned_trial_lets_another_call_through():
+    cb = breaker(pool=FakePool(up=True))
+    for _ in range(4):
+        cb.record(True)
+    wait_for(lambda: cb.state == "half_open")
+    cb.before_call()
+    cb.abandon()
+    cb.before_call()
+
+def test_gateway_fails_fast_once_open():
+    gateway = OllamaGateway([HOST], retries=0, pool=HostPool(interval=0), name="test")
+    gateway.breaker = breaker()
+    calls = []
+
+    async def failing(client):
+        calls.append(client)
+        raise ollama.ResponseError("server error", 500)
+
+    async def run():
+        for _ in range(4):
+            with pytest.raises(ollama.ResponseError):
+                await gateway._call("chat", "model", None, failing)
+        with pytest.raises(LLMUnavailable):
+            await gateway._call("chat", "model", None, failing)
+
+    asyncio.run(run())
+    assert len(calls) == 4
+
+def test_client_errors_do_not_count():
+    gateway = OllamaGateway([HOST], retries=0, pool=HostPool(interval=0), name="test")
+    gateway.breaker = breaker()
+
+    async def rejected(client):
+        raise ollama.ResponseError("model not found", 404)
+
+    async def run():
+        for _ in range(6):
+            with pytest.raises(ollama.ResponseError):
+                await gateway._call("chat", "model", None, rejected)
+
+    asyncio.run(run())
+    assert gateway.breaker.state == "closed"
@@ -0,0 +1,53 @@
+import json
+import struct
+import numpy as np
+import pytest
+from embedding_record import encode_record, decode_record, content_hash, is_binary_record, RECORD_MAGIC
+
+def test_roundtrip_float32():
+    embedding = np.linspace(-1.0, 1.0, 8, dtype=np.float32)
+    raw = encode_record("hello wörld", embedding, "alice", created_at=1234.5, channel=42)
+    assert is_binary_record(raw)
+    record = decode_record(raw)
+    assert record["text"] == "hello wörld"
+    assert record["username"] == "alice"
+    assert record["channel"] == "42"
+    assert record["created_at"] == 1234.5
+    assert record["embedding"].dtype == np.float32
+    np.testing.assert_array_equal(record["embedding"], embedding)
+
+def test_roundtrip_float16_is_half_the_size():
+    embedding = np.random.default_rng(0).standard_normal(64)
+    raw32 = encode_record("text", embedding, "bob")
+    raw16 = encode_record("text", embedding, "bob", dtype="float16")
+    assert len(raw32) - len(raw16) == 64 * 2
+    record = decode_record(raw16)
+    assert record["embedding"].dtype == np.float16
+    np.testing.assert_allclose(record["embedding"], embedding, atol=1e-2)
+
+def test_empty_fields():
+    record = decode_record(encode_record("", [1.0], None, channel=None))
+    assert (record["text"], record["username"], record["channel"]) == ("", "", "")
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError):
+        encode_record("text", [1.0], "u", dtype="float64")
+
+def test_version_1_records_have_no_channel():
+    vector = np.array([0.5, -0.5], dtype=np.float32)
+    raw = struct.pack("<4sBBHdHI", RECORD_MAGIC, 1, 1, 2, 99.0, 3, 4) + b"bob" + b"text" + vector.tobytes()
+    record = decode_record(raw)
+    assert (record["username"], record["channel"], record["text"], record["created_at"]) == ("bob", "", "text", 99.0)
+    np.testing.assert_array_equal(record["embedding"], vector)
+
+def test_legacy_json_records():
+    raw = json.dumps({"text": "old", "username": "carol", "embedding": json.dumps([0.1, 0.2])})
+    record = decode_record(raw)
+    assert record["text"] == "old"
+    assert record["embedding"] == [0.1, 0.2]
+    assert record["created_at"] is None
+    assert decode_record(json.dumps({"text": "no embedding"})) is None
+
+def test_content_hash_identifies_texts():
+    assert content_hash("a") == content_hash("a")
+    assert content_hash("a") != content_hash("b")
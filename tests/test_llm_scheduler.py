@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import pytest
+from llm_scheduler import LLMScheduler, set_priority, current_priority, CHAT_POOL, EMBEDDING_POOL
+
+HOST = "http://ollama:11434"
+
+def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+
+    async def request(name, priority, hold=0.01):
+        async with scheduler.slot(HOST, priority):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def run():
+        first = asyncio.create_task(request("first", "background", hold=0.05))
+        await asyncio.sleep(0.01)
+        waiting = [
+            asyncio.create_task(request(name, priority))
+            for name, priority in [("background", "background"), ("webui", "webui"), ("interactive", "interactive"), ("admin", "admin")]
+        ]
+        await asyncio.sleep(0.01)
+        queued = scheduler.stats()[(HOST, CHAT_POOL)]["queued"]
+        assert queued == {"admin": 1, "interactive": 1, "webui": 1, "background": 1}
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(run())
+    assert order == ["first", "admin", "interactive", "webui", "background"]
+    stats = scheduler.stats()[(HOST, CHAT_POOL)]
+    assert stats["running"] == 0
+    assert sum(stats["granted"].values()) == 5
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+
+    async def request(name):
+        async with scheduler.slot(HOST, "interactive"):
+            order.append(name)
+            await asyncio.sleep(0.005)
+
+    async def run():
+        await asyncio.gather(*(request(i) for i in range(5)))
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3, 4]
+
+def test_embeddings_have_their_own_slots():
+    scheduler = LLMScheduler(max_concurrency=1, embedding_concurrency=1)
+
+    async def run():
+        chat_started = asyncio.Event()
+        release_chat = asyncio.Event()
+
+        async def chat():
+            async with scheduler.slot(HOST, "background", CHAT_POOL):
+                chat_started.set()
+                await release_chat.wait()
+
+        task = asyncio.create_task(chat())
+        await chat_started.wait()
+        # The chat slot is taken, but an embedding is admitted right away.
+        await asyncio.wait_for(scheduler.acquire(HOST, "interactive", EMBEDDING_POOL), 0.5)
+        assert scheduler.outstanding(HOST, CHAT_POOL) == 1
+        assert scheduler.outstanding(HOST, EMBEDDING_POOL) == 1
+        assert scheduler.outstanding(HOST) == 2
+        scheduler.release(HOST, EMBEDDING_POOL)
+        release_chat.set()
+        await task
+
+    asyncio.run(run())
+    assert scheduler.outstanding(HOST) == 0
+
+def test_cancelled_waiter_does_not_keep_the_slot():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def run():
+        await scheduler.acquire(HOST, "background")
+        waiter = asyncio.create_task(scheduler.acquire(HOST, "admin"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.outstanding(HOST) == 1
+        scheduler.release(HOST)
+        # The slot went back to the pool instead of to the cancelled waiter.
+        await asyncio.wait_for(scheduler.acquire(HOST, "interactive"), 0.5)
+        scheduler.release(HOST)
+
+    asyncio.run(run())
+    assert scheduler.outstanding(HOST) == 0
+
+def test_threads_and_coroutines_share_the_limit():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+
+    def worker():
+        with scheduler.slot_sync(HOST, "background"):
+            order.append("thread")
+
+    async def run():
+        await scheduler.acquire(HOST, "interactive")
+        thread = threading.Thread(target=worker)
+        thread.start()
+        await asyncio.sleep(0.02)
+        assert order == []  # Waiting for the slot held by the coroutine.
+        scheduler.release(HOST)
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(run())
+    assert order == ["thread"]
+    assert scheduler.outstanding(HOST) == 0
+
+def test_priority_follows_the_context():
+    async def run():
+        set_priority("admin")
+        return await asyncio.to_thread(current_priority)
+
+    assert asyncio.run(run()) == "admin"
+    with pytest.raises(ValueError):
+        set_priority("urgent")
+
+def test_embedding_batch_runs_at_its_highest_priority(monkeypatch):
+    import embed
+    seen = []
+
+    class Gateway:
+        async def embed(self, model, input, keep_alive=None):
+            seen.append(current_priority())
+            return {"embeddings": [[float(len(text))] for text in input]}
+
+    monkeypatch.setattr(embed, "embedding_gateway", Gateway())
+
+    async def request(batcher, text, priority):
+        set_priority(priority)
+        return await batcher.embed(text)
+
+    async def run():
+        batcher = embed.EmbeddingBatcher(max_batch_size=3, max_wait=1)
+        # The background caller fills the batch and flushes it.
+        return await asyncio.gather(
+            request(batcher, "a", "webui"), request(batcher, "bb", "admin"), request(batcher, "ccc", "background")
+        )
+
+    assert asyncio.run(run()) == [[1.0], [2.0], [3.0]]
+    assert seen == ["admin"]
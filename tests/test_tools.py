@@ -0,0 +1,110 @@
+import sys
+import json
+import asyncio
+import importlib
+import pytest
+import tools
+from tools import Tool, TOOLS, get_tool, register, tools_prompt
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+class FakeAuthor:
+    name = "alice"
+    mention = "<@1>"
+
+class FakeMessage:
+    def __init__(self, content=""):
+        self.content = content
+        self.author = FakeAuthor()
+        self.channel = FakeChannel()
+        self.attachments = []
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Back redis_async with an in-process fakeredis server."""
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis_async
+    server = fakeredis.FakeServer()
+
+    class FakeAsyncRedisModule:
+        @staticmethod
+        def BlockingConnectionPool(**kwargs):
+            return kwargs
+
+        @staticmethod
+        def Redis(connection_pool):
+            return fakeredis.FakeAsyncRedis(server=server, decode_responses=connection_pool["decode_responses"])
+
+    monkeypatch.setattr(redis_async, "aioredis", FakeAsyncRedisModule)
+    return server
+
+def test_lookup():
+    assert get_tool("web_search") is TOOLS["web_search"]
+    assert get_tool("rm_rf") is None
+    assert get_tool(None) is None
+    assert get_tool(["web_search"]) is None
+
+def test_every_handler_resolves():
+    for tool in TOOLS.values():
+        assert asyncio.iscoroutinefunction(tool.handler), tool.name
+
+def test_handler_module_is_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazy_tool_module.py").write_text(
+        "CALLS = []\n"
+        "async def handle(bot, message, args, memory_ns):\n"
+        "    CALLS.append((args, memory_ns))\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(tools, "TOOLS", {})
+    tool = register(Tool("lazy", "testing", "For tests", {"value": "<value>"}, "lazy_tool_module:handle"))
+    assert "lazy_tool_module" not in sys.modules
+    assert tools.get_tool("lazy") is tool
+
+    asyncio.run(tool.handler(None, FakeMessage(), {"value": 1}, "global"))
+    module = sys.modules["lazy_tool_module"]
+    assert module.CALLS == [({"value": 1}, "global")]
+    assert tool.handler is module.handle
+    monkeypatch.delitem(sys.modules, "lazy_tool_module")
+
+def test_prompt_lists_every_tool_with_a_valid_call():
+    prompt = tools_prompt()
+    for number, tool in enumerate(TOOLS.values(), 1):
+        assert f"{number}. '{tool.name}'" in prompt
+        call = json.loads(tool.call_example())
+        assert call == {"function": tool.name, "arguments": tool.arguments}
+
+def test_system_prompt_is_generated_from_the_registry():
+    prompts = importlib.import_module("prompts")
+    assert tools_prompt() in prompts.SYSTEM_PROMPT
+
+def test_dispatch_feed_tools(fake_redis):
+    bot = object()
+
+    async def call(name, args):
+        message = FakeMessage()
+        await get_tool(name).handler(bot, message, args, "global")
+        return message.channel.sent
+
+    async def run():
+        from redis_async import get_redis
+        await get_redis().hset("rss:feeds", "https://example.com/feed", 0)
+        sent = await call("list_feeds", {})
+        assert sent[-1] == "Currently watched feeds:\nhttps://example.com/feed (last update: 0)"
+        sent = await call("unwatch_feed", {"feed_url": "https://example.com/feed"})
+        assert sent[0].startswith("<@1> ")  # The waiting line.
+        assert sent[-1] == "Stopped watching feed: https://example.com/feed"
+        sent = await call("list_feeds", {})
+        assert sent[-1] == "No RSS feeds are currently being watched."
+        sent = await call("unwatch_feed", {})
+        assert sent[-1] == "No feed URL provided for unwatching."
+
+    asyncio.run(run())
+
+def test_feed_tools_are_not_remembered():
+    assert not get_tool("list_feeds").remember
+    assert get_tool("youtube_summary").remember
@@ -0,0 +1,185 @@
+import numpy as np
+import pytest
+from vector_index import EmbeddingIndex, IVFIndex, create_index
+
+def clustered(count, dim=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+    return [f"text {i}" for i in range(count)], vectors
+
+def brute_force(vectors, query, top_n):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return [f"text {i}" for i in np.argsort(-scores)[:top_n]]
+
+def recall(index, vectors, queries, top_n=10):
+    found = [len({text for text, _ in index.search(q, top_n)} & set(brute_force(vectors, q, top_n))) for q in queries]
+    return sum(found) / (top_n * len(queries))
+
+def test_exact_search_matches_brute_force():
+    texts, vectors = clustered(500)
+    index = EmbeddingIndex()
+    assert index.extend(texts, vectors) == 500
+    for query in vectors[:20]:
+        hits = index.search(query, 5)
+        assert [text for text, _ in hits] == brute_force(vectors, query, 5)
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+def test_exact_search_edge_cases():
+    index = EmbeddingIndex()
+    assert index.search([1.0, 0.0], 3) == []
+    index.extend(["a", "b", "zero"], [[1.0, 0.0], [0.0, 1.0], [0.0, 0.0]])
+    # Mismatched dimensions are skipped, not stored.
+    assert index.add("wrong", [1.0, 0.0, 0.0]) is False
+    assert len(index) == 3
+    assert index.search(None, 3) == []
+    assert dict(index.search([1.0, 0.0], 3)) == pytest.approx({"a": 1.0, "b": 0.0, "zero": 0.0})
+
+def test_search_restricted_to_rows():
+    texts, vectors = clustered(200)
+    index = EmbeddingIndex()
+    index.extend(texts, vectors, ids=list(range(1000, 1200)))
+    rows = index.rows_for([1005, 9999, 1007])
+    assert rows.tolist() == [5, 7]
+    assert {text for text, _ in index.search(vectors[5], 10, rows=rows)} == {"text 5", "text 7"}
+
+def test_ivf_is_exact_until_trained():
+    texts, vectors = clustered(1000)
+    ivf = IVFIndex(train_threshold=500)
+    ivf.extend(texts, vectors)
+    # Adding rows never trains inline; it only marks the index as due.
+    assert ivf.centroids is None and ivf.training_due
+    assert recall(ivf, vectors, vectors[:20]) == 1.0
+
+def test_ivf_recall_after_training():
+    texts, vectors = clustered(8000)
+    ivf = IVFIndex(nprobe=8, train_threshold=0)
+    ivf.extend(texts, vectors)
+    assert ivf.train()
+    assert ivf.centroids.shape == (int(4 * np.sqrt(8000)), 32)
+    queries = vectors[:50] + 0.05
+    assert recall(ivf, vectors, queries) >= 0.9
+    # Probing every list is exact.
+    ivf.nprobe = ivf.centroids.shape[0]
+    assert recall(ivf, vectors, queries) == 1.0
+
+def test_ivf_background_training_swaps_in_atomically():
+    texts, vectors = clustered(6000)
+    ivf = IVFIndex(train_threshold=4096)
+    ivf.extend(texts[:5000], vectors[:5000])
+    job = ivf.training_job()
+    assert job is not None
+    assert ivf.training_job() is None  # Already running.
+    # Rows added while the job runs are searched exactly until they are assigned.
+    ivf.extend(texts[5000:], vectors[5000:])
+    result = job()
+    assert ivf.centroids is None
+    assert ivf.install(result)
+    assert ivf.centroids is not None and len(ivf) == 6000
+    assert not ivf.training_due
+    assert ivf.search(vectors[5500], 1)[0][0] == "text 5500"
+
+def test_ivf_discards_training_of_replaced_rows():
+    texts, vectors = clustered(5000)
+    ivf = IVFIndex(train_threshold=4096)
+    ivf.extend(texts, vectors)
+    job = ivf.training_job()
+    ivf.clear()
+    ivf.extend(texts[:100], vectors[:100])
+    assert not ivf.install(job())
+    assert ivf.centroids is None
+    assert ivf.search(vectors[3], 1)[0][0] == "text 3"
+
+def test_ivf_centroids_persist(tmp_path):
+    texts, vectors = clustered(5000)
+    path = str(tmp_path / "ivf.npz")
+    ivf = IVFIndex(train_threshold=4096, index_path=path)
+    ivf.extend(texts, vectors)
+    ivf.train()
+    restarted = IVFIndex(train_threshold=4096, index_path=path)
+    restarted.extend(texts, vectors)
+    # The saved centroids are loaded and rows assigned without training again.
+    np.testing.assert_array_equal(restarted.centroids, ivf.centroids)
+    assert not restarted.training_due
+
+def test_create_index():
+    assert type(create_index("exact")) is EmbeddingIndex
+    assert isinstance(create_index("ivf", nprobe=4), IVFIndex)
+    with pytest.raises(ValueError):
+        create_index("hnsw")
+
+def test_store_trains_in_the_background(monkeypatch, tmp_path):
+    import asyncio
+    import vector_store
+    monkeypatch.setattr(vector_store, "embedding_index_type", "ivf")
+    monkeypatch.setattr(vector_store, "ivf_train_threshold", 1000)
+    monkeypatch.setattr(vector_store, "ivf_index_path", str(tmp_path / "ivf.npz"))
+    texts, vectors = clustered(3000)
+
+    async def run():
+        store = vector_store.MemoryVectorStore()
+        await store.bulk_add([{"text": text, "embedding": vector, "username": "u"} for text, vector in zip(texts, vectors)])
+        index = store._indexes[vector_store.GLOBAL_NAMESPACE]
+        # Training was handed to a worker thread; searches are answered meanwhile.
+        assert (await store.search(vectors[7], 1))[0][0] == "u: text 7"
+        await vector_store.wait_for_training()
+        assert index.centroids is not None
+        assert (await store.search(vectors[7], 1))[0][0] == "u: text 7"
+    asyncio.run(run())
+
+def test_trim_hides_oldest_rows_and_compacts_lazily():
+    texts, vectors = clustered(100)
+    index = EmbeddingIndex()
+    index.extend(texts[:60], vectors[:60], ids=list(range(60)))
+    assert index.trim(40) == 20
+    assert len(index) == 40 and index.start == 20
+    assert "text 5" not in {text for text, _ in index.search(vectors[5], 60)}
+    assert index.rows_for([5, 25]).tolist() == [25]
+    # Once half of the rows are trimmed they are copied out.
+    index.extend(texts[60:], vectors[60:], ids=list(range(60, 100)))
+    assert index.trim(40) == 40
+    assert index.start == 0 and index.texts == texts[60:]
+    assert index.search(vectors[70], 1)[0][0] == "text 70"
+
+def test_ivf_trim_skips_trimmed_rows():
+    texts, vectors = clustered(5000)
+    ivf = IVFIndex(train_threshold=4096)
+    ivf.extend(texts, vectors)
+    ivf.train()
+    ivf.nprobe = ivf.centroids.shape[0]
+    ivf.trim(3000)
+    assert ivf.centroids is not None
+    assert all(text not in {"text 5", "text 1999"} for text, _ in ivf.search(vectors[5], 50))
+    assert ivf.search(vectors[4000], 1)[0][0] == "text 4000"
+    ivf.trim(1000)
+    assert ivf.start == 0 and len(ivf) == 1000
+    assert ivf.search(vectors[4500], 1)[0][0] == "text 4500"
+
+def test_stores_enforce_the_size_cap(monkeypatch, tmp_path):
+    import asyncio
+    import vector_store
+    monkeypatch.setattr(vector_store, "embedding_max_entries", 100)
+    texts, vectors = clustered(150)
+    items = [{"text": text, "embedding": vector, "username": "u"} for text, vector in zip(texts, vectors)]
+
+    async def run(store):
+        await store.bulk_add(items[:120])
+        for item in items[120:]:
+            await store.add(item["text"], item["embedding"], "u")
+        assert await store.count() == 100
+        hits = await store.search(vectors[10], 150)
+        assert len(hits) == 100 and "u: text 10" not in dict(hits)
+        return store
+
+    async def read(store):
+        return await store.search(vectors[10], 150)
+
+    asyncio.run(run(vector_store.MemoryVectorStore()))
+    path = str(tmp_path / "embeddings.db")
+    reader = vector_store.SQLiteVectorStore(path)
+    assert asyncio.run(read(reader)) == []
+    store = asyncio.run(run(vector_store.SQLiteVectorStore(path)))
+    # Trimming does not bump the generation; other readers drop the same oldest rows.
+    assert store._generation(vector_store.GLOBAL_NAMESPACE) == 0
+    assert dict(asyncio.run(read(reader))) == pytest.approx(dict(asyncio.run(read(store))))
@@ -0,0 +1,260 @@
+# tool_handlers.py
+"""
+Discord handlers of the tools registered in tools.py.
+
+Every handler is called as handler(bot, message, args, memory_ns) once the model
+has replied with a call to its tool. The modules behind a tool are imported
+inside its handler, so they are only loaded when the tool is first used.
+"""
+import json
+import asyncio
+import logging
+import discord
+from embed import generate_embedding, save_embedding
+from message_pool import waiting_message, error_message
+from redis_async import get_redis
+
+logger = logging.getLogger("discord.tater")
+
+async def send_chunks(channel, chunks):
+    for chunk in chunks:
+        await channel.send(chunk)
+
+async def remember_reply(message, memory_ns, text):
+    """Store a tool's final answer in memory, like a normal reply."""
+    if len(text.strip()) >= 30:
+        response_embedding = await generate_embedding(text)
+        if response_embedding:
+            await save_embedding(text, response_embedding, "assistant", channel=message.channel.id, namespace=memory_ns)
+
+def parse_json_reply(text):
+    """The JSON object in a model reply, or None."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        json_start = text.find('{')
+        json_end = text.rfind('}')
+        if json_start != -1 and json_end != -1:
+            try:
+                return json.loads(text[json_start:json_end + 1])
+            except Exception:
+                return None
+        return None
+
+async def youtube_summary(bot, message, args, memory_ns):
+    import YouTube
+    video_url = args.get("video_url")
+    target_lang = args.get("target_lang", "en")
+    if not video_url:
+        await message.channel.send(await error_message("youtube_summary", message.author.mention, "No YouTube URL provided in the function call."))
+        return
+    video_id = YouTube.extract_video_id(video_url)
+    if not video_id:
+        await message.channel.send(await error_message("youtube_summary", message.author.mention, "The provided YouTube URL is invalid."))
+        return
+    await message.channel.send(await waiting_message("youtube_summary", message.author.mention))
+
+    async with message.channel.typing():
+        article = await asyncio.to_thread(YouTube.fetch_youtube_summary, video_id, target_lang)
+
+    if article:
+        formatted_article = YouTube.format_article_for_discord(article)
+        message_chunks = YouTube.split_message(formatted_article, chunk_size=bot.max_response_length)
+        await send_chunks(message.channel, message_chunks)
+        await remember_reply(message, memory_ns, "\n".join(message_chunks))
+    else:
+        await message.channel.send(await error_message("youtube_summary", message.author.mention, "Failed to retrieve the summary from YouTube."))
+
+async def web_summary(bot, message, args, memory_ns):
+    import web
+    webpage_url = args.get("url")
+    if not webpage_url:
+        await message.channel.send(await error_message("web_summary", message.author.mention, "No webpage URL provided in the function call."))
+        return
+    await message.channel.send(await waiting_message("web_summary", message.author.mention))
+
+    async with message.channel.typing():
+        summary = await asyncio.to_thread(web.fetch_web_summary, webpage_url)
+
+    if summary:
+        formatted_summary = web.format_summary_for_discord(summary)
+        message_chunks = web.split_message(formatted_summary, chunk_size=bot.max_response_length)
+        await send_chunks(message.channel, message_chunks)
+        await remember_reply(message, memory_ns, "\n".join(message_chunks))
+    else:
+        await message.channel.send(await error_message("web_summary", message.author.mention, "Failed to retrieve the summary from the webpage."))
+
+async def draw_picture(bot, message, args, memory_ns):
+    prompt_text = args.get("prompt")
+    if not prompt_text:
+        await message.channel.send(await error_message("draw_picture", message.author.mention, "No prompt provided for drawing a picture."))
+        return
+    await message.channel.send(await waiting_message("draw_picture", message.author.mention))
+
+    async with message.channel.typing():
+        loop = asyncio.get_running_loop()
+        try:
+            from image import generate_image
+            image_bytes = await loop.run_in_executor(None, generate_image, prompt_text)
+            from io import BytesIO
+            image_file = discord.File(BytesIO(image_bytes), filename="generated_image.png")
+            await message.channel.send(file=image_file)
+        except Exception as e:
+            await message.channel.send(await error_message("draw_picture", message.author.mention, f"Failed to generate image: {e}"))
+
+async def premiumize_download(bot, message, args, memory_ns):
+    import premiumize
+    url = args.get("url")
+    if not url:
+        await message.channel.send(await error_message("premiumize_download", message.author.mention, "No URL provided for Premiumize download check."))
+        return
+    await message.channel.send(await waiting_message("premiumize_download", message.author.mention))
+
+    async with message.channel.typing():
+        try:
+            # Sends the links to the channel itself.
+            await premiumize.process_download(message.channel, url)
+        except Exception as e:
+            await message.channel.send(await error_message("premiumize_download", message.author.mention, f"Failed to retrieve Premiumize download links: {e}"))
+
+async def premiumize_torrent(bot, message, args, memory_ns):
+    import premiumize
+    # For torrent requests, we expect an attached torrent file.
+    if not message.attachments:
+        await message.channel.send(await error_message("premiumize_torrent", message.author.mention, "No torrent file attached for Premiumize torrent check."))
+        return
+    torrent_attachment = message.attachments[0]
+    await message.channel.send(await waiting_message("premiumize_torrent", message.author.mention))
+
+    async with message.channel.typing():
+        try:
+            await premiumize.process_torrent(message.channel, torrent_attachment)
+        except Exception as e:
+            await message.channel.send(await error_message("premiumize_torrent", message.author.mention, f"Failed to retrieve Premiumize download links for torrent: {e}"))
+
+async def watch_feed(bot, message, args, memory_ns):
+    import time
+    import feedparser
+    await message.channel.send(await waiting_message("watch_feed", message.author.mention))
+
+    feed_url = args.get("feed_url")
+    if feed_url:
+        parsed_feed = await asyncio.to_thread(feedparser.parse, feed_url)
+        if parsed_feed.bozo:
+            final_message = f"Failed to parse feed: {feed_url}"
+        else:
+            last_ts = 0.0
+            if parsed_feed.entries:
+                for entry in parsed_feed.entries:
+                    if 'published_parsed' in entry:
+                        entry_ts = time.mktime(entry.published_parsed)
+                        if entry_ts > last_ts:
+                            last_ts = entry_ts
+            else:
+                last_ts = time.time()
+            await get_redis().hset("rss:feeds", feed_url, last_ts)
+            final_message = f"Now watching feed: {feed_url}"
+    else:
+        final_message = "No feed URL provided for watching."
+    await message.channel.send(final_message)
+
+async def unwatch_feed(bot, message, args, memory_ns):
+    await message.channel.send(await waiting_message("unwatch_feed", message.author.mention))
+
+    feed_url = args.get("feed_url")
+    if feed_url:
+        removed = await get_redis().hdel("rss:feeds", feed_url)
+        if removed:
+            final_message = f"Stopped watching feed: {feed_url}"
+        else:
+            final_message = f"Feed {feed_url} was not found in the watch list."
+    else:
+        final_message = "No feed URL provided for unwatching."
+    await message.channel.send(final_message)
+
+async def list_feeds(bot, message, args, memory_ns):
+    await message.channel.send(await waiting_message("list_feeds", message.author.mention))
+
+    feeds = await get_redis().hgetall("rss:feeds")
+    if feeds:
+        feed_list = "\n".join(f"{feed_url} (last update: {feeds[feed_url]})" for feed_url in feeds)
+        final_message = f"Currently watched feeds:\n{feed_list}"
+    else:
+        final_message = "No RSS feeds are currently being watched."
+    await message.channel.send(final_message)
+
+async def web_search(bot, message, args, memory_ns):
+    import web
+    from search import search_web, format_search_results
+    query = args.get("query")
+    if not query:
+        await message.channel.send(await error_message("web_search", message.author.mention, "No search query provided."))
+        return
+    await message.channel.send(await waiting_message("web_search", message.author.mention))
+
+    results = search_web(query)
+    if not results:
+        await message.channel.send(await error_message("web_search", message.author.mention, "I couldn't find any relevant search results."))
+        return
+    formatted_results = format_search_results(results)
+    # Build the choice prompt with actual values filled in.
+    choice_prompt = (
+        f"You are looking for more information on '{query}' because the user asked: '{message.content}'.\n\n"
+        f"Here are the top search results:\n\n"
+        f"{formatted_results}\n\n"
+        "Please choose the most relevant link. Use the following tool for fetching web details and insert the chosen link. "
+        "Respond ONLY with a valid JSON object in the following exact format (and nothing else):\n\n"
+        "For fetching web details:\n"
+        "{\n"
+        '  "function": "web_fetch",\n'
+        '  "arguments": {\n'
+        '      "link": "<chosen link>",\n'
+        f'      "query": "{query}",\n'
+        f'      "user_question": "{message.content}"\n'
+        "  }\n"
+        "}"
+    )
+    choice_response = await bot.ollama.chat(
+        model=bot.model,
+        messages=[{"role": "system", "content": choice_prompt}],
+        stream=False,
+        keep_alive=-1,
+        options={"num_ctx": bot.context_length}
+    )
+    choice_json = parse_json_reply(choice_response['message'].get('content', '').strip())
+    if not choice_json:
+        await message.channel.send(await error_message("web_search", message.author.mention, "Failed to parse the search result choice."))
+        return
+    if choice_json.get("function") != "web_fetch":
+        await message.channel.send(await error_message("web_search", message.author.mention, "No valid function call for fetching web info was returned."))
+        return
+
+    fetch_args = choice_json.get("arguments", {})
+    link = fetch_args.get("link")
+    if not link:
+        await message.channel.send(await error_message("web_search", message.author.mention, "No link provided to fetch web info."))
+        return
+    summary = await asyncio.to_thread(web.fetch_web_summary, link)
+    if not summary:
+        await message.channel.send(await error_message("web_search", message.author.mention, "Failed to extract information from the selected webpage."))
+        return
+    # Answer the original query from the detailed information.
+    info_prompt = (
+        f"Using the detailed information from the selected page below, please provide a clear and concise answer to the original query.\n\n"
+        f"Original Query: '{fetch_args.get('query')}'\n"
+        f"User Question: '{fetch_args.get('user_question')}'\n\n"
+        f"Detailed Information:\n{summary}\n\n"
+        "Answer:"
+    )
+    final_response = await bot.ollama.chat(
+        model=bot.model,
+        messages=[{"role": "system", "content": info_prompt}],
+        stream=False,
+        keep_alive=-1,
+        options={"num_ctx": bot.context_length}
+    )
+    final_answer = final_response['message'].get('content', '').strip()
+    if not final_answer:
+        await message.channel.send(await error_message("web_search", message.author.mention, "Failed to generate a final answer from the detailed info."))
+        return
+    await send_chunks(message.channel, web.split_message(final_answer, chunk_size=bot.max_response_length))
@@ -0,0 +1,102 @@
+# tools.py
+"""
+The tools the model can call, in one registry.
+
+Each Tool declares its name, what it is for, its arguments (name -> placeholder
+shown to the model) and its handler as "module:function". The system prompt is
+generated from the registry, and a tool call is dispatched with a dictionary
+lookup instead of an if/elif chain.
+
+Nothing heavy is imported here: the handler module is imported the first time
+the tool is called, and the handlers import what they need (bs4, feedparser,
+youtube_transcript_api, duckduckgo_search, ...) on first use as well, so
+starting the bot doesn't pay for tools nobody uses.
+"""
+import json
+import importlib
+import threading
+
+class Tool:
+    def __init__(self, name, description, example, arguments=None, handler=None, remember=True):
+        self.name = name
+        self.description = description
+        # Heading of the JSON example in the system prompt.
+        self.example = example
+        self.arguments = arguments or {}
+        self.handler_path = handler
+        # Whether the exchange is saved to the channel history afterwards.
+        self.remember = remember
+        self._handler = None
+        self._lock = threading.Lock()
+
+    @property
+    def handler(self):
+        """The handler coroutine function, importing its module on first use."""
+        if self._handler is None:
+            with self._lock:
+                if self._handler is None:
+                    module_name, function_name = self.handler_path.split(":")
+                    self._handler = getattr(importlib.import_module(module_name), function_name)
+        return self._handler
+
+    def call_example(self):
+        return "{\n" f'  "function": "{self.name}",\n' f'  "arguments": {json.dumps(self.arguments)}\n' "}"
+
+TOOLS = {}
+
+def register(tool):
+    TOOLS[tool.name] = tool
+    return tool
+
+def get_tool(name):
+    """The registered tool called name, or None."""
+    return TOOLS.get(name) if isinstance(name, str) else None
+
+register(Tool(
+    "youtube_summary", "summarizing YouTube videos", "For YouTube videos",
+    {"video_url": "<YouTube URL>"}, "tool_handlers:youtube_summary"
+))
+register(Tool(
+    "web_summary", "summarizing webpage text", "For webpages",
+    {"url": "<Webpage URL>"}, "tool_handlers:web_summary"
+))
+register(Tool(
+    "draw_picture", "generating images", "For drawing images",
+    {"prompt": "<Text prompt for the image>"}, "tool_handlers:draw_picture"
+))
+register(Tool(
+    "premiumize_download", "retrieving download links from Premiumize.me", "For Premiumize URL download check",
+    {"url": "<URL to check>"}, "tool_handlers:premiumize_download"
+))
+register(Tool(
+    "premiumize_torrent", "retrieving torrent download links from Premiumize.me", "For Premiumize torrent check",
+    {}, "tool_handlers:premiumize_torrent"
+))
+register(Tool(
+    "watch_feed", "adding an RSS feed to the watch list when a user asks", "For adding an RSS feed",
+    {"feed_url": "<RSS feed URL>"}, "tool_handlers:watch_feed", remember=False
+))
+register(Tool(
+    "unwatch_feed", "removing an RSS feed from the watch list when a user asks", "For removing an RSS feed",
+    {"feed_url": "<RSS feed URL>"}, "tool_handlers:unwatch_feed", remember=False
+))
+register(Tool(
+    "list_feeds", "listing RSS feeds that are currently on the watch list", "For listing RSS feeds",
+    {}, "tool_handlers:list_feeds", remember=False
+))
+register(Tool(
+    "web_search", "searching the web when additional or up-to-date information is needed to answer a user's question",
+    "For searching the web", {"query": "<search query>"}, "tool_handlers:web_search", remember=False
+))
+
+def tools_prompt(tools=None):
+    """The tool section of the system prompt: the list of tools and the JSON format of each call."""
+    tools = list((tools or TOOLS).values())
+    listing = "".join(f"{number}. '{tool.name}' for {tool.description}.\n\n" for number, tool in enumerate(tools, 1))
+    examples = "".join(f"{tool.example}:\n{tool.call_example()}\n\n" for tool in tools)
+    return (
+        "Use the tools to help users with various tasks. You have access to the following tools:\n\n"
+        f"{listing}"
+        "When a user requests one of these actions, reply ONLY with a JSON object in one of the following formats (and nothing else):\n\n"
+        f"{examples}"
+    )
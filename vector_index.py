@@ -0,0 +1,409 @@
+# vector_index.py
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger("discord.tater")
+
+# Up to this many unassigned rows are assigned to their lists inline; more (e.g. after
+# loading a snapshot) are left to the background job, with exact search meanwhile.
+INLINE_ASSIGN_ROWS = 8192
+
+class EmbeddingIndex:
+    """
+    In-memory similarity index over stored embeddings.
+    Rows are kept L2-normalized in a float32 matrix, so a top-N lookup is a single
+    matrix-vector product followed by argpartition. Each row can carry an integer id
+    (-1 if none) so callers can restrict a search to known rows.
+    trim() drops the oldest rows for a size cap: they are hidden from searches at once
+    and only copied out once they make up half of the rows.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self.dim = None
+        self.texts = []
+        self.ids = []
+        self.start = 0  # Rows below start were trimmed and are no longer searched.
+        self._matrix = None
+        self._row_of = None  # id -> row, built on first use
+        self._initial_capacity = initial_capacity
+
+    def __len__(self):
+        return len(self.texts) - self.start
+
+    def clear(self):
+        self.dim = None
+        self.texts = []
+        self.ids = []
+        self.start = 0
+        self._matrix = None
+        self._row_of = None
+
+    def trim(self, keep):
+        """Keep only the newest keep rows. Returns the number of rows dropped."""
+        dropped = max(0, len(self) - keep)
+        if dropped:
+            self.start += dropped
+            if self.start >= len(self):
+                self._compact()
+        return dropped
+
+    def _compact(self):
+        """Copy the live rows out, releasing the trimmed ones."""
+        count = len(self.texts)
+        self.load(self.texts[self.start:], self._matrix[self.start:count].copy(), self.ids[self.start:])
+
+    def load(self, texts, matrix, ids=None):
+        """
+        Replace the contents with rows that are already normalized, e.g. a memory-mapped
+        snapshot. The matrix is used as is and only copied once more rows are appended.
+        """
+        self.texts = list(texts)
+        self.ids = list(ids) if ids is not None else [-1] * len(self.texts)
+        self.start = 0
+        self._row_of = None
+        if self.texts:
+            self.dim = matrix.shape[1]
+            self._matrix = matrix
+        else:
+            self.dim = None
+            self._matrix = None
+
+    def _reserve(self, extra):
+        """Grow the backing matrix geometrically so appends stay amortized O(1)."""
+        needed = len(self.texts) + extra
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, self._initial_capacity)
+        grown = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        if self._matrix is not None:
+            grown[:len(self.texts)] = self._matrix[:len(self.texts)]
+        self._matrix = grown
+
+    def add(self, text, embedding, row_id=-1):
+        """Add a single embedding. Returns False if it was skipped."""
+        return self.extend([text], [embedding], [row_id]) == 1
+
+    def extend(self, texts, embeddings, ids=None):
+        """
+        Add many embeddings at once. Vectors whose dimension does not match the
+        index (e.g. stored with a different embedding model) are skipped.
+        Returns the number of rows added.
+        """
+        if ids is None:
+            ids = [-1] * len(texts)
+        rows = []
+        kept_texts = []
+        kept_ids = []
+        for text, embedding, row_id in zip(texts, embeddings, ids):
+            if embedding is None:
+                continue
+            vec = np.asarray(embedding, dtype=np.float32).ravel()
+            if self.dim is None:
+                self.dim = vec.shape[0]
+            if vec.shape[0] != self.dim:
+                logger.warning(f"Skipping embedding with dimension {vec.shape[0]} (index dimension is {self.dim}).")
+                continue
+            rows.append(vec)
+            kept_texts.append(text)
+            kept_ids.append(row_id)
+        if not rows:
+            return 0
+
+        block = np.vstack(rows)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        # Zero vectors stay zero so they always score 0.0, like cosine_similarity.
+        np.divide(block, norms, out=block, where=norms > 0)
+
+        self._reserve(len(rows))
+        start = len(self.texts)
+        self._matrix[start:start + len(rows)] = block
+        self.texts.extend(kept_texts)
+        self.ids.extend(kept_ids)
+        if self._row_of is not None:
+            for row, row_id in enumerate(kept_ids, start):
+                if row_id >= 0:
+                    self._row_of[row_id] = row
+        return len(rows)
+
+    def rows_for(self, ids):
+        """Rows holding the given ids, in the same order; unknown ids are left out."""
+        if self._row_of is None:
+            self._row_of = {row_id: row for row, row_id in enumerate(self.ids) if row_id >= 0}
+        rows = [self._row_of.get(row_id) for row_id in ids]
+        return np.array([row for row in rows if row is not None and row >= self.start], dtype=np.int64)
+
+    def _normalized_query(self, query_embedding):
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self.dim:
+            logger.warning(f"Query dimension {query.shape[0]} does not match index dimension {self.dim}.")
+            return None
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        return query / norm
+
+    def search(self, query_embedding, top_n=10, rows=None):
+        """
+        Return up to top_n (text, similarity) pairs ordered by descending cosine similarity.
+        If rows is given only those rows are scored.
+        """
+        count = len(self.texts)
+        if len(self) == 0 or query_embedding is None or top_n <= 0:
+            return []
+        query = self._normalized_query(query_embedding)
+        if query is None:
+            return []
+
+        if rows is None:
+            rows = np.arange(self.start, count) if self.start else None
+        if rows is None:
+            scores = self._matrix[:count] @ query
+        else:
+            if len(rows) == 0:
+                return []
+            scores = self._matrix[rows] @ query
+        if top_n < len(scores):
+            candidates = np.argpartition(scores, -top_n)[-top_n:]
+        else:
+            candidates = np.arange(len(scores))
+        ordered = candidates[np.argsort(scores[candidates])[::-1]]
+        if rows is not None:
+            return [(self.texts[rows[i]], float(scores[i])) for i in ordered]
+        return [(self.texts[i], float(scores[i])) for i in ordered]
+
+def train_centroids(sample, nlist, iterations=10, seed=0):
+    """Spherical k-means over normalized rows. Returns the (nlist, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        nearest = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their previous centroid.
+        np.divide(sums, norms, out=centroids, where=norms > 0)
+    return centroids
+
+def nearest_centroids(rows, centroids, chunk_size=8192):
+    nearest = np.empty(len(rows), dtype=np.int64)
+    for chunk_start in range(0, len(rows), chunk_size):
+        chunk = rows[chunk_start:chunk_start + chunk_size]
+        nearest[chunk_start:chunk_start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return nearest
+
+class IVFIndex(EmbeddingIndex):
+    """
+    Approximate nearest-neighbour index (IVF-flat).
+    Rows are bucketed by their nearest coarse centroid (spherical k-means), and a query
+    only scores the rows in the nprobe buckets closest to it. Until the index holds
+    train_threshold rows it answers exactly. Centroids are persisted to index_path so
+    a restart only has to re-assign rows instead of re-training.
+
+    Adding rows never trains: it only sets training_due. The owner runs the job from
+    training_job() in a worker thread and hands the result to install(); until then
+    searches use the previous centroids (or exact search before the first training).
+    train() does both in one call.
+    """
+
+    def __init__(self, nlist=0, nprobe=8, train_threshold=4096, index_path=None, initial_capacity=1024):
+        super().__init__(initial_capacity)
+        self.nlist = nlist  # 0 = pick automatically from the corpus size
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.index_path = index_path
+        self.centroids = None
+        self.trained_count = 0
+        self.training_due = False
+        self._training = False
+        self._epoch = 0  # Bumped when rows are replaced, so a running training is discarded.
+        self._lists = []
+        self._list_arrays = []
+        self._assigned = 0  # Rows [0, _assigned) are in an inverted list.
+
+    def clear(self):
+        # Keep the trained centroids; they stay valid for a reloaded copy of the same corpus.
+        super().clear()
+        self._epoch += 1
+        self._reset_lists()
+
+    def _reset_lists(self):
+        nlist = 0 if self.centroids is None else self.centroids.shape[0]
+        self._lists = [[] for _ in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._assigned = 0
+
+    def extend(self, texts, embeddings, ids=None):
+        added = super().extend(texts, embeddings, ids)
+        self._update_lists()
+        return added
+
+    def load(self, texts, matrix, ids=None):
+        super().load(texts, matrix, ids)
+        self._epoch += 1
+        self._reset_lists()
+        self._update_lists()
+
+    def _update_lists(self):
+        """Load or extend the inverted lists to cover every row, and note when (re)training is due."""
+        count = len(self.texts)
+        if self.centroids is not None and self.centroids.shape[1] != self.dim:
+            # The embedding model changed; the old centroids are meaningless.
+            self.centroids = None
+            self._reset_lists()
+        if self.centroids is None and count >= self.train_threshold:
+            self._load()
+        if self.centroids is not None and count - self._assigned <= INLINE_ASSIGN_ROWS:
+            self._assign_pending()
+        self.training_due = count >= self.train_threshold and (
+            self.centroids is None or count >= 2 * self.trained_count or self._assigned < count
+        )
+
+    def _assign_pending(self, chunk_size=8192):
+        """Append rows not yet in an inverted list to the list of their nearest centroid."""
+        count = len(self.texts)
+        for chunk_start in range(self._assigned, count, chunk_size):
+            chunk_stop = min(count, chunk_start + chunk_size)
+            nearest = np.argmax(self._matrix[chunk_start:chunk_stop] @ self.centroids.T, axis=1)
+            for row, list_id in enumerate(nearest, chunk_start):
+                self._lists[list_id].append(row)
+                self._list_arrays[list_id] = None
+        self._assigned = count
+
+    def training_job(self, iterations=10, sample_per_list=64, seed=0, retrain=False):
+        """
+        If training is due and not already running, return a function that trains on the
+        current rows (or only assigns them, when the centroids are still fresh) without
+        touching the index, for a worker thread. Its result goes to install(); the caller
+        must call install() (with None on failure) in any case.
+        """
+        count = len(self.texts)
+        if not self.training_due or self._training or count == 0:
+            return None
+        self._training = True
+        # Rows below count never change in place, and a grown matrix is a new array,
+        # so this view stays valid while new rows are appended.
+        matrix = self._matrix[:count]
+        epoch = self._epoch
+        fresh = not retrain and self.centroids is not None and count < 2 * self.trained_count
+        centroids, trained_count = (self.centroids, self.trained_count) if fresh else (None, count)
+        nlist = centroids.shape[0] if fresh else min(self.nlist or max(1, int(4 * np.sqrt(count))), count)
+
+        def run():
+            trained = centroids
+            if trained is None:
+                rng = np.random.default_rng(seed)
+                sample_size = min(count, nlist * sample_per_list)
+                sample = matrix[rng.choice(count, sample_size, replace=False)]
+                trained = train_centroids(sample, nlist, iterations, seed)
+                self._save(trained, trained_count)
+            nearest = nearest_centroids(matrix, trained)
+            order = np.argsort(nearest, kind="stable")
+            bounds = np.cumsum(np.bincount(nearest, minlength=nlist))[:-1]
+            return epoch, count, trained, trained_count, np.split(order, bounds)
+        return run
+
+    def install(self, result):
+        """Swap in the centroids and inverted lists computed by a training job."""
+        self._training = False
+        if result is None:
+            return False
+        epoch, count, centroids, trained_count, arrays = result
+        if epoch != self._epoch or count > len(self.texts) or centroids.shape[1] != self.dim:
+            # The rows were replaced while training; training_due stays set for the next try.
+            return False
+        retrained = centroids is not self.centroids
+        self.centroids = centroids
+        self.trained_count = trained_count
+        self._lists = [ids.tolist() for ids in arrays]
+        self._list_arrays = list(arrays)
+        self._assigned = count
+        self._update_lists()
+        if retrained:
+            logger.info(f"Trained IVF index with {centroids.shape[0]} lists over {trained_count} embeddings.")
+        return True
+
+    def train(self, iterations=10, sample_per_list=64, seed=0):
+        """Train right away in the calling thread (benchmarks, offline tools)."""
+        if len(self.texts) == 0:
+            return False
+        self.training_due = True
+        self._training = False
+        job = self.training_job(iterations, sample_per_list, seed, retrain=True)
+        return self.install(job())
+
+    def _save(self, centroids, trained_count):
+        if not self.index_path:
+            return
+        try:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, centroids=centroids, trained_count=trained_count)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error saving IVF index to {self.index_path}: {e}")
+
+    def _load(self):
+        """Reuse persisted centroids if they match this index and are not too stale."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path) as data:
+                centroids = data["centroids"].astype(np.float32)
+                trained_count = int(data["trained_count"])
+        except Exception as e:
+            logger.error(f"Error loading IVF index from {self.index_path}: {e}")
+            return
+        if centroids.shape[1] != self.dim or len(self.texts) >= 2 * trained_count:
+            return
+        self.centroids = centroids
+        self.trained_count = trained_count
+        self._reset_lists()
+        logger.info(f"Loaded IVF index with {centroids.shape[0]} lists from {self.index_path}.")
+
+    def _list_ids(self, list_id):
+        ids = self._list_arrays[list_id]
+        if ids is None:
+            ids = np.fromiter(self._lists[list_id], dtype=np.int64, count=len(self._lists[list_id]))
+            self._list_arrays[list_id] = ids
+        return ids
+
+    def search(self, query_embedding, top_n=10, rows=None):
+        # A short candidate list is cheaper to score exactly than to probe; rows not in a
+        # list yet (a background assignment is pending) would be missed, so search exactly.
+        if self.centroids is None or rows is not None or self._assigned < len(self.texts):
+            return super().search(query_embedding, top_n, rows)
+        if len(self) == 0 or query_embedding is None or top_n <= 0:
+            return []
+        query = self._normalized_query(query_embedding)
+        if query is None:
+            return []
+
+        centroid_scores = self.centroids @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        candidates = np.concatenate([self._list_ids(list_id) for list_id in probe])
+        if self.start:
+            candidates = candidates[candidates >= self.start]
+        if len(candidates) == 0:
+            return []
+
+        scores = self._matrix[candidates] @ query
+        if top_n < len(candidates):
+            best = np.argpartition(scores, -top_n)[-top_n:]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(scores[best])[::-1]]
+        return [(self.texts[candidates[i]], float(scores[i])) for i in best]
+
+def create_index(index_type="exact", **kwargs):
+    """Build the similarity index selected by EMBEDDING_INDEX ("exact" or "ivf")."""
+    if index_type == "exact":
+        return EmbeddingIndex()
+    if index_type == "ivf":
+        return IVFIndex(**kwargs)
+    raise ValueError(f"Unknown embedding index type: {index_type}")
@@ -0,0 +1,721 @@
+# vector_store.py
+import os
+import time
+import sqlite3
+import logging
+import threading
+import asyncio
+import contextlib
+from dotenv import load_dotenv
+from redis_async import get_redis, get_script
+from vector_index import create_index
+from embedding_record import encode_record, decode_record, content_hash
+from embedding_snapshot import write_snapshot, load_snapshot
+from lexical_index import LexicalIndex, doc_id
+
+load_dotenv()
+
+logger = logging.getLogger("discord.tater")
+
+embedding_dtype = os.getenv('EMBEDDING_DTYPE', 'float32').strip()  # float32 or float16
+
+# Storage backend: "redis" (default), "memory" (process-local, nothing persisted)
+# or "sqlite" (a local database file for single-node installs).
+vector_store_backend = os.getenv('VECTOR_STORE', 'redis').strip().lower()
+vector_store_path = os.getenv('VECTOR_STORE_PATH', 'data/embeddings.sqlite3').strip()
+
+# Keep only the newest N embeddings (0 = keep everything). Lower this on low-RAM systems.
+embedding_max_entries = int(os.getenv('EMBEDDING_MAX_ENTRIES', 0))
+
+# Similarity index: "exact" brute force, or "ivf" for approximate search on large corpora.
+embedding_index_type = os.getenv('EMBEDDING_INDEX', 'exact').strip().lower()
+ivf_nlist = int(os.getenv('IVF_NLIST', 0))  # 0 = choose from the corpus size
+ivf_nprobe = int(os.getenv('IVF_NPROBE', 8))
+ivf_train_threshold = int(os.getenv('IVF_TRAIN_THRESHOLD', 4096))
+ivf_index_path = os.getenv('IVF_INDEX_PATH', 'data/ivf_index.npz').strip()
+
+# Hybrid search (Redis backend): a BM25 index picks up to HYBRID_CANDIDATES messages sharing
+# words with the query, only those are scored by embedding, and both rankings are fused.
+embedding_hybrid_search = os.getenv('EMBEDDING_HYBRID_SEARCH', 'false').strip().lower() in ('1', 'true', 'yes')
+hybrid_candidates = int(os.getenv('HYBRID_CANDIDATES', 300))
+RRF_K = 60
+
+# Memory-mapped index snapshots for fast startup (Redis backend). Empty directory disables them.
+embedding_snapshot_dir = os.getenv('EMBEDDING_SNAPSHOT_DIR', 'data/snapshots').strip()
+
+GLOBAL_NAMESPACE = "global"
+GLOBAL_EMBEDDINGS_KEY = "tater:global:embeddings"
+# Every other namespace lives in its own list, e.g. tater:embeddings:guild:1234.
+NAMESPACE_KEY_PREFIX = "tater:embeddings:"
+# Set of all namespaces that have stored embeddings (used by compaction).
+NAMESPACES_KEY = "tater:embeddings:namespaces"
+# Each list has companion keys:
+#   <key>:hashes      content hash -> sequence number of every stored text, used to skip duplicates
+#   <key>:seq         total number of records ever appended; used as the sync cursor
+#   <key>:generation  bumped whenever the list is rewritten (migration, compaction) so replicas reload
+GLOBAL_EMBEDDINGS_HASHES_KEY = f"{GLOBAL_EMBEDDINGS_KEY}:hashes"
+GLOBAL_EMBEDDINGS_SEQ_KEY = f"{GLOBAL_EMBEDDINGS_KEY}:seq"
+GLOBAL_EMBEDDINGS_GENERATION_KEY = f"{GLOBAL_EMBEDDINGS_KEY}:generation"
+
+def context_text(username, text):
+    """Stored messages are returned to the prompt as "username: text"."""
+    return f"{username}: {text}"
+
+def _safe_name(namespace):
+    return "".join(c if c.isalnum() else "_" for c in namespace)
+
+def new_index(namespace):
+    """Create the in-memory similarity index configured by EMBEDDING_INDEX for a namespace."""
+    if embedding_index_type != "ivf":
+        return create_index(embedding_index_type)
+    index_path = ivf_index_path
+    if namespace != GLOBAL_NAMESPACE and ivf_index_path:
+        root, ext = os.path.splitext(ivf_index_path)
+        index_path = f"{root}_{_safe_name(namespace)}{ext}"
+    return create_index(
+        "ivf",
+        nlist=ivf_nlist,
+        nprobe=ivf_nprobe,
+        train_threshold=ivf_train_threshold,
+        index_path=index_path
+    )
+
+# Running IVF training jobs; kept here so the tasks aren't garbage collected.
+_training_tasks = set()
+
+def schedule_training(index, lock=None):
+    """
+    Start (re)training an IVF index in a worker thread if it is due. The index keeps
+    answering with its previous centroids, or exactly, until the result is swapped in.
+    Must be called from the event loop.
+    """
+    lock = lock or contextlib.nullcontext()
+    with lock:
+        job = index.training_job() if hasattr(index, "training_job") else None
+    if job is None:
+        return
+
+    async def train():
+        result = None
+        try:
+            result = await asyncio.to_thread(job)
+        except Exception as e:
+            logger.error(f"Error training the IVF index: {e}")
+        finally:
+            with lock:
+                index.install(result)
+
+    task = asyncio.get_running_loop().create_task(train())
+    _training_tasks.add(task)
+    task.add_done_callback(_training_tasks.discard)
+
+async def wait_for_training():
+    """Wait until every IVF training job started so far has been installed."""
+    while _training_tasks:
+        await asyncio.gather(*list(_training_tasks), return_exceptions=True)
+
+class VectorStore:
+    """
+    Interface for embedding storage backends. Every method takes the memory namespace
+    to operate on; search results are ("username: text", similarity) pairs.
+    """
+
+    async def add(self, text, embedding, username, channel=None, namespace=GLOBAL_NAMESPACE) -> bool:
+        """Store one embedding. Returns False if the text is already stored."""
+        raise NotImplementedError
+
+    async def bulk_add(self, items, namespace=GLOBAL_NAMESPACE) -> int:
+        """
+        Store many embeddings. items are dicts with text, embedding, username and
+        optionally channel. Returns the number of records actually added.
+        """
+        added = 0
+        for item in items:
+            if await self.add(item["text"], item["embedding"], item["username"], channel=item.get("channel"), namespace=namespace):
+                added += 1
+        return added
+
+    async def search(self, query_embedding, top_n=10, namespace=GLOBAL_NAMESPACE, query_text=None):
+        """
+        Return up to top_n ("username: text", score) pairs, best first. Backends that
+        support hybrid search also use query_text.
+        """
+        raise NotImplementedError
+
+    async def delete(self, text, namespace=GLOBAL_NAMESPACE) -> int:
+        """Remove every record with this text. Returns the number of records removed."""
+        raise NotImplementedError
+
+    async def count(self, namespace=GLOBAL_NAMESPACE) -> int:
+        raise NotImplementedError
+
+# ----------------- REDIS -----------------
+def namespace_key(namespace):
+    """Redis list holding the embeddings of a namespace."""
+    if namespace in (None, GLOBAL_NAMESPACE):
+        return GLOBAL_EMBEDDINGS_KEY
+    return f"{NAMESPACE_KEY_PREFIX}{namespace}"
+
+def reciprocal_rank_fusion(rankings, top_n, k=RRF_K):
+    """Fuse several ranked lists of texts into one list of (text, score) pairs."""
+    scores = {}
+    for ranking in rankings:
+        for rank, text in enumerate(ranking):
+            scores[text] = scores.get(text, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+def _decode_entries(entries):
+    """Decode raw list entries into parallel lists of context strings, embeddings and document ids."""
+    texts = []
+    embeddings = []
+    ids = []
+    for emb_data in entries:
+        try:
+            record = decode_record(emb_data)
+        except Exception as e:
+            logger.error(f"Error processing embedding: {e}")
+            continue
+        if record is None:
+            continue
+        # Include username with the text for context.
+        texts.append(context_text(record['username'], record['text']))
+        embeddings.append(record["embedding"])
+        ids.append(doc_id(record["text"]))
+    return texts, embeddings, ids
+
+# Append a record, advance the sequence counter and apply the optional size cap atomically.
+# Returns {seq, trimmed entries...}, or {0} without writing if a record with the same content
+# hash is already stored. Lists written before the counter existed start counting from their
+# current length.
+SAVE_SCRIPT = """
+if redis.call('ZSCORE', KEYS[3], ARGV[3]) then
+    return {0}
+end
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+local seq = redis.call('INCR', KEYS[2])
+if seq < length then
+    seq = length
+    redis.call('SET', KEYS[2], seq)
+end
+redis.call('ZADD', KEYS[3], seq, ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('SADD', KEYS[4], ARGV[4])
+end
+local max_entries = tonumber(ARGV[2])
+local result = {seq}
+if max_entries > 0 and length > max_entries then
+    for _, entry in ipairs(redis.call('LRANGE', KEYS[1], 0, length - max_entries - 1)) do
+        table.insert(result, entry)
+    end
+    redis.call('LTRIM', KEYS[1], -max_entries, -1)
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', seq - max_entries)
+end
+return result
+"""
+
+# Return {seq, generation, full_reload, entries}. When the caller's cursor and generation
+# are still valid only the entries appended after the cursor are returned; otherwise the
+# whole list is returned and full_reload is 1.
+SYNC_SCRIPT = """
+local length = redis.call('LLEN', KEYS[1])
+local seq = tonumber(redis.call('GET', KEYS[2]) or length)
+local generation = redis.call('GET', KEYS[3]) or '0'
+local pending = seq - tonumber(ARGV[1])
+if tonumber(ARGV[1]) < 0 or ARGV[2] ~= generation or pending < 0 or pending > length then
+    return {seq, generation, 1, redis.call('LRANGE', KEYS[1], 0, -1)}
+end
+if pending == 0 then
+    return {seq, generation, 0, {}}
+end
+return {seq, generation, 0, redis.call('LRANGE', KEYS[1], -pending, -1)}
+"""
+
+class RedisPartition:
+    """
+    One namespace of stored embeddings: its Redis list plus the in-memory index that
+    answers similarity queries for it.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace or GLOBAL_NAMESPACE
+        self.key = namespace_key(self.namespace)
+        self.seq_key = f"{self.key}:seq"
+        self.hashes_key = f"{self.key}:hashes"
+        self.generation_key = f"{self.key}:generation"
+        self.index = new_index(self.namespace)
+        self.cursor = -1  # Sequence number the index is synced up to (-1 = never loaded).
+        self.generation = ""
+        # The bot and the web UI run separate event loops in one process, so index
+        # updates are guarded by a thread lock rather than an asyncio one.
+        self._lock = threading.Lock()
+        self.lexical = LexicalIndex(self.key) if embedding_hybrid_search else None
+        self.snapshot_cursor = None  # (cursor, generation) of the last snapshot written or loaded.
+        self.snapshot_path = None
+        if embedding_snapshot_dir:
+            self.snapshot_path = os.path.join(embedding_snapshot_dir, f"{_safe_name(self.namespace)}.snap")
+
+    def _load_snapshot(self):
+        """Start from the snapshot on disk; sync() then only replays what was appended since."""
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return
+        self.index.load(snapshot["texts"], snapshot["matrix"], snapshot["ids"])
+        self.cursor = snapshot["seq"]
+        self.generation = snapshot["generation"]
+        self.snapshot_cursor = (self.cursor, self.generation)
+        logger.info(f"Mapped {len(self.index)} embeddings for '{self.namespace}' from {self.snapshot_path}.")
+
+    def snapshot_state(self):
+        """Capture what write_snapshot() needs; rows below the cursor never change in place."""
+        with self._lock:
+            start, count = self.index.start, len(self.index.texts)
+            matrix = self.index._matrix[start:] if self.index._matrix is not None else None
+            return (self.index.texts[start:count], matrix, self.index.ids[start:count],
+                    self.cursor, self.generation)
+
+    def write_snapshot(self, state=None):
+        """Write the current index to the snapshot file. Returns the path, or None if disabled."""
+        if not self.snapshot_path or self.cursor < 0:
+            return None
+        texts, matrix, ids, cursor, generation = state or self.snapshot_state()
+        write_snapshot(self.snapshot_path, texts, matrix, cursor, generation, ids=ids)
+        self.snapshot_cursor = (cursor, generation)
+        return self.snapshot_path
+
+    def _save_args(self, text, embedding, username, channel=None):
+        # Store a binary record with username, channel, text, and embedding
+        record = encode_record(text, embedding, username, dtype=embedding_dtype, channel=channel)
+        return {
+            "keys": [self.key, self.seq_key, self.hashes_key, NAMESPACES_KEY],
+            "args": [
+                record,
+                embedding_max_entries,
+                content_hash(text),
+                "" if self.namespace == GLOBAL_NAMESPACE else self.namespace
+            ]
+        }
+
+    def _unindex(self, pipe, entries):
+        """Queue the removal of records trimmed by the size cap from the lexical index."""
+        for raw in entries:
+            try:
+                record = decode_record(raw)
+            except Exception:
+                continue
+            if record is not None:
+                self.lexical.remove(pipe, record["text"], record["username"])
+
+    async def save(self, text, embedding, username, channel=None):
+        """Append a record. Returns False if the text was already stored."""
+        seq, *trimmed = await get_script(SAVE_SCRIPT)(**self._save_args(text, embedding, username, channel))
+        if not seq:
+            return False
+        if self.lexical is not None:
+            async with get_redis(decode_responses=False).pipeline(transaction=False) as pipe:
+                self.lexical.add(pipe, text, username)
+                self._unindex(pipe, trimmed)
+                await pipe.execute()
+        # Keep the in-memory index current if nothing else was appended in between.
+        with self._lock:
+            if self.cursor >= 0 and seq == self.cursor + 1:
+                self.index.add(context_text(username, text), embedding, doc_id(text))
+                self.cursor = seq
+        schedule_training(self.index, self._lock)
+        return True
+
+    async def save_many(self, items):
+        """Append many records in one round trip. Returns the number actually added."""
+        save_script = get_script(SAVE_SCRIPT)
+        async with get_redis(decode_responses=False).pipeline(transaction=False) as pipe:
+            for item in items:
+                await save_script(
+                    **self._save_args(item["text"], item["embedding"], item["username"], item.get("channel")),
+                    client=pipe
+                )
+            results = await pipe.execute()
+            added = [item for item, (seq, *_) in zip(items, results) if seq]
+            if added and self.lexical is not None:
+                for item in added:
+                    self.lexical.add(pipe, item["text"], item["username"])
+                # After the adds: a record of this batch may already have been trimmed again.
+                for _, *trimmed in results:
+                    self._unindex(pipe, trimmed)
+                await pipe.execute()
+        # The index picks the new records up on the next sync.
+        return len(added)
+
+    async def sync(self):
+        """
+        Bring the in-memory index up to date with Redis. The list is append-only between
+        rewrites, so normally only the entries added since the last sync are fetched.
+        """
+        sync_script = get_script(SYNC_SCRIPT)
+        while True:
+            with self._lock:
+                if self.cursor < 0 and self.snapshot_path:
+                    self._load_snapshot()
+                cursor, generation = self.cursor, self.generation
+            seq, new_generation, full_reload, entries = await sync_script(
+                keys=[self.key, self.seq_key, self.generation_key],
+                args=[cursor, generation]
+            )
+            texts, embeddings, ids = _decode_entries(entries)
+            with self._lock:
+                if (self.cursor, self.generation) != (cursor, generation):
+                    continue  # Another task synced in the meantime; start again from its cursor.
+                if full_reload:
+                    self.index.clear()
+                self.index.extend(texts, embeddings, ids)
+                if embedding_max_entries:
+                    # SAVE_SCRIPT trims the oldest entries of the list; drop the same rows here.
+                    self.index.trim(embedding_max_entries)
+                self.cursor = seq
+                self.generation = new_generation.decode() if isinstance(new_generation, bytes) else str(new_generation)
+            if full_reload:
+                logger.info(f"Loaded {len(self.index)} embeddings into the similarity index for '{self.namespace}'.")
+            schedule_training(self.index, self._lock)
+            return
+
+    async def delete(self, text, batch_size=1000):
+        """Remove every record with this text and make all replicas reload."""
+        client = get_redis(decode_responses=False)
+        matches = []
+        length = await client.llen(self.key)
+        for start in range(0, length, batch_size):
+            for raw in await client.lrange(self.key, start, start + batch_size - 1):
+                try:
+                    record = decode_record(raw)
+                except Exception:
+                    continue
+                if record is not None and record["text"] == text:
+                    matches.append((raw, record["username"]))
+        if not matches:
+            return 0
+        async with client.pipeline(transaction=True) as pipe:
+            for raw, _ in matches:
+                pipe.lrem(self.key, 0, raw)
+            pipe.zrem(self.hashes_key, content_hash(text))
+            pipe.incr(self.generation_key)
+            if self.lexical is not None:
+                self.lexical.remove(pipe, text, matches[0][1])
+            removed = sum((await pipe.execute())[:len(matches)])
+        return removed
+
+    async def search(self, query_embedding, top_n=10, query_text=None):
+        await self.sync()
+        lexical_hits = None
+        if self.lexical is not None and query_text:
+            try:
+                lexical_hits = await self.lexical.search(get_redis(decode_responses=False), query_text, hybrid_candidates)
+            except Exception as e:
+                logger.error(f"Error querying the lexical index: {e}")
+        # Another task may reload or extend the index while this one searches it.
+        with self._lock:
+            if lexical_hits is None:
+                return self.index.search(query_embedding, top_n)
+            return self._hybrid_search(query_embedding, top_n, lexical_hits)
+
+    def _hybrid_search(self, query_embedding, top_n, lexical_hits):
+        # Rows of the lexical hits, still in BM25 order; ids not loaded yet are dropped.
+        rows = self.index.rows_for([member for member, _ in lexical_hits])
+        # Cosine similarity of every lexical hit.
+        similarities = dict(self.index.search(query_embedding, len(rows), rows=rows)) if len(rows) else {}
+        if len(rows) >= top_n:
+            vector_hits = sorted(similarities.items(), key=lambda item: item[1], reverse=True)
+        else:
+            # Too few messages share a word with the query; fall back to the whole namespace.
+            vector_hits = self.index.search(query_embedding, top_n)
+            similarities.update(vector_hits)
+        fused = reciprocal_rank_fusion(
+            [[text for text, _ in vector_hits], [self.index.texts[row] for row in rows]],
+            top_n
+        )
+        # Keep the fused order but report cosine similarities like the other search paths,
+        # so results stay comparable across namespaces and with similarity thresholds.
+        return [(text, similarities[text]) for text, _ in fused]
+
+class RedisVectorStore(VectorStore):
+    """
+    The default backend: one Redis list of binary records per namespace, accessed
+    through the shared asyncio pools in redis_async.
+    """
+
+    def __init__(self):
+        self._partitions = {}
+
+    def partition(self, namespace=GLOBAL_NAMESPACE):
+        namespace = namespace or GLOBAL_NAMESPACE
+        partition = self._partitions.get(namespace)
+        if partition is None:
+            partition = RedisPartition(namespace)
+            self._partitions[namespace] = partition
+        return partition
+
+    async def add(self, text, embedding, username, channel=None, namespace=GLOBAL_NAMESPACE):
+        return await self.partition(namespace).save(text, embedding, username, channel=channel)
+
+    async def bulk_add(self, items, namespace=GLOBAL_NAMESPACE):
+        items = list(items)
+        if not items:
+            return 0
+        return await self.partition(namespace).save_many(items)
+
+    async def search(self, query_embedding, top_n=10, namespace=GLOBAL_NAMESPACE, query_text=None):
+        return await self.partition(namespace).search(query_embedding, top_n, query_text=query_text)
+
+    async def delete(self, text, namespace=GLOBAL_NAMESPACE):
+        return await self.partition(namespace).delete(text)
+
+    async def count(self, namespace=GLOBAL_NAMESPACE):
+        return await get_redis(decode_responses=False).llen(namespace_key(namespace))
+
+    async def snapshot(self):
+        """Write a snapshot of every loaded namespace that changed since its last snapshot."""
+        written = 0
+        for partition in list(self._partitions.values()):
+            await partition.sync()
+            if partition.snapshot_cursor == (partition.cursor, partition.generation):
+                continue
+            state = partition.snapshot_state()
+            # The file is written in a worker thread so the event loop is never blocked.
+            if await asyncio.to_thread(partition.write_snapshot, state):
+                written += 1
+        return written
+
+# ----------------- IN-MEMORY -----------------
+class MemoryVectorStore(VectorStore):
+    """Process-local NumPy store. Nothing is persisted; useful for tests, benchmarks and demos."""
+
+    def __init__(self):
+        self._records = {}   # namespace -> list of (text, username, embedding)
+        self._hashes = {}    # namespace -> set of content hashes
+        self._indexes = {}   # namespace -> similarity index
+
+    def _index(self, namespace):
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = new_index(namespace)
+            self._indexes[namespace] = index
+            self._records[namespace] = []
+            self._hashes[namespace] = set()
+        return index
+
+    async def add(self, text, embedding, username, channel=None, namespace=GLOBAL_NAMESPACE):
+        namespace = namespace or GLOBAL_NAMESPACE
+        index = self._index(namespace)
+        text_hash = content_hash(text)
+        if text_hash in self._hashes[namespace]:
+            return False
+        self._hashes[namespace].add(text_hash)
+        self._records[namespace].append((text, username, embedding))
+        index.add(context_text(username, text), embedding)
+        self._enforce_cap(namespace)
+        schedule_training(index)
+        return True
+
+    async def bulk_add(self, items, namespace=GLOBAL_NAMESPACE):
+        namespace = namespace or GLOBAL_NAMESPACE
+        index = self._index(namespace)
+        texts = []
+        embeddings = []
+        for item in items:
+            text_hash = content_hash(item["text"])
+            if text_hash in self._hashes[namespace]:
+                continue
+            self._hashes[namespace].add(text_hash)
+            self._records[namespace].append((item["text"], item["username"], item["embedding"]))
+            texts.append(context_text(item["username"], item["text"]))
+            embeddings.append(item["embedding"])
+        index.extend(texts, embeddings)
+        self._enforce_cap(namespace)
+        schedule_training(index)
+        return len(texts)
+
+    def _enforce_cap(self, namespace):
+        """Drop the oldest records beyond EMBEDDING_MAX_ENTRIES."""
+        records = self._records[namespace]
+        excess = len(records) - embedding_max_entries if embedding_max_entries else 0
+        if excess > 0:
+            for text, _, _ in records[:excess]:
+                self._hashes[namespace].discard(content_hash(text))
+            del records[:excess]
+            self._indexes[namespace].trim(embedding_max_entries)
+
+    def _rebuild(self, namespace, records):
+        index = self._index(namespace)
+        index.clear()
+        index.extend([context_text(u, t) for t, u, _ in records], [e for _, _, e in records])
+        self._records[namespace] = list(records)
+        self._hashes[namespace] = {content_hash(t) for t, _, _ in records}
+
+    async def search(self, query_embedding, top_n=10, namespace=GLOBAL_NAMESPACE, query_text=None):
+        return self._index(namespace or GLOBAL_NAMESPACE).search(query_embedding, top_n)
+
+    async def delete(self, text, namespace=GLOBAL_NAMESPACE):
+        namespace = namespace or GLOBAL_NAMESPACE
+        self._index(namespace)
+        records = self._records[namespace]
+        kept = [record for record in records if record[0] != text]
+        if len(kept) != len(records):
+            self._rebuild(namespace, kept)
+            schedule_training(self._indexes[namespace])
+        return len(records) - len(kept)
+
+    async def count(self, namespace=GLOBAL_NAMESPACE):
+        self._index(namespace or GLOBAL_NAMESPACE)
+        return len(self._records[namespace or GLOBAL_NAMESPACE])
+
+# ----------------- SQLITE -----------------
+class SQLiteVectorStore(VectorStore):
+    """
+    Single-node store in a local SQLite file. Several processes can share the file:
+    each keeps an in-memory index per namespace and only reads rows with a higher id
+    than it has seen, reloading when another process deletes rows.
+    """
+
+    def __init__(self, path=vector_store_path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                username TEXT,
+                channel TEXT,
+                text TEXT NOT NULL,
+                created_at REAL,
+                record BLOB NOT NULL,
+                UNIQUE (namespace, hash)
+            );
+            CREATE TABLE IF NOT EXISTS generations (
+                namespace TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+        """)
+        self._lock = threading.Lock()
+        self._indexes = {}  # namespace -> [index, last id, generation]
+
+    def _generation(self, namespace):
+        row = self._conn.execute("SELECT generation FROM generations WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def _sync(self, namespace):
+        state = self._indexes.get(namespace)
+        if state is None:
+            state = [new_index(namespace), 0, -1]
+            self._indexes[namespace] = state
+        index, last_id, generation = state
+        current_generation = self._generation(namespace)
+        if current_generation != generation:
+            index.clear()
+            last_id = 0
+        rows = self._conn.execute(
+            "SELECT id, record FROM embeddings WHERE namespace = ? AND id > ? ORDER BY id",
+            (namespace, last_id)
+        ).fetchall()
+        if rows:
+            texts, embeddings, _ = _decode_entries([row[1] for row in rows])
+            index.extend(texts, embeddings)
+            last_id = rows[-1][0]
+        if embedding_max_entries:
+            # Ids only grow and commits are serialized, so the rows _insert() trimmed are
+            # the oldest ones held here as well; drop them without a reload.
+            index.trim(embedding_max_entries)
+        state[1] = last_id
+        state[2] = current_generation
+        return index
+
+    def _bump_generation(self, namespace):
+        self._conn.execute(
+            "INSERT INTO generations (namespace, generation) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1",
+            (namespace,)
+        )
+
+    def _insert(self, namespace, items):
+        added = 0
+        for item in items:
+            created_at = time.time()
+            record = encode_record(item["text"], item["embedding"], item["username"], dtype=embedding_dtype,
+                                   created_at=created_at, channel=item.get("channel"))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings (namespace, hash, username, channel, text, created_at, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, content_hash(item["text"]), item["username"], str(item.get("channel") or ""),
+                 item["text"], created_at, record)
+            )
+            added += cursor.rowcount
+        if added and embedding_max_entries:
+            # No generation bump: readers trim the same oldest rows from their indexes.
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE namespace = ? AND id NOT IN "
+                "(SELECT id FROM embeddings WHERE namespace = ? ORDER BY id DESC LIMIT ?)",
+                (namespace, namespace, embedding_max_entries)
+            )
+        return added
+
+    async def add(self, text, embedding, username, channel=None, namespace=GLOBAL_NAMESPACE):
+        item = {"text": text, "embedding": embedding, "username": username, "channel": channel}
+        return await self.bulk_add([item], namespace=namespace) == 1
+
+    # SQLite calls block, so every method runs its database work in a worker thread
+    # (under the thread lock) and keeps the event loop free.
+
+    def _bulk_add(self, namespace, items):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                added = self._insert(namespace, items)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    async def bulk_add(self, items, namespace=GLOBAL_NAMESPACE):
+        return await asyncio.to_thread(self._bulk_add, namespace or GLOBAL_NAMESPACE, items)
+
+    def _search(self, namespace, query_embedding, top_n):
+        with self._lock:
+            index = self._sync(namespace)
+            return index, index.search(query_embedding, top_n)
+
+    async def search(self, query_embedding, top_n=10, namespace=GLOBAL_NAMESPACE, query_text=None):
+        index, results = await asyncio.to_thread(self._search, namespace or GLOBAL_NAMESPACE, query_embedding, top_n)
+        schedule_training(index, self._lock)
+        return results
+
+    def _delete(self, namespace, text):
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM embeddings WHERE namespace = ? AND hash = ?",
+                (namespace, content_hash(text))
+            ).rowcount
+            if removed:
+                self._bump_generation(namespace)
+        return removed
+
+    async def delete(self, text, namespace=GLOBAL_NAMESPACE):
+        return await asyncio.to_thread(self._delete, namespace or GLOBAL_NAMESPACE, text)
+
+    def _count(self, namespace):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    async def count(self, namespace=GLOBAL_NAMESPACE):
+        return await asyncio.to_thread(self._count, namespace or GLOBAL_NAMESPACE)
+
+def create_vector_store(backend=vector_store_backend):
+    """Build the storage backend selected by VECTOR_STORE."""
+    if backend == "redis":
+        return RedisVectorStore()
+    if backend == "memory":
+        return MemoryVectorStore()
+    if backend == "sqlite":
+        return SQLiteVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
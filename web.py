@@ -2,15 +2,12 @@ import os
 import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-import ollama  # Ensure you have the correct version of the ollama library installed
+from llm_gateway import gateway
 
 # Load environment variables
 load_dotenv()
 
-# Read the Ollama configuration from the environment.
-ollama_host = os.getenv("OLLAMA_HOST", "127.0.0.1").strip()
-ollama_port = os.getenv("OLLAMA_PORT", "11434").strip()
-ollama_url = f"http://{ollama_host}:{ollama_port}"  # Custom endpoint for Ollama
+# Read the Ollama configuration from the environment (the host is configured in llm_gateway).
 ollama_model = os.getenv("OLLAMA_MODEL", "llama3.2").strip()  # e.g., "mistral-small:24b"
 context_length = int(os.getenv("CONTEXT_LENGTH", 10000))
 
@@ -51,10 +48,8 @@ def fetch_web_summary(webpage_url, model=ollama_model):
     prompt = f"Please summarize the following article. Give it a title and use bullet points when necessary:\n\n{article_text}"
 
     try:
-        # Create an Ollama client using the custom host.
-        client = ollama.Client(host=ollama_url)
-        # Call chat() with the model specified.
-        response = client.chat(
+        # Call chat() through the shared gateway with the model specified.
+        response = gateway.chat_sync(
             model=model,
             messages=[{"role": "user", "content": prompt}],
             stream=False,
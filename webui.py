@@ -5,8 +5,8 @@ import time
 import json
 import re
 import asyncio
+import threading
 import dotenv
-import ollama
 import feedparser
 from discord_control import connect_discord, disconnect_discord
 import YouTube
@@ -19,25 +19,53 @@ import requests
 from PIL import Image
 from io import BytesIO
 from search import search_web, format_search_results  # Import search functions
-from embed import generate_embedding, save_embedding, find_relevant_context  # Import embedding functions
+from redis_async import get_redis, lrange_json
+from message_pool import waiting_message, unavailable_message
+from prompts import build_messages, log_prompt_stats
+from prepare import prepare_request
+from tools import get_tool
+from llm_scheduler import set_priority, scheduler
+from llm_gateway import gateway, embedding_gateway, host_pool, LLMUnavailable
+from embed import generate_embedding, save_embedding, memory_namespace  # Import embedding functions
 
 dotenv.load_dotenv()
 
 # Load context length from .env
 context_length = int(os.getenv("CONTEXT_LENGTH", 10000))
 
-# Redis configuration for the web UI (using a separate DB)
+# Synchronous Redis client for the Streamlit script itself; coroutines use redis_async.
 redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
 redis_port = int(os.getenv('REDIS_PORT', 6379))
 redis_client = redis.Redis(host=redis_host, port=redis_port, db=0, decode_responses=True)
 
-# Setup Ollama client for web UI
-ollama_host = os.getenv('OLLAMA_HOST', '127.0.0.1')
-ollama_port = int(os.getenv('OLLAMA_PORT', 11434))
+# Ollama is reached through the shared gateway (pooled connections, retries, scheduling).
 ollama_model = os.getenv('OLLAMA_MODEL', 'llama3.2').strip()
-ollama_client = ollama.AsyncClient(host=f'http://{ollama_host}:{ollama_port}')
+ollama_client = gateway
+# LLM requests made from this script thread (and its worker threads) queue as web UI traffic.
+set_priority("webui")
+
+@st.cache_resource
+def background_loop():
+    """
+    The event loop every web UI coroutine runs on, shared by all sessions and reruns.
+    Redis and Ollama clients are cached per loop, so one long-lived loop keeps a single
+    set of connection pools instead of leaking a new set with every rerun.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="webui-loop", daemon=True).start()
+    return loop
+
+async def _as_webui(coro):
+    set_priority("webui")
+    return await coro
+
+def run_async(coro):
+    """Run a coroutine on the web UI loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(_as_webui(coro), background_loop()).result()
 
 CHAT_HISTORY_KEY = "webui:chat_history"
+# Memory partition used for web UI conversations (see EMBEDDING_SCOPE).
+MEMORY_NAMESPACE = memory_namespace(webui=True)
 
 st.set_page_config(
     page_title="Tater Chat",
@@ -72,18 +100,12 @@ def load_image_from_url(url):
 assistant_avatar = load_image_from_url("https://raw.githubusercontent.com/MasterPhooey/Tater-Discord-WebUI/refs/heads/main/images/tater.png")
 
 # ----------------- WAITING MESSAGE FUNCTION -----------------
-async def send_waiting_message(prompt_text):
-    """Generate a waiting message from Ollama and output it immediately using the assistant avatar."""
-    waiting_response = await ollama_client.chat(
-        model=ollama_model,
-        messages=[{"role": "system", "content": prompt_text}],
-        stream=False,
-        keep_alive=-1,
-        options={"num_ctx": context_length}
-    )
-    waiting_text = waiting_response['message'].get('content', '').strip()
-    if not waiting_text:
-        waiting_text = prompt_text
+def send_waiting_message(tool, username):
+    """
+    Output a waiting message from the pre-generated pool immediately using the assistant avatar.
+    Streamlit only renders from the script thread, so this runs there, before the tool call.
+    """
+    waiting_text = run_async(waiting_message(tool, username))
     st.chat_message("assistant", avatar=assistant_avatar).write(waiting_text)
 
 # ----------------- SETTINGS HELPER FUNCTIONS -----------------
@@ -136,116 +158,46 @@ def load_avatar_image(avatar_b64):
     except Exception as e:
         return None
 
-# ----------------- SYSTEM PROMPT -----------------
-SYSTEM_PROMPT = (
-    "You are Tater Totterson, a helpful AI assistant with access to various tools.\n\n"
-    "If you need real-time access to the internet or lack sufficient information, use the 'web_search' tool. \n\n"
-    "Use the tools to help users with various tasks. You have access to the following tools:\n\n"
-    "1. 'youtube_summary' for summarizing YouTube videos.\n\n"
-    "2. 'web_summary' for summarizing webpage text.\n\n"
-    "3. 'draw_picture' for generating images.\n\n"
-    "4. 'premiumize_download' for retrieving download links from Premiumize.me.\n\n"
-    "5. 'premiumize_torrent' for retrieving torrent download links from Premiumize.me.\n\n"
-    "6. 'watch_feed' for adding an RSS feed to the watch list, add a rss link to the watch list when aa user asks.\n\n"
-    "7. 'unwatch_feed' for removing an RSS feed to from the watch list, remove a rss link from the watch list when aa user asks.\n\n"
-    "8. 'list_feeds' for listing RSS feeds that are currently on the watch list.\n\n"
-    "9. 'web_search' for searching the web when additional or up-to-date information is needed to answer a user's question.\n\n"
-    "When a user requests one of these actions, reply ONLY with a JSON object in one of the following formats (and nothing else):\n\n"
-    "For YouTube videos:\n"
-    "{\n"
-    '  "function": "youtube_summary",\n'
-    '  "arguments": {"video_url": "<YouTube URL>"}\n'
-    "}\n\n"
-    "For webpages:\n"
-    "{\n"
-    '  "function": "web_summary",\n'
-    '  "arguments": {"url": "<Webpage URL>"}\n'
-    "}\n\n"
-    "For drawing images:\n"
-    "{\n"
-    '  "function": "draw_picture",\n'
-    '  "arguments": {"prompt": "<Text prompt for the image>"}\n'
-    "}\n\n"
-    "For Premiumize URL download check:\n"
-    "{\n"
-    '  "function": "premiumize_download",\n'
-    '  "arguments": {"url": "<URL to check>"}\n'
-    "}\n\n"
-    "For Premiumize torrent check:\n"
-    "{\n"
-    '  "function": "premiumize_torrent",\n'
-    '  "arguments": {}\n'
-    "}\n\n"
-    "For adding an RSS feed:\n"
-    "{\n"
-    '  "function": "watch_feed",\n'
-    '  "arguments": {"feed_url": "<RSS feed URL>"}\n'
-    "}\n\n"
-    "For removing an RSS feed:\n"
-    "{\n"
-    '  "function": "unwatch_feed",\n'
-    '  "arguments": {"feed_url": "<RSS feed URL>"}\n'
-    "}\n\n"
-    "For listing RSS feeds:\n"
-    "{\n"
-    '  "function": "list_feeds",\n'
-    '  "arguments": {}\n'
-    "}\n\n"
-    "{\n"
-    '  "function": "web_search",\n'
-    '  "arguments": {"query": "<search query>"}\n'
-    "}\n\n"
-    "If no function is needed, reply normally."
-)
-
 # ----------------- PROCESSING FUNCTIONS -----------------
+async def load_recent_history(limit=20):
+    history = await lrange_json(CHAT_HISTORY_KEY, -limit, -1)
+    return [{"role": msg["role"], "content": msg["content"]} for msg in history]
+
 async def process_message(user_name, message_content):
-    # Generate embedding for the user's message if long enough.
-    embedding = None
-    relevant_context = []
-    if len(message_content.strip()) >= 30:
-        embedding = await generate_embedding(message_content)
-        if embedding:
-            await save_embedding(message_content, embedding, user_name)
-            relevant_context = await find_relevant_context(embedding, top_n=10)
-    
-    final_system_prompt = SYSTEM_PROMPT
-    if relevant_context:
-        context_prompt = "Here is some relevant information retrieved from previously stored knowledge:\n"
-        for text in relevant_context:
-            context_prompt += f"- {text}\n"
-        final_system_prompt += "\n\n" + context_prompt
-
-    history = load_chat_history()[-20:]
-    messages_list = [{"role": "system", "content": final_system_prompt}]
-    for msg in history:
-        messages_list.append({"role": msg["role"], "content": msg["content"]})
-    messages_list.append({"role": "user", "content": message_content})
-    response = await ollama_client.chat(
-        model=ollama_model,
-        messages=messages_list,
-        stream=False,
-        keep_alive=-1,
-        options={"num_ctx": context_length}
+    # Embed, store and retrieve context for the message while the history loads.
+    embedding, relevant_context, history = await prepare_request(
+        message_content, user_name, "webui", MEMORY_NAMESPACE, load_recent_history(), label="webui"
     )
+    messages_list = build_messages(history, message_content, relevant_context, context_length=context_length)
+    try:
+        response = await ollama_client.chat(
+            model=ollama_model,
+            messages=messages_list,
+            stream=False,
+            keep_alive=-1,
+            options={"num_ctx": context_length}
+        )
+    except LLMUnavailable:
+        return unavailable_message(None)
+    log_prompt_stats(response, "webui")
     response_text = response['message'].get('content', '').strip()
     
     if len(response_text.strip()) >= 30:
         bot_embedding = await generate_embedding(response_text)
         if bot_embedding:
-            await save_embedding(response_text, bot_embedding, "assistant")
+            await save_embedding(response_text, bot_embedding, "assistant", channel="webui", namespace=MEMORY_NAMESPACE)
     
     return response_text
 
 async def process_function_call(response_json, user_question=""):
+    """
+    Run a tool call on the web UI loop. Returns the reply text, or the image bytes for
+    draw_picture; the caller renders them (and the waiting message) on the script thread.
+    """
     func = response_json.get("function")
     args = response_json.get("arguments", {})
-    # Retrieve the username from chat settings.
-    chat_settings = get_chat_settings()
-    username = chat_settings["username"]
-    
+
     if func == "youtube_summary":
-        await send_waiting_message(f"Generate a brief message to {username} telling them to wait a moment while you summarize the YouTube video. Only generate the message. Do not respond to this message.")
         video_url = args.get("video_url")
         target_lang = args.get("target_lang", "en")
         if video_url:
@@ -260,7 +212,7 @@ async def process_function_call(response_json, user_question=""):
                     if len(final_response.strip()) >= 30:
                         response_embedding = await generate_embedding(final_response)
                         if response_embedding:
-                            await save_embedding(final_response, response_embedding, "assistant")
+                            await save_embedding(final_response, response_embedding, "assistant", channel="webui", namespace=MEMORY_NAMESPACE)
                     return final_response
                 else:
                     return "Failed to retrieve summary from YouTube."
@@ -269,7 +221,6 @@ async def process_function_call(response_json, user_question=""):
         else:
             return "No YouTube URL provided."
     elif func == "web_summary":
-        await send_waiting_message(f"Generate a brief message to {username} telling them to wait a moment while you read this boring article for them, and that you will provide a summary shortly. Only generate the message. Do not respond to this message.")
         webpage_url = args.get("url")
         if webpage_url:
             summary = await asyncio.to_thread(web.fetch_web_summary, webpage_url)
@@ -281,23 +232,19 @@ async def process_function_call(response_json, user_question=""):
                 if len(final_response.strip()) >= 30:
                     response_embedding = await generate_embedding(final_response)
                     if response_embedding:
-                        await save_embedding(final_response, response_embedding, "assistant")
+                        await save_embedding(final_response, response_embedding, "assistant", channel="webui", namespace=MEMORY_NAMESPACE)
                 return final_response
             else:
                 return "Failed to retrieve summary from the webpage."
         else:
             return "No webpage URL provided."
     elif func == "draw_picture":
-        await send_waiting_message(f"Generate a brief message to {username} telling them to wait a moment while you draw them a masterpiece. Only generate the message. Do not respond to this message.")
         prompt_text = args.get("prompt")
         if prompt_text:
-            image_bytes = await asyncio.to_thread(image.generate_image, prompt_text)
-            st.image(image_bytes, caption="Generated Image")
-            return "Image generated."
+            return await asyncio.to_thread(image.generate_image, prompt_text)
         else:
             return "No prompt provided for drawing a picture."
     elif func == "premiumize_download":
-        await send_waiting_message(f"Generate a brief message to {username} telling them to wait a moment while you check if the linked file is cached. Only generate the message. Do not respond to this message.")
         url = args.get("url")
         if url:
             result = await premiumize.process_download_web(url)
@@ -306,9 +253,6 @@ async def process_function_call(response_json, user_question=""):
             return "No URL provided for Premiumize download check."
 
     elif func == "watch_feed":
-        await send_waiting_message(
-            f"Generate a brief message to {username} telling them to wait a moment while you add the RSS feed to the watch list. Only generate the message. Do not respond to this message."
-        )
         feed_url = args.get("feed_url")
         if feed_url:
             # Attempt to parse the feed to get the last published timestamp
@@ -325,18 +269,15 @@ async def process_function_call(response_json, user_question=""):
             else:
                 last_ts = time.time()
             # Store the feed in Redis under "rss:feeds"
-            redis_client.hset("rss:feeds", feed_url, last_ts)
+            await get_redis().hset("rss:feeds", feed_url, last_ts)
             return f"Now watching feed: {feed_url}"
         else:
             return "No feed URL provided for watching."
 
     elif func == "unwatch_feed":
-        await send_waiting_message(
-            f"Generate a brief message to {username} telling them to wait a moment while you remove the RSS feed. Only generate the message. Do not respond to this message."
-        )
         feed_url = args.get("feed_url")
         if feed_url:
-            removed = redis_client.hdel("rss:feeds", feed_url)
+            removed = await get_redis().hdel("rss:feeds", feed_url)
             if removed:
                 return f"Stopped watching feed: {feed_url}"
             else:
@@ -345,10 +286,7 @@ async def process_function_call(response_json, user_question=""):
             return "No feed URL provided for unwatching."
 
     elif func == "list_feeds":
-        await send_waiting_message(
-            f"Generate a brief message to {username} telling them to wait a moment while you list all currently watched feeds. Only generate the message. Do not respond to this message."
-        )
-        feeds = redis_client.hgetall("rss:feeds")
+        feeds = await get_redis().hgetall("rss:feeds")
         if feeds:
             feed_list = "\n".join(f"{feed} (last update: {feeds[feed]})" for feed in feeds)
             return f"Currently watched feeds:\n{feed_list}"
@@ -356,7 +294,6 @@ async def process_function_call(response_json, user_question=""):
             return "No RSS feeds are currently being watched."
 
     elif func == "web_search":
-        await send_waiting_message(f"Generate a brief message to {username} telling them to wait a moment while you search the internet for more information. Only generate the message. Do not respond to this message.")
         query = args.get("query")
         if query:
             results = search_web(query)
@@ -378,13 +315,16 @@ async def process_function_call(response_json, user_question=""):
                     "  }\n"
                     "}"
                 )
-                choice_response = await ollama_client.chat(
-                    model=ollama_model,
-                    messages=[{"role": "system", "content": choice_prompt}],
-                    stream=False,
-                    keep_alive=-1,
-                    options={"num_ctx": context_length}
-                )
+                try:
+                    choice_response = await ollama_client.chat(
+                        model=ollama_model,
+                        messages=[{"role": "system", "content": choice_prompt}],
+                        stream=False,
+                        keep_alive=-1,
+                        options={"num_ctx": context_length}
+                    )
+                except LLMUnavailable:
+                    return unavailable_message(None)
                 choice_text = choice_response['message'].get('content', '').strip()
                 try:
                     choice_json = json.loads(choice_text)
@@ -413,13 +353,16 @@ async def process_function_call(response_json, user_question=""):
                                 f"Detailed Information:\n{summary}\n\n"
                                 "Answer:"
                             )
-                            final_response = await ollama_client.chat(
-                                model=ollama_model,
-                                messages=[{"role": "system", "content": info_prompt}],
-                                stream=False,
-                                keep_alive=-1,
-                                options={"num_ctx": context_length}
-                            )
+                            try:
+                                final_response = await ollama_client.chat(
+                                    model=ollama_model,
+                                    messages=[{"role": "system", "content": info_prompt}],
+                                    stream=False,
+                                    keep_alive=-1,
+                                    options={"num_ctx": context_length}
+                                )
+                            except LLMUnavailable:
+                                return unavailable_message(None)
                             final_answer = final_response['message'].get('content', '').strip()
                             if not final_answer:
                                 final_answer = "Failed to generate a final answer from the detailed info."
@@ -530,6 +473,66 @@ with st.sidebar.expander("Chat Settings", expanded=False):
         clear_chat_history()
         st.success("Chat history cleared.")
 
+# LLM Queue Expander
+breakers = {name: llm.breaker.stats() for name, llm in (("chat", gateway), ("embeddings", embedding_gateway))}
+for name, breaker in breakers.items():
+    if breaker["state"] != "closed":
+        st.sidebar.warning(f"Ollama {name} circuit breaker is {breaker['state'].replace('_', '-')}: {breaker['reason']}")
+with st.sidebar.expander("LLM Queue", expanded=False):
+    st.table([
+        {
+            "breaker": name,
+            "state": breaker["state"],
+            "open for s": round(breaker["open_for_s"]),
+            "trips": breaker["trips"],
+            "rejected": breaker["rejected"],
+            "recent failures": f"{breaker['recent_failures']}/{breaker['recent_calls']}"
+        }
+        for name, breaker in breakers.items()
+    ])
+    queue_stats = scheduler.stats()
+    if not queue_stats:
+        st.caption("No Ollama requests yet.")
+    for (host, pool), host_stats in queue_stats.items():
+        st.markdown(f"**{host}** ({pool}): {host_stats['running']}/{host_stats['limit']} running")
+        st.table([
+            {
+                "priority": name,
+                "queued": host_stats["queued"][name],
+                "served": host_stats["granted"][name],
+                "avg wait ms": round(host_stats["avg_wait_ms"][name]),
+                "max wait ms": round(host_stats["max_wait_ms"][name])
+            }
+            for name in host_stats["queued"]
+        ])
+    host_stats = host_pool.stats()
+    if len(host_stats) > 1:
+        st.markdown("**Hosts**")
+        st.table([
+            {
+                "host": url,
+                "status": "up" if state["healthy"] else f"down: {state['last_error']}",
+                "outstanding": state["outstanding"],
+                "loaded models": ", ".join(state["loaded"]) or "-"
+            }
+            for url, state in host_stats.items()
+        ])
+    call_stats = {**gateway.stats(), **embedding_gateway.stats()}
+    if call_stats:
+        st.markdown("**Calls**")
+        st.table([
+            {
+                "call": name,
+                "calls": totals["calls"],
+                "errors": totals["errors"],
+                "retries": totals["retries"],
+                "avg ms": round(totals["avg_latency_ms"]),
+                "prompt tokens": totals["prompt_tokens"],
+                "generated tokens": totals["eval_tokens"]
+            }
+            for name, totals in call_stats.items()
+        ])
+
 # Initialize dynamic key for file attachments if not already set.
 if "uploader_key" not in st.session_state:
     st.session_state["uploader_key"] = f"sidebar_uploader_{int(time.time())}"
@@ -567,21 +570,11 @@ if torrent_file:
     st.chat_message("user", avatar=user_avatar if user_avatar else "🦖").write(f"[Torrent attachment: {torrent_file.name}]")
     save_message("user", chat_settings["username"], f"[Torrent attachment: {torrent_file.name}]")
     
-    # Create a new event loop and set it as the current loop.
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # Run the waiting message coroutine using the loop.
-    loop.run_until_complete(
-        send_waiting_message(
-            f"Generate a brief message to {chat_settings['username']} telling them to wait a moment while you check if the torrent file is cached. Only generate the message. Do not respond to this message."
-        )
-    )
+    # Run the waiting message coroutine on the web UI loop.
+    send_waiting_message("premiumize_torrent", chat_settings["username"])
     
     # Process the torrent file.
-    torrent_result = loop.run_until_complete(
-        premiumize.process_torrent_web(torrent_file.read(), torrent_file.name)
-    )
+    torrent_result = run_async(premiumize.process_torrent_web(torrent_file.read(), torrent_file.name))
     
     # Remove the uploader key from session state so that the uploader resets on next run.
     if "uploader_key" in st.session_state:
@@ -605,9 +598,7 @@ elif user_input:
                     st.chat_message("user", avatar=user_avatar if user_avatar else "🦖").write(f"Attachment: {uploaded_file.name}")
                     save_message("user", current_settings["username"], f"[File attachment: {uploaded_file.name}]")
     
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    response_text = loop.run_until_complete(process_message(current_settings["username"], user_input))
+    response_text = run_async(process_message(current_settings["username"], user_input))
     
     response_json = None
     try:
@@ -621,8 +612,13 @@ elif user_input:
                 response_json = None
 
     if response_json and isinstance(response_json, dict) and "function" in response_json:
-        func_response = loop.run_until_complete(process_function_call(response_json, user_question=user_input))
-        if func_response:
+        if get_tool(response_json["function"]) is not None:
+            send_waiting_message(response_json["function"], chat_settings["username"])
+        func_response = run_async(process_function_call(response_json, user_question=user_input))
+        if isinstance(func_response, bytes):
+            st.image(func_response, caption="Generated Image")
+            response_text = "Image generated."
+        elif func_response:
             response_text = func_response
 
     save_message("assistant", "assistant", response_text)
@@ -644,9 +640,7 @@ elif user_input:
                     st.chat_message("user", avatar=user_avatar if user_avatar else "🦖").write(f"Attachment: {uploaded_file.name}")
                     save_message("user", current_settings["username"], f"[File attachment: {uploaded_file.name}]")
     
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    response_text = loop.run_until_complete(process_message(current_settings["username"], user_input))
+    response_text = run_async(process_message(current_settings["username"], user_input))
     
     response_json = None
     try:
@@ -660,8 +654,13 @@ elif user_input:
                 response_json = None
 
     if response_json and isinstance(response_json, dict) and "function" in response_json:
-        func_response = loop.run_until_complete(process_function_call(response_json, user_question=user_input))
-        if func_response:
+        if get_tool(response_json["function"]) is not None:
+            send_waiting_message(response_json["function"], chat_settings["username"])
+        func_response = run_async(process_function_call(response_json, user_question=user_input))
+        if isinstance(func_response, bytes):
+            st.image(func_response, caption="Generated Image")
+            response_text = "Image generated."
+        elif func_response:
             response_text = func_response
 
     save_message("assistant", "assistant", response_text)